@@ -4,3 +4,9 @@ import pygame
 pygame.init()
 register(id='pegushi-v1', entry_point='pegushi_gym.envs:FixedMazeEnvironment')
 
+register(id='pegushi-corridor-v1',
+         entry_point='pegushi_gym.envs:CorridorMazeEnvironment')
+register(id='pegushi-infinite-v1',
+         entry_point='pegushi_gym.envs:InfiniteMazeEnvironment')
+register(id='pegushi-dynamic-v1',
+         entry_point='pegushi_gym.envs:DynamicMazeEnvironment')
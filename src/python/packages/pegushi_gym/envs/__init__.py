@@ -1 +1,4 @@
 from pegushi_gym.envs.maze import FixedMazeEnvironment
+from pegushi_gym.envs.junctions import CorridorMazeEnvironment
+from pegushi_gym.envs.infinite import InfiniteMazeEnvironment
+from pegushi_gym.envs.dynamic import DynamicMazeEnvironment
@@ -0,0 +1,206 @@
+"""Episodes recorded as the actions taken.
+
+Given its layout and the state of its random number generator, a maze
+environment is deterministic, so an episode can be stored as the actions
+taken instead of the states visited.  ActionLogWriter saves each episode as
+the environment's seed, a reference to its layout (the file shared by
+FixedMazeEnvironment.share_layout(), if any, and a checksum), the actions as
+int8 and a keyframe every keyframe_interval steps.  A keyframe holds what
+the environment's save_state() returns, so it works for FixedMazeEnvironment
+and for GenericGridEnvironment alike.  The states of the environment's rng
+at the keyframes are only saved if stepping drew from it during the episode;
+stepping a FixedMazeEnvironment never does, so its episodes carry no rng
+state at all.  ActionLog
+reconstructs any step of an episode by restoring the nearest keyframe at or
+before it and replaying at most keyframe_interval - 1 actions."""
+
+from pegushi_gym.envs.maze import layout_checksum
+
+import array
+import cPickle
+import numpy as np
+import os
+
+class ActionLogWriter:
+    def __init__(self, directory, keyframe_interval = 256):
+        """Create a new ActionLogWriter.
+Arguments are:
+    directory          str; Directory the episodes are written to, one
+                       file per episode.  It is created if it does not
+                       exist.  Episodes already in it are kept and new ones
+                       are numbered after them.
+
+    keyframe_interval  int; Number of steps between keyframes
+"""
+        if keyframe_interval < 1:
+            raise ValueError('keyframe_interval must be > 0')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.num_episodes = len(_episode_files(directory))
+
+        self._env = None
+        self._header = None
+        self._actions = None
+        self._keyframe_steps = None
+        self._keyframes = None
+        self._rng_states = None
+
+    @property
+    def recording(self):
+        return self._actions is not None
+
+    def begin_episode(self, env):
+        """Start recording an episode of env, which must already be reset.
+Call record() after each step and end_episode() at the end."""
+        if self.recording:
+            raise RuntimeError('An episode is already being recorded')
+        if env is not self._env:
+            # Checksumming a large layout takes a while, so it is only done
+            # when the environment changes
+            layout = getattr(env, '_layout', None)
+            self._header = {
+                'seed' : getattr(env, 'seed', None),
+                'layout_path' : getattr(env, '_layout_path', None),
+                'layout_checksum' : None if layout is None
+                                        else layout_checksum(layout) }
+            self._env = env
+        self._actions = array.array('b')
+        self._keyframe_steps = [ ]
+        self._keyframes = [ ]
+        self._rng_states = [ ]
+        self._add_keyframe()
+
+    def record(self, action):
+        """Record that env.step(action) was just called"""
+        self._actions.append(action)
+        if len(self._actions) % self.keyframe_interval == 0:
+            self._add_keyframe()
+
+    def end_episode(self):
+        """Write the episode.  Returns its number."""
+        offsets = np.cumsum([ 0 ] + [ len(k) for k in self._keyframes ])
+
+        # The rng states are only needed if they changed
+        first = self._rng_states[0]
+        if (first is None) or all(_same_rng_state(first, state)
+                                  for state in self._rng_states[1:]):
+            rng_states = None
+        else:
+            rng_states = self._rng_states
+        path = os.path.join(self.directory,
+                            'episode-%06d.npz' % self.num_episodes)
+        np.savez_compressed(
+            path, header = _to_bytes(cPickle.dumps(self._header,
+                                                   cPickle.HIGHEST_PROTOCOL)),
+            actions = np.frombuffer(self._actions, dtype = np.int8),
+            keyframe_steps = np.asarray(self._keyframe_steps,
+                                        dtype = np.int32),
+            keyframe_offsets = offsets.astype(np.int64),
+            keyframe_data = _to_bytes(''.join(self._keyframes)),
+            rng_states = _to_bytes(cPickle.dumps(rng_states,
+                                                 cPickle.HIGHEST_PROTOCOL)))
+        self._actions = None
+        self._keyframes = None
+        self._rng_states = None
+        self.num_episodes += 1
+        return self.num_episodes - 1
+
+    def _add_keyframe(self):
+        rng = getattr(self._env, 'rng', None)
+        self._keyframe_steps.append(len(self._actions))
+        self._keyframes.append(cPickle.dumps(self._env.save_state(),
+                                             cPickle.HIGHEST_PROTOCOL))
+        self._rng_states.append(None if rng is None else rng.get_state())
+
+class ActionLog:
+    def __init__(self, directory):
+        """Open the episodes written by an ActionLogWriter to directory"""
+        self.directory = directory
+        self.refresh()
+
+        # The most recently loaded episode and its arrays
+        self._loaded = (None, None)
+
+    def refresh(self):
+        """Pick up episodes written since the log was opened"""
+        self._files = _episode_files(self.directory)
+
+    def __len__(self):
+        return len(self._files)
+
+    @property
+    def num_episodes(self):
+        return len(self._files)
+
+    def header(self, episode):
+        """Return a dictionary with the "seed", "layout_path" and
+"layout_checksum" of the environment the episode was recorded in"""
+        return cPickle.loads(self._load(episode)['header'].tobytes())
+
+    def actions(self, episode):
+        """Return the actions taken in the episode as an int8 array"""
+        return self._load(episode)['actions']
+
+    def episode_length(self, episode):
+        return len(self.actions(episode))
+
+    def restore(self, env, episode, step):
+        """Put env in the state it was in after the given step of the
+episode (0 being its start) by restoring the nearest keyframe and replaying
+the actions after it.  env must be an environment like the one the episode
+was recorded in; its layout is checked against the recorded checksum if it
+has one.  env.rng is only restored if stepping drew from it while the
+episode was recorded.  Returns the number of actions replayed."""
+        arrays = self._load(episode)
+        actions = arrays['actions']
+        if not (0 <= step <= len(actions)):
+            raise ValueError('Episode %d has no step %d' % (episode, step))
+        checksum = self.header(episode)['layout_checksum']
+        layout = getattr(env, '_layout', None)
+        if (checksum is not None) and (layout is not None) and \
+           (layout_checksum(layout) != checksum):
+            raise ValueError('Episode %d was recorded on a different layout'
+                             % episode)
+
+        steps = arrays['keyframe_steps']
+        k = np.searchsorted(steps, step, side = 'right') - 1
+        (start, end) = arrays['keyframe_offsets'][k:k + 2]
+        env.restore_state(
+            cPickle.loads(arrays['keyframe_data'][start:end].tobytes()))
+        rng_states = cPickle.loads(arrays['rng_states'].tobytes())
+        if rng_states is not None:
+            env.rng.set_state(rng_states[k])
+        for action in actions[steps[k]:step].tolist():
+            env.step(action)
+        return step - steps[k]
+
+    def replay(self, env, episode):
+        """Restore env to the start of the episode, then generate what
+env.step() returns for each of its actions in turn"""
+        self.restore(env, episode, 0)
+        for action in self.actions(episode).tolist():
+            yield env.step(action)
+
+    def _load(self, episode):
+        if self._loaded[0] != episode:
+            data = np.load(os.path.join(self.directory, self._files[episode]))
+            try:
+                arrays = dict((name, data[name]) for name in data.files)
+            finally:
+                data.close()
+            self._loaded = (episode, arrays)
+        return self._loaded[1]
+
+def _episode_files(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith('episode-') and name.endswith('.npz'))
+
+def _same_rng_state(a, b):
+    # States as returned by np.random.RandomState.get_state()
+    return (a[0] == b[0]) and np.array_equal(a[1], b[1]) and \
+           (tuple(a[2:]) == tuple(b[2:]))
+
+def _to_bytes(data):
+    return np.frombuffer(data, dtype = np.uint8)
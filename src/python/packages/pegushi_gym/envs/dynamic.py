@@ -0,0 +1,234 @@
+"""Mazes whose walls can change during an episode.
+
+DynamicDistanceField keeps the distance from every cell to the goal up to
+date as walls open and close.  Opening a wall can only shorten distances, so
+the decrease is propagated outward from the newly joined cells.  Closing a
+wall can only lengthen them: the cells whose every shortest path used the
+closed opening are found by walking outward from it in order of distance,
+and only those cells are searched again.  Either way the work done depends
+on the number of cells whose distances change, not on the size of the maze.
+DynamicMazeEnvironment is a FixedMazeEnvironment with walls that can be
+opened and closed mid-episode and an oracle distance to the goal."""
+
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+
+import heapq
+import numpy as np
+
+# Opposite of each direction (north, east, south, west)
+_OPPOSITE = (2, 3, 0, 1)
+
+class DynamicDistanceField:
+    def __init__(self, adjacency, goal):
+        """Create a new DynamicDistanceField.
+Arguments are:
+    adjacency  np.ndarray[uint8]; (height, width) adjacency mask as returned
+               by compute_adjacency_mask().  The field updates this array in
+               place when walls change, so it may be shared with an
+               environment.
+
+    goal       tuple(int, int); (x, y) coordinates of the goal
+"""
+        if not adjacency.flags.c_contiguous:
+            raise ValueError('adjacency must be C-contiguous')
+        self.adjacency = adjacency
+        self.goal = tuple(goal)
+        (self.height, self.width) = adjacency.shape
+        self._mask = adjacency.reshape(-1)
+        self._distance = np.full(adjacency.size, -1, dtype = np.int32)
+        self._offsets = (self.width, 1, -self.width, -1)
+
+        # Number of cells whose distance changed in the last edit
+        self.last_update_size = 0
+        self._compute()
+
+    @property
+    def distance(self):
+        """(height, width) int32 array indexed [y, x] with the length of the
+shortest path from each cell to the goal, or -1 if there is none.  Do not
+modify it."""
+        return self._distance.reshape(self.adjacency.shape)
+
+    def __getstate__(self):
+        # Pickling would turn the view of adjacency into a copy, so that
+        # walls changed through the field no longer show in the mask an
+        # environment shares with it
+        state = dict(self.__dict__)
+        del state['_mask']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._mask = self.adjacency.reshape(-1)
+
+    def __getitem__(self, cell):
+        """Distance from the (x, y) cell to the goal"""
+        return self._distance[cell[1] * self.width + cell[0]]
+
+    def set_wall(self, x, y, direction, is_open):
+        """Open or close the wall on the given side (0 = north, 1 = east,
+2 = south, 3 = west) of cell (x, y) and repair the distances.  Returns the
+number of cells whose distance changed."""
+        i = y * self.width + x
+        j = self._neighbor(x, y, direction)
+        bit = 1 << direction
+        back = 1 << _OPPOSITE[direction]
+        if bool(self._mask[i] & bit) == bool(is_open):
+            self.last_update_size = 0
+        elif is_open:
+            self._mask[i] |= bit
+            self._mask[j] |= back
+            self.last_update_size = self._wall_opened(i, j)
+        else:
+            self._mask[i] &= ~bit
+            self._mask[j] &= ~back
+            self.last_update_size = self._wall_closed(i, j)
+        return self.last_update_size
+
+    def _neighbor(self, x, y, direction):
+        if ((direction == 0) and (y + 1 >= self.height)) or \
+           ((direction == 1) and (x + 1 >= self.width)) or \
+           ((direction == 2) and (y == 0)) or \
+           ((direction == 3) and (x == 0)):
+            raise ValueError('Cannot change the outer wall of the maze')
+        return y * self.width + x + self._offsets[direction]
+
+    def _neighbors(self, i):
+        mask = self._mask[i]
+        return [ i + self._offsets[d] for d in xrange(0, 4)
+                 if mask & (1 << d) ]
+
+    def _compute(self):
+        g = self.goal[1] * self.width + self.goal[0]
+        self._distance[g] = 0
+        self._propagate([ (0, g) ])
+
+    def _propagate(self, heap):
+        # Lower distances outward from the cells on the heap.  Returns the
+        # number of cells lowered.
+        distance = self._distance
+        count = 0
+        while heap:
+            (d, i) = heapq.heappop(heap)
+            if d != distance[i]:
+                continue
+            count += 1
+            d += 1
+            for j in self._neighbors(i):
+                if (distance[j] < 0) or (d < distance[j]):
+                    distance[j] = d
+                    heapq.heappush(heap, (d, j))
+        return count
+
+    def _wall_opened(self, i, j):
+        distance = self._distance
+        heap = [ ]
+        for (a, b) in ((i, j), (j, i)):
+            if (distance[a] >= 0) and \
+               ((distance[b] < 0) or (distance[a] + 1 < distance[b])):
+                distance[b] = distance[a] + 1
+                heap.append((distance[b], b))
+        return self._propagate(heap)
+
+    def _wall_closed(self, i, j):
+        distance = self._distance
+        (di, dj) = (distance[i], distance[j])
+        if (di < 0) or (dj < 0) or (abs(di - dj) != 1):
+            # Neither cell's shortest paths used the opening
+            return 0
+
+        # Find the cells left without a shortest path.  A cell is affected
+        # if none of its neighbors one step closer to the goal is
+        # unaffected.  Cells are classified in order of distance, so every
+        # possible support of a cell is classified before the cell is.
+        child = j if dj > di else i
+        affected = set()
+        queued = set((child, ))
+        heap = [ (distance[child], child) ]
+        while heap:
+            (d, w) = heapq.heappop(heap)
+            neighbors = self._neighbors(w)
+            if any((distance[n] == d - 1) and (n not in affected)
+                   for n in neighbors):
+                continue
+            affected.add(w)
+            for n in neighbors:
+                if (distance[n] == d + 1) and (n not in queued):
+                    queued.add(n)
+                    heapq.heappush(heap, (d + 1, n))
+
+        # Search again from the unaffected cells bordering the affected
+        # ones.  Distances are only searched within the affected cells.
+        for w in affected:
+            distance[w] = -1
+        heap = [ ]
+        for w in affected:
+            best = -1
+            for n in self._neighbors(w):
+                if (n not in affected) and (distance[n] >= 0) and \
+                   ((best < 0) or (distance[n] + 1 < best)):
+                    best = distance[n] + 1
+            if best >= 0:
+                distance[w] = best
+                heap.append((best, w))
+        heapq.heapify(heap)
+        while heap:
+            (d, w) = heapq.heappop(heap)
+            if d != distance[w]:
+                continue
+            d += 1
+            for n in self._neighbors(w):
+                if (n in affected) and ((distance[n] < 0) or \
+                                        (d < distance[n])):
+                    distance[n] = d
+                    heapq.heappush(heap, (d, n))
+        return len(affected)
+
+class DynamicMazeEnvironment(FixedMazeEnvironment):
+    """FixedMazeEnvironment whose walls can be opened and closed at any
+time, including mid-episode.  It keeps its own copy of the layout and a
+DynamicDistanceField that tracks the distance from every cell to the goal.
+Constructor arguments are the same as for FixedMazeEnvironment."""
+    def __init__(self, *args, **kwargs):
+        FixedMazeEnvironment.__init__(self, *args, **kwargs)
+        self._layout = self._layout.copy()
+        self.distance_field = DynamicDistanceField(self._adjacency, self.goal)
+
+    def set_wall(self, x, y, direction, is_open):
+        """Open or close the wall on the given side (0 = north, 1 = east,
+2 = south, 3 = west) of cell (x, y).  Returns the number of cells whose
+distance to the goal changed."""
+        changed = self.distance_field.set_wall(x, y, direction, is_open)
+
+        # Keep the layout in step with the adjacency mask
+        if direction == 0:
+            (cell, bit) = ((y, x), 0x2)
+        elif direction == 1:
+            (cell, bit) = ((y, x), 0x1)
+        elif direction == 2:
+            (cell, bit) = ((y - 1, x), 0x2)
+        else:
+            (cell, bit) = ((y, x - 1), 0x1)
+        if is_open:
+            self._layout[cell] |= bit
+        else:
+            self._layout[cell] &= ~bit
+
+        self._layout_changed()
+        return changed
+
+    def share_layout(self, path = None):
+        raise ValueError('The layout of a DynamicMazeEnvironment changes, '
+                         'so it cannot be shared')
+
+    def open_wall(self, x, y, direction):
+        return self.set_wall(x, y, direction, True)
+
+    def close_wall(self, x, y, direction):
+        return self.set_wall(x, y, direction, False)
+
+    def distance_to_goal(self, state = None):
+        """Length of the shortest path from state, or the current state if
+state is None, to the goal, or -1 if the goal cannot be reached"""
+        return self.distance_field[(self._x, self._y) if state is None
+                                   else state]
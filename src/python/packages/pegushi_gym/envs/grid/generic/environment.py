@@ -98,10 +98,11 @@ starting state, goal state and so on."""
         self._renderers = { }
 
     def save_state(self):
-        return state.save()
+        return (self.tick, self._state.save())
 
     def restore_state(self, saved):
-        self._state.restore(saved)
+        (self.tick, state) = saved
+        self._state.restore(state)
         
     def _before_action(self, action):
         return action
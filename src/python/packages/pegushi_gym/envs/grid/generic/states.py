@@ -81,7 +81,8 @@ environment
         (self._agent, self._grid, self._objects, self._is_terminal) = \
             cPickle.loads(saved)
         self._visible_state = State(self._agent, self._grid,
-                                    tuple(o for o in objects if o.visible))
+                                    tuple(o for o in self._objects
+                                          if o.visible))
 
     def __getstate__(self):
         return (self._agent, self._grid, self._objects, self._is_terminal,
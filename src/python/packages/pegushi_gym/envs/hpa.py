@@ -0,0 +1,311 @@
+"""Hierarchical pathfinding (HPA*) for large maze layouts.
+
+HierarchicalPathIndex divides a layout into square clusters.  Every cell
+with an opening across a cluster border becomes a node of an abstract graph.
+Nodes on either side of an opening are joined by an edge of length 1, and
+nodes in the same cluster are joined by edges holding the length of the
+shortest path between them that stays inside the cluster.  A query connects
+the start and goal to the nodes of their clusters, runs A* over the abstract
+graph and then refines each abstract edge into cells with a search confined
+to one cluster, so it touches a few clusters instead of the whole maze.
+Because every border crossing is a node, the paths found are shortest paths.
+
+The index only depends on the layout, so it can be built once with
+HierarchicalPathIndex(layout), saved next to the layout with save() and
+reloaded with load()."""
+
+from pegushi_gym.envs.maze import compute_adjacency_mask, layout_checksum, \
+                                  NORTH_OPEN, EAST_OPEN, SOUTH_OPEN, \
+                                  WEST_OPEN
+
+import heapq
+import numpy as np
+
+class HierarchicalPathIndex:
+    def __init__(self, layout, cluster_size = 16, _arrays = None):
+        """Create a new HierarchicalPathIndex.
+Arguments are:
+    layout        np.ndarray; Maze layout, as in FixedMazeEnvironment
+
+    cluster_size  int; Width and height of a cluster, in cells.  Larger
+                  clusters give a smaller abstract graph but make the
+                  searches within clusters longer.
+"""
+        if cluster_size < 1:
+            raise ValueError('cluster_size must be > 0')
+        self.layout = layout
+        self.cluster_size = cluster_size
+        self._adjacency = compute_adjacency_mask(layout)
+        (self._height, self._width) = layout.shape
+        self._clusters_x = (self._width + cluster_size - 1) // cluster_size
+        self._clusters_y = (self._height + cluster_size - 1) // cluster_size
+
+        if _arrays is None:
+            self._build()
+        else:
+            for (name, value) in _arrays.iteritems():
+                setattr(self, name, value)
+
+    @property
+    def num_clusters(self):
+        return self._clusters_x * self._clusters_y
+
+    @property
+    def num_nodes(self):
+        """Number of nodes in the abstract graph"""
+        return len(self.node_cells)
+
+    @property
+    def num_edges(self):
+        """Number of directed edges in the abstract graph"""
+        return len(self._edge_targets)
+
+    def cluster_of(self, x, y):
+        return (y // self.cluster_size) * self._clusters_x + \
+                   (x // self.cluster_size)
+
+    def find_path(self, start, goal):
+        """Return the shortest path from start to goal as a tuple of (x, y)
+cells that begins with start and ends with goal, or None if the goal cannot
+be reached"""
+        abstract = self._search(tuple(start), tuple(goal))
+        if abstract is None:
+            return None
+        cells = [ tuple(start) ]
+        for (a, b) in zip(abstract, abstract[1:]):
+            if self.cluster_of(*a) == self.cluster_of(*b):
+                cells.extend(self._refine(a, b)[1:])
+            else:
+                # Nodes in different clusters are one step apart
+                cells.append(b)
+        return tuple(cells)
+
+    def path_length(self, start, goal):
+        """Return the length of the shortest path from start to goal without
+refining it into cells, or -1 if the goal cannot be reached"""
+        result = self._search(tuple(start), tuple(goal), with_length = True)
+        return -1 if result is None else result
+
+    def save(self, path):
+        """Save the index to path with numpy.savez().  The layout is not
+saved, but a checksum of it is, so that load() can check that the index
+belongs to the layout it is given.  path is used as is, without adding
+".npz", so load() takes the same path."""
+        with open(path, 'wb') as f:
+            np.savez(f, cluster_size = self.cluster_size,
+                     layout_shape = np.asarray(self.layout.shape),
+                     layout_checksum = layout_checksum(self.layout),
+                     **dict((name, getattr(self, name))
+                            for name in _SAVED_ARRAYS))
+
+    @staticmethod
+    def load(path, layout):
+        """Load an index saved by save() for the given layout"""
+        data = np.load(path)
+        try:
+            if (tuple(data['layout_shape']) != layout.shape) or \
+               (int(data['layout_checksum']) != layout_checksum(layout)):
+                raise ValueError('%s is not an index for this layout' % path)
+            arrays = dict((name, data[name]) for name in _SAVED_ARRAYS)
+            return HierarchicalPathIndex(layout, int(data['cluster_size']),
+                                         arrays)
+        finally:
+            data.close()
+
+    def _build(self):
+        cs = self.cluster_size
+        (height, width) = (self._height, self._width)
+
+        # Openings across cluster borders, as pairs of flat cell indices.
+        # Only the last column and row of each cluster are looked at, so
+        # no array covers the whole maze.
+        border_xs = np.arange(cs - 1, width - 1, cs, dtype = np.int64)
+        border_ys = np.arange(cs - 1, height - 1, cs, dtype = np.int64)
+        (ys, columns) = np.nonzero(self._adjacency[:, border_xs] & EAST_OPEN)
+        east_cells = ys * width + border_xs[columns]
+        (rows, xs) = np.nonzero(self._adjacency[border_ys, :] & NORTH_OPEN)
+        north_cells = border_ys[rows] * width + xs
+        sources = np.concatenate((east_cells, north_cells))
+        targets = np.concatenate((east_cells + 1, north_cells + width))
+
+        (flat_nodes, inverse) = np.unique(
+            np.concatenate((sources, targets)), return_inverse = True)
+        (node_y, node_x) = np.divmod(flat_nodes, width)
+        self.node_cells = np.column_stack((node_x, node_y)).astype(np.int32)
+        self._node_flat = flat_nodes.astype(np.int64)
+        node_clusters = self.cluster_of(node_x, node_y)
+
+        n = len(sources)
+        edge_sources = [ inverse[0:n], inverse[n:] ]
+        edge_targets = [ inverse[n:], inverse[0:n] ]
+        edge_costs = [ np.ones(2 * n, dtype = np.int32) ]
+
+        # Nodes grouped by cluster
+        order = np.argsort(node_clusters, kind = 'mergesort')
+        counts = np.bincount(node_clusters, minlength = self.num_clusters)
+        self._cluster_offsets = np.concatenate(([ 0 ], np.cumsum(counts)))
+        self._cluster_nodes = order.astype(np.int32)
+
+        # Shortest paths between the nodes in each cluster
+        intra_sources = [ ]
+        intra_targets = [ ]
+        intra_costs = [ ]
+        for cluster in np.flatnonzero(counts > 1):
+            members = self._nodes_in_cluster(cluster)
+            for i in members:
+                distance = self._cluster_search(self.node_cells[i])[0]
+                for j in members:
+                    d = distance.get(self._node_flat[j], -1)
+                    if (i != j) and (d >= 0):
+                        intra_sources.append(i)
+                        intra_targets.append(j)
+                        intra_costs.append(d)
+
+        edge_sources.append(np.asarray(intra_sources, dtype = np.int64))
+        edge_targets.append(np.asarray(intra_targets, dtype = np.int64))
+        edge_costs.append(np.asarray(intra_costs, dtype = np.int32))
+        edge_sources = np.concatenate(edge_sources)
+        order = np.argsort(edge_sources, kind = 'mergesort')
+        counts = np.bincount(edge_sources, minlength = len(flat_nodes))
+        self._edge_offsets = np.concatenate(([ 0 ], np.cumsum(counts)))
+        self._edge_targets = \
+            np.concatenate(edge_targets)[order].astype(np.int32)
+        self._edge_costs = np.concatenate(edge_costs)[order]
+
+    def _nodes_in_cluster(self, cluster):
+        return self._cluster_nodes[self._cluster_offsets[cluster]:
+                                   self._cluster_offsets[cluster + 1]]
+
+    def _cluster_search(self, cell, target = None):
+        """Breadth-first search from cell that never leaves its cluster.
+Returns a dictionary from the flat index of every reachable cell to its
+distance, and a dictionary from each reached flat index to the one it was
+reached from.  Stops early once target is reached, if it is given."""
+        (x, y) = cell
+        cs = self.cluster_size
+        (x0, y0) = ((x // cs) * cs, (y // cs) * cs)
+        (x1, y1) = (min(x0 + cs, self._width), min(y0 + cs, self._height))
+        width = self._width
+        adjacency = self._adjacency
+
+        start = y * width + x
+        target = None if target is None else target[1] * width + target[0]
+        distance = { start : 0 }
+        prior = { start : -1 }
+        frontier = [ start ]
+        d = 0
+        while frontier and (target not in distance):
+            d += 1
+            next_frontier = [ ]
+            for i in frontier:
+                (cy, cx) = divmod(i, width)
+                mask = adjacency[cy, cx]
+                neighbors = [ ]
+                if (mask & NORTH_OPEN) and (cy + 1 < y1):
+                    neighbors.append(i + width)
+                if (mask & EAST_OPEN) and (cx + 1 < x1):
+                    neighbors.append(i + 1)
+                if (mask & SOUTH_OPEN) and (cy > y0):
+                    neighbors.append(i - width)
+                if (mask & WEST_OPEN) and (cx > x0):
+                    neighbors.append(i - 1)
+                for j in neighbors:
+                    if j not in distance:
+                        distance[j] = d
+                        prior[j] = i
+                        next_frontier.append(j)
+            frontier = next_frontier
+        return (distance, prior)
+
+    def _refine(self, a, b):
+        (_, prior) = self._cluster_search(a, b)
+        i = b[1] * self._width + b[0]
+        cells = [ ]
+        while i >= 0:
+            (y, x) = divmod(i, self._width)
+            cells.append((x, y))
+            i = prior[i]
+        cells.reverse()
+        return cells
+
+    def _local_edges(self, cell):
+        # Edges from a cell to the nodes of its cluster, as (node, cost)
+        (distance, _) = self._cluster_search(cell)
+        cluster = self.cluster_of(*cell)
+        return [ (j, distance[self._node_flat[j]])
+                 for j in self._nodes_in_cluster(cluster)
+                 if self._node_flat[j] in distance ]
+
+    def _search(self, start, goal, with_length = False):
+        # A* over the abstract graph plus two temporary nodes for the start
+        # and goal.  Returns the cells of the abstract path, or its length.
+        n = self.num_nodes
+        (start_id, goal_id) = (n, n + 1)
+        (gx, gy) = goal
+
+        def cell_of(node):
+            if node == start_id:
+                return start
+            if node == goal_id:
+                return goal
+            (x, y) = self.node_cells[node]
+            return (int(x), int(y))
+
+        def h(cell):
+            return abs(cell[0] - gx) + abs(cell[1] - gy)
+
+        # Edges into the goal, keyed by the node they leave from
+        to_goal = dict(self._local_edges(goal))
+        start_edges = self._local_edges(start)
+        if self.cluster_of(*start) == self.cluster_of(*goal):
+            d = self._cluster_search(start, goal)[0] \
+                    .get(gy * self._width + gx, -1)
+            if d >= 0:
+                start_edges.append((goal_id, d))
+
+        distance = { start_id : 0 }
+        prior = { start_id : None }
+        heap = [ (h(start), 0, start_id) ]
+        closed = set()
+        while heap:
+            (_, d, node) = heapq.heappop(heap)
+            if node in closed:
+                continue
+            if node == goal_id:
+                break
+            closed.add(node)
+
+            if node == start_id:
+                edges = start_edges
+            else:
+                begin = self._edge_offsets[node]
+                end = self._edge_offsets[node + 1]
+                edges = zip(self._edge_targets[begin:end].tolist(),
+                            self._edge_costs[begin:end].tolist())
+                if node in to_goal:
+                    edges.append((goal_id, to_goal[node]))
+
+            for (next_node, cost) in edges:
+                nd = d + cost
+                if nd < distance.get(next_node, np.inf):
+                    distance[next_node] = nd
+                    prior[next_node] = node
+                    heapq.heappush(heap,
+                                   (nd + h(cell_of(next_node)), nd, next_node))
+        else:
+            return None
+
+        if with_length:
+            return distance[goal_id]
+        path = [ ]
+        node = goal_id
+        while node is not None:
+            path.append(cell_of(node))
+            node = prior[node]
+        path.reverse()
+        return path
+
+# Arrays written by HierarchicalPathIndex.save()
+_SAVED_ARRAYS = ('node_cells', '_node_flat', '_cluster_offsets',
+                 '_cluster_nodes', '_edge_offsets', '_edge_targets',
+                 '_edge_costs')
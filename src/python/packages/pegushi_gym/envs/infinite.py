@@ -0,0 +1,220 @@
+"""Effectively unbounded mazes generated on demand.
+
+InfiniteMaze divides the plane into square chunks and generates each one
+the first time it is needed.  A chunk's maze depends only on the maze's seed
+and the chunk's coordinates, so chunks can be dropped and regenerated at
+will, and the same seed always gives the same maze however it is explored.
+Inside a chunk the cells form a random spanning tree.  Every chunk also has
+one door in its east border and one in its north border, placed with their
+own seed, so a chunk knows where its neighbors' doors into it are without
+generating them.  Every chunk is therefore joined to all four of its
+neighbors and the whole maze is connected."""
+
+from pegushi_gym.envs.maze import _ACTION_MASKS, NORTH_OPEN, EAST_OPEN, \
+                                  SOUTH_OPEN, WEST_OPEN, \
+                                  _generate_random_maze, \
+                                  compute_adjacency_mask
+import gym
+import gym.spaces
+from gym import spaces
+from gym.utils.seeding import create_seed, hash_seed, np_random
+
+import collections
+import numpy as np
+
+class InfiniteMaze:
+    def __init__(self, seed, chunk_size = 32, max_resident_chunks = 64,
+                 algorithm = 'kruskal'):
+        """Create a new InfiniteMaze.
+Arguments are:
+    seed                 int; Seed the whole maze is derived from
+
+    chunk_size           int; Width and height of a chunk, in cells
+
+    max_resident_chunks  int; Maximum number of generated chunks kept in
+                         memory.  The least recently used chunk is dropped
+                         when another one is needed.
+
+    algorithm            str; Algorithm used to generate each chunk, as in
+                         FixedMazeEnvironment
+"""
+        if chunk_size < 2:
+            raise ValueError('chunk_size must be > 1')
+        if max_resident_chunks < 1:
+            raise ValueError('max_resident_chunks must be > 0')
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.max_resident_chunks = max_resident_chunks
+        self.algorithm = algorithm
+
+        # Adjacency masks of the resident chunks, keyed by chunk
+        # coordinates, from least to most recently used
+        self._chunks = collections.OrderedDict()
+        self.chunks_generated = 0
+
+    @property
+    def num_resident_chunks(self):
+        return len(self._chunks)
+
+    def adjacency(self, x, y):
+        """Return the adjacency mask of cell (x, y), with bits as in
+compute_adjacency_mask()"""
+        (cx, lx) = divmod(x, self.chunk_size)
+        (cy, ly) = divmod(y, self.chunk_size)
+        return self.chunk(cx, cy)[ly, lx]
+
+    def action_mask(self, x, y):
+        """Return a read-only boolean array, indexed by action, that is True
+for the actions that do not bump into a wall in cell (x, y)"""
+        return _ACTION_MASKS[self.adjacency(x, y)]
+
+    def chunk(self, cx, cy):
+        """Return the (chunk_size, chunk_size) adjacency mask of chunk
+(cx, cy), indexed [y, x], generating it if it is not resident"""
+        key = (cx, cy)
+        try:
+            mask = self._chunks.pop(key)
+        except KeyError:
+            mask = self._generate_chunk(cx, cy)
+            self.chunks_generated += 1
+            while len(self._chunks) >= self.max_resident_chunks:
+                self._chunks.popitem(last = False)
+        self._chunks[key] = mask
+        return mask
+
+    def window(self, x, y, width, height):
+        """Return the adjacency masks of the width x height cells whose
+lower left corner is (x, y), as a (height, width) uint8 array indexed
+[y, x].  Openings out of the window are kept."""
+        result = np.empty((height, width), dtype = np.uint8)
+        cs = self.chunk_size
+        for cy in xrange(y // cs, (y + height - 1) // cs + 1):
+            y0 = max(y, cy * cs)
+            y1 = min(y + height, (cy + 1) * cs)
+            for cx in xrange(x // cs, (x + width - 1) // cs + 1):
+                x0 = max(x, cx * cs)
+                x1 = min(x + width, (cx + 1) * cs)
+                result[y0 - y:y1 - y, x0 - x:x1 - x] = \
+                    self.chunk(cx, cy)[y0 - cy * cs:y1 - cy * cs,
+                                       x0 - cx * cs:x1 - cx * cs]
+        return result
+
+    def layout_window(self, x, y, width, height):
+        """Return the same cells as window() as a layout, in the form used
+by FixedMazeEnvironment, with the openings out of the window closed"""
+        mask = self.window(x, y, width, height)
+        layout = ((mask & EAST_OPEN) != 0) * 0x1 + \
+                     ((mask & NORTH_OPEN) != 0) * 0x2
+        layout[:, -1] &= ~0x1
+        layout[-1, :] &= ~0x2
+        return layout.astype(np.int32)
+
+    def _generate_chunk(self, cx, cy):
+        (rng, _) = np_random(self._chunk_seed('chunk', cx, cy))
+        cs = self.chunk_size
+        layout = _generate_random_maze(cs, cs, self.algorithm, rng)
+        mask = compute_adjacency_mask(layout)
+
+        (east, north) = self._doors(cx, cy)
+        mask[east, cs - 1] |= EAST_OPEN
+        mask[cs - 1, north] |= NORTH_OPEN
+        mask[self._doors(cx - 1, cy)[0], 0] |= WEST_OPEN
+        mask[0, self._doors(cx, cy - 1)[1]] |= SOUTH_OPEN
+        return mask
+
+    def _doors(self, cx, cy):
+        # Row of the door in chunk (cx, cy)'s east border and column of the
+        # door in its north border
+        (rng, _) = np_random(self._chunk_seed('doors', cx, cy))
+        return tuple(rng.randint(0, self.chunk_size, size = 2))
+
+    def _chunk_seed(self, kind, cx, cy):
+        return hash_seed('%d:%s:%d:%d' % (self.seed, kind, cx, cy))
+
+class InfiniteMazeEnvironment(gym.Env):
+    """Maze environment over an InfiniteMaze.  States are unbounded (x, y)
+coordinates.  Without a goal, episodes only end after max_steps steps,
+which suits exploration experiments."""
+    action_space = spaces.Discrete(4)
+    metadata = { 'render.modes' : [ ] }
+
+    def __init__(self, seed = None, chunk_size = 32,
+                 max_resident_chunks = 64, start = (0, 0), goal = None,
+                 max_steps = 10000, goal_reward = 100.0, step_reward = -1.0,
+                 hit_wall_reward = -5.0):
+        """Create a new InfiniteMazeEnvironment.
+Arguments are:
+    seed                 int; Seed for the maze.  If None, the environment
+                         will create its own seed.
+
+    chunk_size           int; Width and height of a chunk of the maze
+
+    max_resident_chunks  int; Maximum number of chunks kept in memory
+
+    start                tuple(int, int); (x, y) coordinates where the agent
+                         starts
+
+    goal                 tuple(int, int); (x, y) coordinates of the goal, or
+                         None for no goal
+
+    max_steps            int; Maximum number of steps the agent can take
+                         before the episode ends
+
+    goal_reward, step_reward, hit_wall_reward
+                         float; Rewards, as in FixedMazeEnvironment
+"""
+        gym.Env.__init__(self)
+        if seed == None:
+            seed = create_seed()
+        self.seed = seed
+        self.maze = InfiniteMaze(seed, chunk_size, max_resident_chunks)
+        self.start = tuple(start)
+        self.goal = None if goal is None else tuple(goal)
+        self.max_steps = max_steps
+        self.goal_reward = goal_reward
+        self.step_reward = step_reward
+        self.hit_wall_reward = hit_wall_reward
+
+        limit = np.iinfo(np.int64).max
+        self.observation_space = spaces.Box(-limit, limit, (2, ),
+                                            dtype = np.int64)
+        self._delta_x = [  0,  1,  0, -1 ]
+        self._delta_y = [  1,  0, -1,  0 ]
+        self.reset()
+
+    def reset(self):
+        (self._x, self._y) = self.start
+        self.tick = 0
+        return (self._x, self._y)
+
+    def step(self, action):
+        """Take one step.  The info dictionary holds the action mask for
+the new state under "action_mask".  Raises IndexError if action is not in
+[0, 4)."""
+        if not (0 <= action < 4):
+            raise IndexError('Invalid action %s' % repr(action))
+        self.tick += 1
+        done = self.tick >= self.max_steps
+        if self.maze.adjacency(self._x, self._y) & (1 << action):
+            self._x += self._delta_x[action]
+            self._y += self._delta_y[action]
+            if (self._x, self._y) == self.goal:
+                (reward, done) = (self.goal_reward, True)
+            else:
+                reward = self.step_reward
+        else:
+            reward = self.hit_wall_reward
+        return ((self._x, self._y), reward, done,
+                { 'action_mask' : self.action_mask() })
+
+    def action_mask(self, state = None):
+        (x, y) = (self._x, self._y) if state is None else state
+        return self.maze.action_mask(x, y)
+
+    @property
+    def current_state(self):
+        return (self._x, self._y)
+
+    def teleport(self, x, y):
+        self._x = x
+        self._y = y
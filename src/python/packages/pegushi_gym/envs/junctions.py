@@ -0,0 +1,230 @@
+"""Corridor-compressed mazes.
+
+Most cells of a perfect maze are corridor cells with exactly two openings,
+where an agent has no real decision to make.  JunctionGraph collapses a
+layout into a graph whose nodes are the junctions, dead ends and any other
+cells of interest (such as the start and the goal) and whose edges are the
+corridors between them, each with its length and the primitive actions that
+walk along it.  CorridorMazeEnvironment uses the graph so that each action
+follows a corridor all the way to the next node."""
+
+from pegushi_gym.envs.maze import FixedMazeEnvironment, compute_adjacency_mask
+
+import copy
+import numpy as np
+
+_DELTA_X = (  0,  1,  0, -1 )
+_DELTA_Y = (  1,  0, -1,  0 )
+
+# Number of open directions for each adjacency mask
+_DEGREE = np.asarray([ bin(m).count('1') for m in xrange(0, 16) ],
+                     dtype = np.int32)
+
+# Lowest open direction for each adjacency mask
+_LOWEST_BIT = np.asarray([ -1 ] + [ (m & -m).bit_length() - 1
+                                    for m in xrange(1, 16) ], dtype = np.int32)
+
+class JunctionGraph:
+    """Graph of the junctions, dead ends and extra nodes of a maze layout.
+Attributes are:
+    node_cells    np.ndarray[int32]; (n, 2) array with the (x, y) cell of
+                  each node
+
+    node_index    np.ndarray[int32]; (height, width) array indexed [y, x]
+                  with the node at each cell, or -1 for corridor cells
+
+    edge_targets  np.ndarray[int32]; (n, 4) array with the node reached by
+                  leaving each node in each direction (north, east, south,
+                  west), or -1 where there is a wall
+
+    edge_lengths  np.ndarray[int32]; (n, 4) array with the number of
+                  primitive steps along each edge, or 0 where there is a wall
+"""
+    def __init__(self, layout, extra_nodes = (), adjacency = None):
+        """Create a new JunctionGraph.
+Arguments are:
+    layout       np.ndarray; Maze layout, as in FixedMazeEnvironment
+
+    extra_nodes  sequence of tuple(int, int); (x, y) cells that become
+                 nodes even if they are in the middle of a corridor, so
+                 that corridors stop there
+
+    adjacency    np.ndarray[uint8]; The layout's adjacency mask, as returned
+                 by compute_adjacency_mask(), or None to compute it
+"""
+        self.layout = layout
+        self.adjacency = compute_adjacency_mask(layout) \
+                             if adjacency is None else adjacency
+        (height, width) = layout.shape
+
+        is_node = _DEGREE[self.adjacency] != 2
+        for (x, y) in extra_nodes:
+            is_node[y, x] = True
+        (ys, xs) = np.nonzero(is_node)
+        self.node_cells = np.column_stack((xs, ys)).astype(np.int32)
+        self.node_index = np.full((height, width), -1, dtype = np.int32)
+        self.node_index[ys, xs] = np.arange(0, len(xs), dtype = np.int32)
+
+        n = len(self.node_cells)
+        self.edge_targets = np.full((n, 4), -1, dtype = np.int32)
+        self.edge_lengths = np.zeros((n, 4), dtype = np.int32)
+
+        # The actions along every edge, concatenated, with the start of
+        # the actions for edge (i, d) in self._action_offsets[i, d]
+        self._action_offsets = np.zeros((n, 4), dtype = np.int64)
+        actions = [ ]
+        for i in xrange(0, n):
+            (x, y) = self.node_cells[i]
+            for d in xrange(0, 4):
+                if self.adjacency[y, x] & (1 << d):
+                    (path, end) = self._walk(x, y, d)
+                    self.edge_targets[i, d] = self.node_index[end[1], end[0]]
+                    self.edge_lengths[i, d] = len(path)
+                    self._action_offsets[i, d] = len(actions)
+                    actions.extend(path)
+        self._actions = np.asarray(actions, dtype = np.int8)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_cells)
+
+    @property
+    def num_edges(self):
+        """Number of directed edges"""
+        return int((self.edge_targets >= 0).sum())
+
+    def is_node(self, x, y):
+        return self.node_index[y, x] >= 0
+
+    def edge_actions(self, node, direction):
+        """Return the primitive actions along the edge leaving node in the
+given direction, as a read-only int8 array"""
+        start = self._action_offsets[node, direction]
+        result = self._actions[start:start + self.edge_lengths[node,
+                                                                direction]]
+        result.flags.writeable = False
+        return result
+
+    def follow(self, x, y, direction):
+        """Follow the corridor leaving cell (x, y) in the given direction
+until it reaches a node.  (x, y) need not be a node itself.  Returns the
+primitive actions taken, as an int8 array, and the (x, y) cell reached.  The
+actions are empty and the cell is (x, y) if there is a wall in that
+direction."""
+        node = self.node_index[y, x]
+        if node >= 0:
+            target = self.edge_targets[node, direction]
+            if target < 0:
+                return (self._actions[0:0], (x, y))
+            (tx, ty) = self.node_cells[target]
+            return (self.edge_actions(node, direction), (int(tx), int(ty)))
+        if not self.adjacency[y, x] & (1 << direction):
+            return (self._actions[0:0], (x, y))
+        (path, end) = self._walk(x, y, direction)
+        return (np.asarray(path, dtype = np.int8), end)
+
+    def _walk(self, x, y, direction):
+        origin = (x, y)
+        path = [ direction ]
+        x += _DELTA_X[direction]
+        y += _DELTA_Y[direction]
+
+        # Stopping at the origin ends walks around loops with no nodes
+        while (self.node_index[y, x] < 0) and ((x, y) != origin):
+            # A corridor cell has exactly two openings, and one of them
+            # leads back the way the walk came
+            back = (direction + 2) % 4
+            openings = self.adjacency[y, x] & ~(1 << back)
+            direction = _LOWEST_BIT[openings]
+            path.append(direction)
+            x += _DELTA_X[direction]
+            y += _DELTA_Y[direction]
+        return (path, (int(x), int(y)))
+
+class CorridorMazeEnvironment(FixedMazeEnvironment):
+    """Maze environment whose actions follow the corridor leaving the
+agent's cell in the chosen direction until it reaches a junction, a dead
+end, the start or the goal.  The reward for an action is the sum of the
+rewards of the primitive steps it takes, so a corridor of length n that does
+not end at the goal earns n * step_reward.  Bumping into a wall costs
+hit_wall_reward as usual.  Every step counts towards max_steps, and a
+corridor that would run past max_steps stops partway along.
+
+Constructor arguments are the same as for FixedMazeEnvironment.  The info
+dictionary returned by step() holds the action mask for the new state under
+"action_mask", the primitive actions taken under "actions" and their number
+under "steps"."""
+    def __init__(self, *args, **kwargs):
+        FixedMazeEnvironment.__init__(self, *args, **kwargs)
+        self.graph = JunctionGraph(self._layout, (self.start, self.goal),
+                                   self._adjacency)
+
+    def share_layout(self, path = None):
+        path = FixedMazeEnvironment.share_layout(self, path)
+        self._bind_graph()
+        return path
+
+    def __getstate__(self):
+        # The graph gets the layout and adjacency mask back from the
+        # environment, so a shared layout is not pickled through it
+        state = FixedMazeEnvironment.__getstate__(self)
+        graph = copy.copy(self.graph)
+        (graph.layout, graph.adjacency) = (None, None)
+        state['graph'] = graph
+        return state
+
+    def __setstate__(self, state):
+        FixedMazeEnvironment.__setstate__(self, state)
+        self._bind_graph()
+
+    def _bind_graph(self):
+        (self.graph.layout, self.graph.adjacency) = \
+            (self._layout, self._adjacency)
+
+    def step(self, action):
+        if not (0 <= action < 4):
+            raise IndexError('Invalid action %s' % repr(action))
+        (path, end) = self.graph.follow(self._x, self._y, action)
+        if not len(path):
+            self.tick += 1
+            return ((self._x, self._y), self.hit_wall_reward,
+                    self.tick >= self.max_steps,
+                    { 'action_mask' : self.action_mask(), 'actions' : path,
+                      'steps' : 1 })
+
+        remaining = self.max_steps - self.tick
+        if len(path) > remaining:
+            path = path[:remaining]
+            self._x += sum(_DELTA_X[a] for a in path)
+            self._y += sum(_DELTA_Y[a] for a in path)
+        else:
+            (self._x, self._y) = end
+        self.tick += len(path)
+
+        info = { 'action_mask' : self.action_mask(), 'actions' : path,
+                 'steps' : len(path) }
+        if (self._x == self.goal[0]) and (self._y == self.goal[1]):
+            reward = (len(path) - 1) * self.step_reward + self.goal_reward
+            return ((self._x, self._y), reward, True, info)
+        return ((self._x, self._y), len(path) * self.step_reward,
+                self.tick >= self.max_steps, info)
+
+    def step_many(self, actions):
+        """Take a sequence of corridor-following actions, as
+FixedMazeEnvironment.step_many() does for primitive ones"""
+        states = [ ]
+        rewards = [ ]
+        done = False
+        for action in np.asarray(actions).tolist():
+            (state, reward, done, _) = self.step(action)
+            states.append(state)
+            rewards.append(reward)
+            if done:
+                break
+
+        count = len(rewards)
+        dones = np.zeros(count, dtype = np.bool_)
+        if done:
+            dones[-1] = True
+        return (np.asarray(states, dtype = np.int32).reshape((count, 2)),
+                np.asarray(rewards, dtype = np.float64), dones, count)
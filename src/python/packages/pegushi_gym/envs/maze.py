@@ -5,12 +5,36 @@ import gym.spaces
 from gym import error, spaces, utils
 from gym.utils.seeding import create_seed, np_random
 
+from pegushi_gym.envs.rendering import BackgroundRenderer
+
 import numpy as np
+import array
+import collections
 import heapq
+import os
+import tempfile
+import zlib
 
 import pygame
 import time
 
+_WALL_COLOR = (0, 0, 0)
+_OPEN_SPACE_COLOR = (255, 255, 255)
+_AGENT_COLOR = (0, 0, 255)
+_GOAL_COLOR = (0, 192, 0)
+
+# Bits in an adjacency mask.  Bit i is set when action i is open.
+NORTH_OPEN = 0x1
+EAST_OPEN = 0x2
+SOUTH_OPEN = 0x4
+WEST_OPEN = 0x8
+
+# Read-only action masks for each of the 16 adjacency masks, so step() can
+# report a mask without allocating one
+_ACTION_MASKS = ((np.arange(0, 16)[:, np.newaxis] >> np.arange(0, 4)) & 1) \
+                    .astype(np.bool_)
+_ACTION_MASKS.flags.writeable = False
+
 class SimpleMazeRenderer:
     def __init__(self, screen, tile_size, wall_tile_image = None,
                  wall_tile_color = (0, 0, 0),
@@ -151,14 +175,182 @@ class _FixedMazeEnvironmentDisplay:
         
         
         
+class MazeViewport:
+    def __init__(self, layout, goal = None, tile_size = 24,
+                 view_tiles = (33, 25), minimap_size = 128,
+                 wall_color = _WALL_COLOR,
+                 open_space_color = _OPEN_SPACE_COLOR,
+                 agent_color = _AGENT_COLOR, goal_color = _GOAL_COLOR):
+        """Create a new MazeViewport, which draws the part of a maze around
+the agent as an RGB image, with the same tiles as render_layout_rgb().
+Only the visible tiles are scaled up to pixels, so the cost of a frame
+depends on the size of the view rather than the size of the maze.
+Arguments are:
+    layout        np.ndarray; Maze layout, as in FixedMazeEnvironment
+
+    goal          tuple(int, int); (x, y) coordinates of the goal, or None
+                  to leave it out
+
+    tile_size     int; Size of a tile, in pixels
+
+    view_tiles    tuple(int, int); Number of (columns, rows) of tiles in
+                  the view.  The view is centered on the agent except near
+                  the edges of the maze.
+
+    minimap_size  int; Largest dimension of a minimap of the whole maze
+                  drawn in the top right corner of the view, in pixels, or
+                  None for no minimap.  The minimap is only drawn when the
+                  maze does not fit in the view.
+
+    wall_color, open_space_color, agent_color, goal_color
+                  tuple(int, int, int); Colors of the tiles
+"""
+        self.tile_size = tile_size
+        self.view_tiles = tuple(view_tiles)
+        self._height = layout.shape[0]
+
+        # The static layer: one palette index per tile
+        self._palette = np.asarray([ open_space_color, wall_color,
+                                     goal_color, agent_color ],
+                                   dtype = np.uint8)
+        walls = _layout_walls(layout)
+        self._tiles = walls.astype(np.uint8)
+        self.goal = goal
+        if goal is not None:
+            self._tiles[self._tile_of(goal)] = 2
+
+        fits = (walls.shape[1] <= view_tiles[0]) and \
+                   (walls.shape[0] <= view_tiles[1])
+        if minimap_size and not fits:
+            self._build_minimap(walls, minimap_size, wall_color,
+                                open_space_color, goal_color)
+        else:
+            self._minimap = None
+        self._agent_color = agent_color
+
+    @property
+    def frame_shape(self):
+        """Shape of the images returned by render()"""
+        return (self.view_tiles[1] * self.tile_size,
+                self.view_tiles[0] * self.tile_size, 3)
+
+    def camera(self, agent):
+        """Return the (row, column) of the tile in the top left corner of
+the view when the agent is at (x, y) cell agent.  Rows and columns are those
+of render_layout_rgb() and may be negative when the maze is smaller than the
+view."""
+        (row, column) = self._tile_of(agent)
+        (rows, columns) = self._tiles.shape
+        return (_clamp_view(row - self.view_tiles[1] // 2, self.view_tiles[1],
+                            rows),
+                _clamp_view(column - self.view_tiles[0] // 2,
+                            self.view_tiles[0], columns))
+
+    def render(self, agent):
+        """Draw the view around the agent at (x, y) cell agent.  Returns a
+uint8 array with shape frame_shape."""
+        (columns, rows) = self.view_tiles
+        (top, left) = self.camera(agent)
+        (bottom, right) = (top + rows, left + columns)
+        (r0, r1) = (max(top, 0), min(bottom, self._tiles.shape[0]))
+        (c0, c1) = (max(left, 0), min(right, self._tiles.shape[1]))
+
+        # Anything outside the maze is drawn as wall
+        view = np.ones((rows, columns), dtype = np.uint8)
+        view[r0 - top:r1 - top, c0 - left:c1 - left] = \
+            self._tiles[r0:r1, c0:c1]
+        (row, column) = self._tile_of(agent)
+        view[row - top, column - left] = 3
+
+        frame = self._palette[view]
+        if self.tile_size > 1:
+            frame = frame.repeat(self.tile_size, axis = 0) \
+                         .repeat(self.tile_size, axis = 1)
+        if self._minimap is not None:
+            minimap = self.minimap(agent)
+            (h, w) = minimap.shape[0:2]
+            if (h <= frame.shape[0]) and (w <= frame.shape[1]):
+                frame[0:h, frame.shape[1] - w:] = minimap
+        return frame
+
+    def minimap(self, agent = None):
+        """Return the minimap as a uint8 RGB array with the agent at (x, y)
+cell agent marked, or None if there is no minimap"""
+        if self._minimap is None:
+            return None
+        result = self._minimap.copy()
+        if agent is not None:
+            (row, column) = self._tile_of(agent)
+            result[row // self._minimap_scale,
+                   column // self._minimap_scale] = self._agent_color
+        return result
+
+    def _build_minimap(self, walls, minimap_size, wall_color,
+                       open_space_color, goal_color):
+        # Each minimap pixel is a block of tiles, shaded by the fraction of
+        # the block that is wall
+        scale = -(-max(walls.shape) // minimap_size)
+        rows = -(-walls.shape[0] // scale)
+        columns = -(-walls.shape[1] // scale)
+        padded = np.ones((rows * scale, columns * scale))
+        padded[0:walls.shape[0], 0:walls.shape[1]] = walls
+        fraction = padded.reshape((rows, scale, columns, scale)) \
+                         .mean(axis = (1, 3))[:, :, np.newaxis]
+        minimap = np.asarray(open_space_color) + \
+                      fraction * (np.asarray(wall_color) -
+                                  np.asarray(open_space_color))
+        self._minimap = np.round(minimap).astype(np.uint8)
+        self._minimap_scale = scale
+        if self.goal is not None:
+            (row, column) = self._tile_of(self.goal)
+            self._minimap[row // scale, column // scale] = goal_color
+
+    def _tile_of(self, location):
+        return (2 * (self._height - location[1]) - 1, 2 * location[0] + 1)
+
+def _clamp_view(origin, view_size, size):
+    if size <= view_size:
+        # Center the whole maze in the view
+        return -((view_size - size) // 2)
+    return min(max(origin, 0), size - view_size)
+
+class _ViewportDisplay:
+    """Pygame window showing the frames of a MazeViewport"""
+    def __init__(self, viewport):
+        self.viewport = viewport
+        self._screen = None
+
+    def draw(self, agent_location = None):
+        if agent_location is None:
+            return
+        frame = self.viewport.render(agent_location[0:2])
+        if not self._screen:
+            self._screen = pygame.display.set_mode((frame.shape[1],
+                                                    frame.shape[0]))
+        image = pygame.image.frombuffer(np.ascontiguousarray(frame).tostring(),
+                                        (frame.shape[1], frame.shape[0]),
+                                        'RGB')
+        self._screen.blit(image, (0, 0))
+        pygame.display.flip()
+
+    def move_agent(self, old, new):
+        self.draw(new)
+
+    def close(self):
+        if self._screen:
+            pygame.display.quit()
+            self._screen = None
+
 class FixedMazeEnvironment(gym.Env):
     action_space = spaces.Discrete(4)
-    metadata = { 'render.modes' : [ 'human', 'ansi' ] }
+    metadata = { 'render.modes' : [ 'human', 'ansi', 'rgb_array',
+                                    'background' ] }
     
     def __init__(self, layout = None, start = (0, 0), goal = None, width = 0,
                  height = 0, algorithm = 'kruskal', rng = None, seed = None,
                  max_steps = 10000, goal_reward = 100.0, step_reward = -1.0,
-                 hit_wall_reward = -5.0, agent_image = None):
+                 hit_wall_reward = -5.0, agent_image = None, tile_size = 24,
+                 viewport = None):
         """Create a new FixedMazeEnvironment.
 Arguments are:
     layout     numpy.ndarray;  A 2D array of integers indicating connectivity
@@ -219,7 +411,18 @@ Arguments are:
                when the environment is rendered in "human" mode.  If this
                argument is a str or unicode, it specifies the name of a file
                with the image to use for the agent.  If this argument is
-               a pygame.Surface, it contains the image itself
+               a pygame.Surface, it contains the image itself.  The
+               "rgb_array" rendering mode ignores this argument and draws
+               the agent as a solid tile.
+
+    tile_size  int; Size of a wall tile, in pixels, when the environment
+               is rendered in "human" or "rgb_array" mode
+
+    viewport   tuple(int, int); If not None, "human" and "rgb_array"
+               rendering show only this many (columns, rows) of tiles
+               around the agent, plus a minimap of the whole maze, through
+               a MazeViewport.  Use this for mazes too large for the
+               screen.
 """
         gym.Env.__init__(self)
 
@@ -244,6 +447,7 @@ Arguments are:
         else:
             self._layout = _generate_random_maze(width, height, algorithm,
                                                  self.rng)
+        self._adjacency = compute_adjacency_mask(self._layout)
 
         if not goal:
             goal = (self.rng.randint(0, self._layout.shape[1]),
@@ -267,8 +471,6 @@ Arguments are:
 
         self._delta_x = [  0,  1,  0, -1 ]
         self._delta_y = [  1,  0, -1,  0 ]
-        self._can_move = [ self._can_move_north, self._can_move_east,
-                           self._can_move_south, self._can_move_west ]
 
         self._walls1 = (' *', '  ', ' *', '  ',
                         '#*', '# ', '#*', '# ',
@@ -277,9 +479,23 @@ Arguments are:
         self._walls2 = ('**', '**', ' *', ' *')
 
         self._renderer = None
+        self._background = None
+        self._rgb_background = None
+        self._solver = None
+
+        # Maximum frame rate of the "background" rendering mode
+        self.background_fps = 30
         self.reset()
 
         self._agent_image = agent_image
+        self.tile_size = tile_size
+        self.viewport = viewport
+        self._viewport = None
+
+        # Name of the file holding the layout, if share_layout() was called,
+        # and the id of the process that wrote it, which removes it
+        self._layout_path = None
+        self._layout_owner = None
 
     def reset(self):
         (self._x, self._y) = self.start
@@ -287,23 +503,110 @@ Arguments are:
         return (self._x, self._y)
         
     def step(self, action):
+        """Take one step.  The info dictionary holds the action mask for
+the new state under "action_mask".  Raises IndexError if action is not
+in [0, 4)."""
+        if not (0 <= action < 4):
+            raise IndexError('Invalid action %s' % repr(action))
         self.tick += 1
 
-        if self._can_move[action](self._x, self._y):
+        if self._adjacency[self._y, self._x] & (1 << action):
             self._x += self._delta_x[action]
             self._y += self._delta_y[action]
+            info = { 'action_mask' : self.action_mask() }
             if (self._x == self.goal[0]) and (self._y == self.goal[1]):
-                return ((self._x, self._y), self.goal_reward, True, {})
+                return ((self._x, self._y), self.goal_reward, True, info)
             return ((self._x, self._y), self.step_reward,
-                    self.tick >= self.max_steps, {})
+                    self.tick >= self.max_steps, info)
         return ((self._x, self._y), self.hit_wall_reward,
-                self.tick >= self.max_steps, {})
+                self.tick >= self.max_steps,
+                { 'action_mask' : self.action_mask() })
+
+    def step_many(self, actions):
+        """Take a sequence of actions, stopping early at the first step that
+ends the episode.  Equivalent to calling step() for each action, but much
+faster for long sequences.  Returns (states, rewards, dones, count), where
+count is the number of steps taken and states, rewards and dones are arrays
+with count entries: an (count, 2) int32 array of the (x, y) states after
+each step, a float64 array of rewards and a bool array that is True only for
+a final step that ended the episode.  Raises IndexError if any action is not
+in [0, 4), before taking any steps."""
+        actions = np.asarray(actions)
+        if len(actions) and ((actions.min() < 0) or (actions.max() >= 4)):
+            raise IndexError('Actions must be in [0, 4)')
+        adjacency = self._adjacency
+        delta_x = self._delta_x
+        delta_y = self._delta_y
+        (goal_x, goal_y) = self.goal
+        (x, y) = (self._x, self._y)
+        tick = self.tick
+        xs = [ ]
+        ys = [ ]
+        rewards = [ ]
+        done = False
+        for action in actions.tolist():
+            tick += 1
+            if adjacency[y, x] & (1 << action):
+                x += delta_x[action]
+                y += delta_y[action]
+                if (x == goal_x) and (y == goal_y):
+                    rewards.append(self.goal_reward)
+                    done = True
+                else:
+                    rewards.append(self.step_reward)
+                    done = tick >= self.max_steps
+            else:
+                rewards.append(self.hit_wall_reward)
+                done = tick >= self.max_steps
+            xs.append(x)
+            ys.append(y)
+            if done:
+                break
+
+        (self._x, self._y) = (x, y)
+        self.tick = tick
+        count = len(rewards)
+        states = np.empty((count, 2), dtype = np.int32)
+        states[:, 0] = xs
+        states[:, 1] = ys
+        dones = np.zeros(count, dtype = np.bool_)
+        if done:
+            dones[-1] = True
+        return (states, np.asarray(rewards, dtype = np.float64), dones, count)
+
+    def action_mask(self, state = None):
+        """Return a read-only boolean array, indexed by action, that is True
+for the actions that do not bump into a wall in the given (x, y) state, or
+in the current state if state is None"""
+        (x, y) = (self._x, self._y) if state is None else state
+        return _ACTION_MASKS[self._adjacency[y, x]]
+
+    def action_masks(self, states):
+        """Vectorized action_mask() for an (n, 2) array of (x, y) states.
+Returns an (n, 4) boolean array."""
+        states = np.asarray(states)
+        return _ACTION_MASKS[self._adjacency[states[:, 1], states[:, 0]]]
+
+    @property
+    def adjacency_mask(self):
+        """The (height, width) uint8 array computed from the layout by
+compute_adjacency_mask()"""
+        return self._adjacency
 
     def render(self, mode = 'human'):
+        """Render the environment.  The "background" mode draws the same
+display as "human" mode, but from a BackgroundRenderer thread running at up
+to background_fps frames per second.  Each call only hands the agent's
+position to that thread and returns at once, so stepping is not slowed down
+by drawing."""
         if mode == 'human':
             return self._render_human()
+        elif mode == 'background':
+            return self._render_background()
         elif mode == 'ansi':
             return self._render_ansi()
+        elif mode == 'rgb_array':
+            return self._render_rgb_array()
         else:
             raise ValueError('Unknown rendering mode "%s"' % mode)
 
@@ -311,12 +614,83 @@ Arguments are:
         if self._renderer:
             self._renderer.close()
             self._renderer = None
+        if self._background:
+            self._background.stop()
+            self._background = None
+        self.release_layout()
 
     def seed(self, seed = None):
         if seed == None:
             seed = create_seed()
         (self.rng, self.seed) = np_random(seed)
 
+    def share_layout(self, path = None):
+        """Move the layout and its adjacency mask into read-only files
+mapped into memory, so that copies of the environment unpickled in other
+processes map the same files instead of carrying their own copies.  path is
+the name of the layout file, which is written with numpy.save(); the mask is
+written to path plus ".adjacency".  If path is None, a new file is created in
+/dev/shm, or in the temporary directory where there is no /dev/shm.  The
+files are removed by release_layout(), which close() calls, in the process
+that called share_layout(); copies in other processes keep their mappings.
+Returns path."""
+        if path is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') \
+                            else tempfile.gettempdir()
+            (fd, path) = tempfile.mkstemp(prefix = 'pegushi-maze-',
+                                          suffix = '.npy', dir = directory)
+            os.close(fd)
+        for (name, values) in ((path, self._layout),
+                               (path + '.adjacency', self._adjacency)):
+            mapped = np.lib.format.open_memmap(name, mode = 'w+',
+                                               dtype = values.dtype,
+                                               shape = values.shape)
+            mapped[...] = values
+            mapped.flush()
+            del mapped
+        self._layout_path = path
+        self._layout_owner = os.getpid()
+        (self._layout, self._adjacency) = _map_shared_layout(path)
+        self._layout_changed()
+        return path
+
+    def release_layout(self):
+        """Remove the files written by share_layout(), if this environment
+wrote them in this process.  The layout stays mapped, so the environment
+can still be used, but it is no longer shared: copies pickled afterwards
+carry the layout itself.  Copies already unpickled keep their mappings, but
+pickles made while the layout was shared can no longer be loaded."""
+        if self._layout_path and (self._layout_owner == os.getpid()):
+            for name in (self._layout_path,
+                         self._layout_path + '.adjacency'):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            self._layout_path = None
+            self._layout_owner = None
+
+    def __getstate__(self):
+        # Rendering state is dropped and, if the layout is shared, only the
+        # name of its file is kept
+        state = dict(self.__dict__)
+        for name in ('_renderer', '_background', '_rgb_background',
+                     '_solver', '_viewport'):
+            state[name] = None
+        if isinstance(self._agent_image, pygame.Surface):
+            state['_agent_image'] = None
+        state['_layout_owner'] = None
+        if state.get('_layout_path'):
+            del state['_layout']
+            del state['_adjacency']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if state.get('_layout_path'):
+            (self._layout, self._adjacency) = \
+                _map_shared_layout(self._layout_path)
+
     @property
     def current_state(self):
         return (self._x, self._y)
@@ -325,7 +699,23 @@ Arguments are:
         self._x = x
         self._y = y
 
-    def compute_solution_path(self):
+    def save_state(self):
+        """Return the agent's position and the tick, for restore_state()"""
+        return (self._x, self._y, self.tick)
+
+    def restore_state(self, saved):
+        (self._x, self._y, self.tick) = saved
+
+    def compute_solution_path(self, method = 'dijkstra'):
+        """Return the shortest path from the start to the goal as a tuple
+of (x, y) cells.  method is one of the methods supported by
+MazeSolver.find_path(), or "dijkstra"."""
+        if method != 'dijkstra':
+            path = self._get_solver().find_path(self.start, self.goal, method)
+            if path is None:
+                raise RuntimeError('Could not find a solution')
+            return path
+
         _, prior = self._compute_solution()
         path = [ self.goal ]
         current = self.goal
@@ -335,9 +725,40 @@ Arguments are:
         path.reverse()
         return tuple(path)
 
-    def compute_solution_length(self):
+    def compute_solution_length(self, method = 'dijkstra'):
+        if method != 'dijkstra':
+            length = self._get_solver().path_length(self.start, self.goal,
+                                                    method)
+            if length < 0:
+                raise RuntimeError('Could not find a solution')
+            return length
+
         distance, _ = self._compute_solution()
         return distance
+
+    def _get_viewport(self):
+        if self._viewport is None:
+            self._viewport = MazeViewport(self._layout, self.goal,
+                                          self.tile_size, self.viewport)
+        return self._viewport
+
+    def _layout_changed(self):
+        # Drop everything derived from the layout and redraw
+        self._solver = None
+        self._rgb_background = None
+        self._viewport = None
+        if self._renderer:
+            if self.viewport:
+                self._renderer.viewport = self._get_viewport()
+            self._renderer.draw((self._x, self._y, 0, 0))
+        if self._background:
+            self._background.request_redraw()
+
+    def _get_solver(self):
+        # Created on first use, then reused so its buffers are allocated once
+        if self._solver is None:
+            self._solver = MazeSolver(self._layout)
+        return self._solver
     
     def _compute_solution(self):
         def next_states(x, y):
@@ -397,13 +818,24 @@ Arguments are:
                 self._renderer.move_agent(self._last_rendered_position, pos)
                 self._last_rendered_position = pos
         else:
-            self._renderer = \
-                _FixedMazeEnvironmentDisplay(self._layout, 24,
-                                             goal_location = self.goal,
-                                             agent_image = self._agent_image)
+            self._renderer = self._create_display()
             pos = (self._x, self._y, 0, 0)
             self._renderer.draw(pos)
             self._last_rendered_position = pos
+
+    def _render_background(self):
+        if not self._background:
+            self._background = BackgroundRenderer(self._create_display,
+                                                  self.background_fps)
+            self._background.start()
+        self._background.publish((self._x, self._y))
+
+    def _create_display(self):
+        if self.viewport:
+            return _ViewportDisplay(self._get_viewport())
+        return _FixedMazeEnvironmentDisplay(self._layout, self.tile_size,
+                                            goal_location = self.goal,
+                                            agent_image = self._agent_image)
             
     def _render_ansi(self):
         def wall1_index(y, x):
@@ -426,6 +858,197 @@ Arguments are:
         law_row = '*' + ('**' * self._layout.shape[1])
         return '\n'.join(walls(y) for y in rows) + '\n' + law_row
 
+    def _render_rgb_array(self):
+        if self.viewport:
+            return self._get_viewport().render((self._x, self._y))
+
+        # The walls and goal never change, so draw them once and paint
+        # the agent onto a copy for each frame
+        if self._rgb_background is None:
+            self._rgb_background = \
+                render_layout_rgb(self._layout, self.tile_size)
+            self._paint_rgb_tile(self._rgb_background, self.goal,
+                                 _GOAL_COLOR)
+        frame = self._rgb_background.copy()
+        self._paint_rgb_tile(frame, (self._x, self._y), _AGENT_COLOR)
+        return frame
+
+    def _paint_rgb_tile(self, frame, location, color):
+        row = 2 * (self._layout.shape[0] - location[1]) - 1
+        col = 2 * location[0] + 1
+        frame[row * self.tile_size:(row + 1) * self.tile_size,
+              col * self.tile_size:(col + 1) * self.tile_size] = color
+
+def layout_checksum(layout):
+    """CRC-32 of a layout's cells, for checking that data saved for a
+layout is used with the same layout"""
+    return zlib.crc32(np.ascontiguousarray(layout).tobytes()) & 0xffffffff
+
+def _map_shared_layout(path):
+    # Map the files written by FixedMazeEnvironment.share_layout()
+    return (np.load(path, mmap_mode = 'r'),
+            np.load(path + '.adjacency', mmap_mode = 'r'))
+
+class MazeSolver:
+    """Shortest-path search on a maze layout with scratch buffers that are
+allocated once and reused by every query.  Cells are flat indices
+y * width + x.  Each query records the cells it labels and resets only those
+afterwards, so a query between nearby cells costs time proportional to the
+region it explores rather than to the size of the maze.
+
+Supported methods are:
+    astar          A* with the Manhattan distance to the goal as heuristic
+    bidirectional  Breadth-first search from both ends at once, expanding
+                   the smaller frontier first
+"""
+    METHODS = ('astar', 'bidirectional')
+
+    def __init__(self, layout):
+        (self.height, self.width) = layout.shape
+        n = self.height * self.width
+
+        # Scalar indexing into array.array and bytearray is much faster than
+        # into numpy arrays
+        self._adjacency = \
+            bytearray(compute_adjacency_mask(layout).tobytes())
+        self._distance = array.array('i', [ -1 ]) * n
+        self._prior = array.array('i', [ -1 ]) * n
+        self._back_distance = array.array('i', [ -1 ]) * n
+        self._back_prior = array.array('i', [ -1 ]) * n
+        self._touched = [ ]
+
+    def find_path(self, start, goal, method = 'astar'):
+        """Return the shortest path from start to goal as a tuple of (x, y)
+cells, or None if the goal cannot be reached"""
+        result = self._search(start, goal, method)
+        try:
+            if result is None:
+                return None
+            (forward_end, backward_end) = result
+            cells = [ ]
+            i = forward_end
+            while i >= 0:
+                cells.append(i)
+                i = self._prior[i]
+            cells.reverse()
+            i = self._back_prior[backward_end] if backward_end >= 0 else -1
+            while i >= 0:
+                cells.append(i)
+                i = self._back_prior[i]
+            return tuple((i % self.width, i // self.width) for i in cells)
+        finally:
+            self._reset()
+
+    def path_length(self, start, goal, method = 'astar'):
+        """Return the length of the shortest path from start to goal, or -1
+if the goal cannot be reached"""
+        result = self._search(start, goal, method)
+        try:
+            if result is None:
+                return -1
+            (forward_end, backward_end) = result
+            if backward_end < 0:
+                return self._distance[forward_end]
+            return self._distance[forward_end] + \
+                       self._back_distance[backward_end]
+        finally:
+            self._reset()
+
+    def _search(self, start, goal, method):
+        # Returns (i, j) where the path runs from the start to cell i along
+        # self._prior and, if j >= 0, from cell j to the goal along
+        # self._back_prior.  Returns None if there is no path.
+        s = start[1] * self.width + start[0]
+        g = goal[1] * self.width + goal[0]
+        if method == 'astar':
+            return self._astar(s, g)
+        elif method == 'bidirectional':
+            return self._bidirectional(s, g)
+        raise ValueError('Unknown method "%s"' % method)
+
+    def _astar(self, s, g):
+        width = self.width
+        adjacency = self._adjacency
+        distance = self._distance
+        prior = self._prior
+        touched = self._touched
+        (goal_y, goal_x) = divmod(g, width)
+
+        distance[s] = 0
+        touched.append(s)
+        (y, x) = divmod(s, width)
+        # Ties go to the entry furthest from the start
+        heap = [ (abs(x - goal_x) + abs(y - goal_y), 0, s) ]
+        while heap:
+            (_, d, i) = heapq.heappop(heap)
+            if i == g:
+                return (g, -1)
+            d = -d
+            if d > distance[i]:
+                continue
+            d += 1
+            mask = adjacency[i]
+            for (bit, j) in ((NORTH_OPEN, i + width), (EAST_OPEN, i + 1),
+                             (SOUTH_OPEN, i - width), (WEST_OPEN, i - 1)):
+                if (mask & bit) and ((distance[j] < 0) or (d < distance[j])):
+                    if distance[j] < 0:
+                        touched.append(j)
+                    distance[j] = d
+                    prior[j] = i
+                    (y, x) = divmod(j, width)
+                    heapq.heappush(heap, (d + abs(x - goal_x) + \
+                                              abs(y - goal_y), -d, j))
+        return None
+
+    def _bidirectional(self, s, g):
+        width = self.width
+        adjacency = self._adjacency
+        touched = self._touched
+        self._distance[s] = 0
+        self._back_distance[g] = 0
+        touched.append(s)
+        touched.append(g)
+        if s == g:
+            return (s, -1)
+
+        frontiers = [ [ s ], [ g ] ]
+        sides = ((self._distance, self._prior, self._back_distance),
+                 (self._back_distance, self._back_prior, self._distance))
+        (best, meet) = (-1, -1)
+        while frontiers[0] and frontiers[1]:
+            # Expand one whole level of the smaller frontier.  Once a level
+            # finds a cell the other side has labeled, the shortest of the
+            # paths through such cells is a shortest path.
+            k = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            (distance, prior, other) = sides[k]
+            next_frontier = [ ]
+            for i in frontiers[k]:
+                d = distance[i] + 1
+                mask = adjacency[i]
+                for (bit, j) in ((NORTH_OPEN, i + width), (EAST_OPEN, i + 1),
+                                 (SOUTH_OPEN, i - width), (WEST_OPEN, i - 1)):
+                    if (mask & bit) and (distance[j] < 0):
+                        distance[j] = d
+                        prior[j] = i
+                        touched.append(j)
+                        next_frontier.append(j)
+                        if (other[j] >= 0) and \
+                           ((best < 0) or (d + other[j] < best)):
+                            (best, meet) = (d + other[j], j)
+            frontiers[k] = next_frontier
+            if best >= 0:
+                # Both sides have labeled the meeting cell
+                return (meet, meet)
+        return None
+
+    def _reset(self):
+        for i in self._touched:
+            self._distance[i] = -1
+            self._prior[i] = -1
+            self._back_distance[i] = -1
+            self._back_prior[i] = -1
+        del self._touched[:]
+
 def _generate_random_maze(width, height, algorithm, rng):
     if algorithm == 'kruskal':
         return _generate_random_maze_kruskal(width, height, rng)
@@ -511,6 +1134,74 @@ def generate_random_maze(width, height, algorithm = 'kruskal', rng = None,
         (rng, _) = np_random(seed)
     return _generate_random_maze(width, height, algorithm, rng)
 
+def compute_adjacency_mask(layout):
+    """Compute which of the four actions are open in every cell of a maze
+layout.  Returns a uint8 array with the same (height, width) shape as the
+layout, indexed [y, x], where bit i is set if action i (north, east, south,
+west) moves the agent rather than bumping into a wall.  The south and west
+bits come from the cells below and to the left, as in
+FixedMazeEnvironment._can_move_south() and _can_move_west()."""
+    mask = np.zeros(layout.shape, dtype = np.uint8)
+    mask[(layout & 0x2) != 0] |= NORTH_OPEN
+    mask[(layout & 0x1) != 0] |= EAST_OPEN
+    mask[1:, :][(layout[:-1, :] & 0x2) != 0] |= SOUTH_OPEN
+    mask[:, 1:][(layout[:, :-1] & 0x1) != 0] |= WEST_OPEN
+    return mask
+
+def compute_distance_field(layout, goal):
+    """Compute the length of the shortest path from every cell of a maze
+layout to the goal with a breadth-first search outward from the goal.
+Returns an int32 array with the same (height, width) shape as the layout,
+indexed [y, x], holding -1 for cells that cannot reach the goal."""
+    (height, width) = layout.shape
+    flat = layout.ravel()
+    distance = np.full(height * width, -1, dtype = np.int32)
+    start = goal[1] * width + goal[0]
+    distance[start] = 0
+    queue = collections.deque((start, ))
+    while queue:
+        i = queue.popleft()
+        d = distance[i] + 1
+        (y, x) = divmod(i, width)
+        neighbors = [ ]
+        if flat[i] & 0x2:
+            neighbors.append(i + width)
+        if flat[i] & 0x1:
+            neighbors.append(i + 1)
+        if (y > 0) and (flat[i - width] & 0x2):
+            neighbors.append(i - width)
+        if (x > 0) and (flat[i - 1] & 0x1):
+            neighbors.append(i - 1)
+        for j in neighbors:
+            if distance[j] < 0:
+                distance[j] = d
+                queue.append(j)
+    return distance.reshape((height, width))
+
+def render_layout_rgb(layout, tile_size = 1, wall_color = _WALL_COLOR,
+                      open_space_color = _OPEN_SPACE_COLOR):
+    """Draw a maze layout as a (height, width, 3) uint8 image with the same
+geometry as the "human" rendering mode: (2 * layout.shape[0] + 1) rows and
+(2 * layout.shape[1] + 1) columns of tiles, each tile_size pixels square,
+with y increasing towards the top of the image."""
+    walls = _layout_walls(layout)
+    image = np.empty(walls.shape + (3, ), dtype = np.uint8)
+    image[walls] = wall_color
+    image[~walls] = open_space_color
+    if tile_size > 1:
+        image = image.repeat(tile_size, axis = 0).repeat(tile_size, axis = 1)
+    return image
+
+def _layout_walls(layout):
+    # Boolean array of the tiles of render_layout_rgb() that are walls
+    h, w = layout.shape
+    flipped = layout[::-1]
+    walls = np.ones((2 * h + 1, 2 * w + 1), dtype = np.bool_)
+    walls[1:2 * h:2, 1:2 * w:2] = False
+    walls[1:2 * h:2, 2:2 * w + 1:2] = (flipped & 0x1) == 0
+    walls[0:2 * h:2, 1:2 * w:2] = (flipped & 0x2) == 0
+    return walls
+
 def _load_or_create_solid_tile(tile_size, tile_image, tile_color):
     if isinstance(tile_image, str) or isinstance(tile_image, unicode):
         tile_image = pygame.image.load(tile_image)
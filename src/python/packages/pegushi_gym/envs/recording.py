@@ -0,0 +1,251 @@
+"""Recording episodes as frames.
+
+RecordingWrapper captures frames from an environment's "rgb_array"
+rendering mode, which draws offscreen, and hands them to an
+AsyncFrameWriter.  The writer's thread passes them on to a
+FrameArchiveWriter, which saves them in compressed chunks, or to a
+VideoWriter, which encodes one video per episode.  The queue between the
+environment and the thread has a fixed size, so a slow writer costs dropped
+frames rather than memory or training time."""
+
+import gym
+import numpy as np
+import os
+import Queue
+import threading
+
+class FrameArchiveWriter:
+    def __init__(self, directory, frames_per_file = 256):
+        """Create a new FrameArchiveWriter.
+Arguments are:
+    directory        str; Directory the archive is written to.  It is
+                     created if it does not exist.
+
+    frames_per_file  int; Number of frames saved in each file.  Every file
+                     is written with numpy.savez_compressed() and holds
+                     arrays "frames", "episodes" and "steps".
+"""
+        if frames_per_file < 1:
+            raise ValueError('frames_per_file must be > 0')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.frames_per_file = frames_per_file
+        self.num_files = 0
+        self._frames = [ ]
+        self._episodes = [ ]
+        self._steps = [ ]
+
+    def write(self, episode, step, frame):
+        self._frames.append(frame)
+        self._episodes.append(episode)
+        self._steps.append(step)
+        if len(self._frames) >= self.frames_per_file:
+            self.flush()
+
+    def end_episode(self, episode):
+        pass
+
+    def flush(self):
+        if not self._frames:
+            return
+        path = os.path.join(self.directory, 'frames_%06d.npz' % self.num_files)
+        np.savez_compressed(path, frames = np.stack(self._frames),
+                            episodes = np.asarray(self._episodes,
+                                                  dtype = np.int32),
+                            steps = np.asarray(self._steps, dtype = np.int32))
+        self.num_files += 1
+        self._frames = [ ]
+        self._episodes = [ ]
+        self._steps = [ ]
+
+    def close(self):
+        self.flush()
+
+def read_frame_archive(directory):
+    """Generate the (episode, step, frame) tuples saved by a
+FrameArchiveWriter in the order they were written, loading one file at a
+time"""
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith('frames_') and name.endswith('.npz'))
+    for name in names:
+        data = np.load(os.path.join(directory, name))
+        try:
+            (frames, episodes, steps) = \
+                (data['frames'], data['episodes'], data['steps'])
+        finally:
+            data.close()
+        for i in xrange(0, len(frames)):
+            yield (int(episodes[i]), int(steps[i]), frames[i])
+
+class VideoWriter:
+    def __init__(self, path_pattern, fps = 30, **kwargs):
+        """Create a new VideoWriter.  It needs the imageio package.
+Arguments are:
+    path_pattern  str; Name of the video file for each episode, with a %d
+                  that is replaced by the episode number, such as
+                  "episode_%04d.mp4".  The extension selects the format.
+
+    fps           float; Frames per second of the videos
+
+    kwargs        Any other arguments are passed to imageio.get_writer()
+"""
+        import imageio
+        self._get_writer = imageio.get_writer
+        self.path_pattern = path_pattern
+        self.fps = fps
+        self.kwargs = kwargs
+        self._episode = None
+        self._video = None
+
+    def write(self, episode, step, frame):
+        if episode != self._episode:
+            self.end_episode(self._episode)
+            self._video = self._get_writer(self.path_pattern % episode,
+                                           fps = self.fps, **self.kwargs)
+            self._episode = episode
+        self._video.append_data(frame)
+
+    def end_episode(self, episode):
+        if self._video is not None:
+            self._video.close()
+            self._video = None
+            self._episode = None
+
+    def close(self):
+        self.end_episode(self._episode)
+
+class AsyncFrameWriter:
+    def __init__(self, writer, max_queued_frames = 64, block = False):
+        """Create a new AsyncFrameWriter and start its thread.
+Arguments are:
+    writer             FrameArchiveWriter or VideoWriter; Receives the
+                       frames on the writer's thread.  Any object with
+                       write(episode, step, frame), end_episode(episode) and
+                       close() methods will do.
+
+    max_queued_frames  int; Maximum number of frames waiting to be written
+
+    block              bool; If True, record() waits for room in the queue
+                       when it is full.  If False, the frame is dropped and
+                       counted in frames_dropped.
+"""
+        if max_queued_frames < 1:
+            raise ValueError('max_queued_frames must be > 0')
+        self.writer = writer
+        self.block = block
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self._queue = Queue.Queue(max_queued_frames)
+        self._error = None
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def record(self, episode, step, frame):
+        """Queue a frame.  The writer may still be using the frame after
+this returns, so do not modify it.  Returns False if it was dropped."""
+        try:
+            self._queue.put((episode, step, frame), self.block)
+            return True
+        except Queue.Full:
+            self.frames_dropped += 1
+            return False
+
+    def end_episode(self, episode):
+        # Never dropped, since the writer needs it to finish the episode
+        self._queue.put((episode, None, None))
+
+    def close(self):
+        """Write the queued frames, close the writer and stop the thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self.writer.close()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                # Keep draining the queue so record() never blocks forever
+                continue
+            (episode, step, frame) = item
+            try:
+                if frame is None:
+                    self.writer.end_episode(episode)
+                else:
+                    self.writer.write(episode, step, frame)
+                    self.frames_written += 1
+            except Exception as e:
+                self._error = e
+
+class RecordingWrapper(gym.Wrapper):
+    def __init__(self, env, writer, frame_skip = 1, episode_interval = 1):
+        """Create a new RecordingWrapper.
+Arguments are:
+    env               gym.Env; Environment to record.  It must support the
+                      "rgb_array" rendering mode and return a new array for
+                      every frame, as FixedMazeEnvironment does.
+
+    writer            AsyncFrameWriter; Receives the frames.  close() closes
+                      it.
+
+    frame_skip        int; Record every frame_skip-th step of a recorded
+                      episode.  The frames after reset() and after the last
+                      step are always recorded.
+
+    episode_interval  int; Record every episode_interval-th episode,
+                      starting with the first
+"""
+        gym.Wrapper.__init__(self, env)
+        if frame_skip < 1:
+            raise ValueError('frame_skip must be > 0')
+        if episode_interval < 1:
+            raise ValueError('episode_interval must be > 0')
+        self.writer = writer
+        self.frame_skip = frame_skip
+        self.episode_interval = episode_interval
+        self.episode = -1
+        self.recording = False
+        self._step = 0
+
+    def reset(self, **kwargs):
+        self._end_episode()
+        state = self.env.reset(**kwargs)
+        self.episode += 1
+        self.recording = (self.episode % self.episode_interval) == 0
+        self._step = 0
+        if self.recording:
+            self._capture()
+        return state
+
+    def step(self, action):
+        result = self.env.step(action)
+        self._step += 1
+        if self.recording and (result[2] or
+                               (self._step % self.frame_skip == 0)):
+            self._capture()
+        return result
+
+    def close(self):
+        self._end_episode()
+        self.writer.close()
+        return self.env.close()
+
+    def _capture(self):
+        self.writer.record(self.episode, self._step,
+                           self.env.render('rgb_array'))
+
+    def _end_episode(self):
+        if self.recording:
+            self.writer.end_episode(self.episode)
+            self.recording = False
@@ -0,0 +1,103 @@
+"""Rendering on a background thread.
+
+BackgroundRenderer owns a display and draws it from its own thread at no
+more than a fixed frame rate.  The thread that steps the environment only
+publishes the agent's position into a single slot, which is a plain
+attribute holding a (sequence number, position) tuple.  Replacing the tuple
+is atomic, so neither side ever takes a lock or waits for the other.
+Positions published faster than the frame rate simply overwrite each other,
+so stepping runs at full speed however slowly the display updates."""
+
+import pygame
+import threading
+import time
+
+class BackgroundRenderer:
+    def __init__(self, display_factory, max_fps = 30):
+        """Create a new BackgroundRenderer.
+Arguments are:
+    display_factory  callable; Called with no arguments on the render thread
+                     to create the display.  The display must have
+                     draw(location), move_agent(old, new) and close()
+                     methods taking (x, y, 0, 0) locations, as the displays
+                     used by FixedMazeEnvironment do.
+
+    max_fps          float; Maximum number of frames drawn per second
+"""
+        if max_fps <= 0:
+            raise ValueError('max_fps must be > 0')
+        self.display_factory = display_factory
+        self.max_fps = max_fps
+
+        # (sequence number, (x, y) position).  Only publish() writes it.
+        self._slot = (0, None)
+
+        # Incremented by request_redraw()
+        self._generation = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Updated by the render thread
+        self.frames_drawn = 0
+        self.last_drawn = None
+
+    @property
+    def running(self):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def publish(self, position):
+        """Make (x, y) position the next one drawn"""
+        self._slot = (self._slot[0] + 1, tuple(position))
+
+    def request_redraw(self):
+        """Recreate the display and redraw everything, for instance after
+the layout changes"""
+        self._generation += 1
+
+    def start(self):
+        if self.running:
+            raise RuntimeError('The render thread is already running')
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the render thread and close its display"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        interval = 1.0 / self.max_fps
+        display = self.display_factory()
+        generation = self._generation
+        (drawn, last) = (None, None)
+        try:
+            while not self._stop.is_set():
+                start = time.time()
+                if generation != self._generation:
+                    generation = self._generation
+                    display.close()
+                    display = self.display_factory()
+                    (drawn, last) = (None, None)
+
+                (sequence, position) = self._slot
+                if (sequence != drawn) and (position is not None):
+                    location = (position[0], position[1], 0, 0)
+                    if last is None:
+                        display.draw(location)
+                    else:
+                        display.move_agent(last, location)
+                    (drawn, last) = (sequence, location)
+                    self.frames_drawn += 1
+                    self.last_drawn = position
+
+                # Keep the window responsive
+                if pygame.display.get_init():
+                    pygame.event.pump()
+                self._stop.wait(max(0.0, interval - (time.time() - start)))
+        finally:
+            display.close()
@@ -0,0 +1 @@
+"""Reinforcement learning algorithms for the Pegushi project."""
@@ -0,0 +1,320 @@
+"""Actor-learner pipeline for tabular Q-learning.
+
+Actor threads step their own environments with a snapshot of the Q function
+and push batches of transitions into a bounded queue.  The learner, which
+runs on the caller's thread, pulls batches off the queue, applies batched
+Q-learning updates to the live Q function and periodically publishes a fresh
+snapshot for the actors.  When the learner falls behind the queue fills up
+and the actors block, so the queue bounds how stale the data the learner
+sees can get.  PipelineMetrics records how much time each side spends
+waiting on the other."""
+
+from pegushi_rl.runner import derive_seed
+from gym.utils.seeding import np_random
+
+import Queue
+import numpy as np
+import threading
+import time
+
+class TransitionBatch:
+    """Transitions collected by one actor with one snapshot of the Q
+function.  version is the version of that snapshot."""
+    def __init__(self, states, actions, rewards, next_states, version):
+        self.states = states
+        self.actions = actions
+        self.rewards = rewards
+        self.next_states = next_states
+        self.version = version
+
+    def __len__(self):
+        return len(self.actions)
+
+class PipelineMetrics:
+    """Counters describing the balance between actors and learner.
+Attributes are:
+    transitions       int; Transitions consumed by the learner
+
+    batches           int; Batches consumed by the learner
+
+    snapshots         int; Snapshots published by the learner
+
+    actor_wait        float; Total seconds actors spent blocked on a full
+                      queue.  Large values mean the learner is the
+                      bottleneck.
+
+    learner_wait      float; Total seconds the learner spent waiting on an
+                      empty queue.  Large values mean the actors are the
+                      bottleneck.
+
+    queue_depths      list[int]; Queue depth seen by the learner each time
+                      it took a batch
+
+    staleness         list[int]; How many snapshots old each batch's
+                      policy was when the learner consumed it
+"""
+    def __init__(self):
+        self.transitions = 0
+        self.batches = 0
+        self.snapshots = 0
+        self.actor_wait = 0.0
+        self.learner_wait = 0.0
+        self.queue_depths = [ ]
+        self.staleness = [ ]
+        self._lock = threading.Lock()
+
+    @property
+    def mean_queue_depth(self):
+        return np.mean(self.queue_depths) if self.queue_depths else 0.0
+
+    @property
+    def max_queue_depth(self):
+        return max(self.queue_depths) if self.queue_depths else 0
+
+    @property
+    def mean_staleness(self):
+        return np.mean(self.staleness) if self.staleness else 0.0
+
+    def add_actor_wait(self, seconds):
+        # Several actors update this concurrently
+        with self._lock:
+            self.actor_wait += seconds
+
+    def summary(self):
+        return ('transitions: %d  batches: %d  snapshots: %d  ' + \
+                'queue depth: %.2f mean %d max  staleness: %.2f  ' + \
+                'actor wait: %.3fs  learner wait: %.3fs') % \
+            (self.transitions, self.batches, self.snapshots,
+             self.mean_queue_depth, self.max_queue_depth,
+             self.mean_staleness, self.actor_wait, self.learner_wait)
+
+class ActorLearnerPipeline:
+    def __init__(self, envs, q_function, alpha = 0.1, gamma = 0.5,
+                 batch_size = 64, queue_size = 8, publish_interval = 16,
+                 publish_period = 1.0, replay_memory = None, seed = 0):
+        """Create a new ActorLearnerPipeline.
+Arguments are:
+    envs              list[FixedMazeEnvironment or equivalent]; One
+                      environment per actor.  Each actor gets a thread.
+
+    q_function        TabularQFunction or equivalent; The Q function being
+                      learned.  Only the learner touches it.  Actors act
+                      with snapshots made by its copy() method.
+
+    alpha             float; Learning rate
+
+    gamma             float; Discount rate
+
+    batch_size        int; Maximum number of transitions in a batch.
+                      Actors also send a batch at the end of each episode.
+
+    queue_size        int; Maximum number of batches waiting for the
+                      learner
+
+    publish_interval  int; Number of batches the learner consumes between
+                      snapshots, or None to only publish every
+                      publish_period seconds.  Publishing copies the whole
+                      Q function, which takes time proportional to the
+                      size of the maze rather than of a batch, so on large
+                      mazes this should be raised until copying takes a
+                      small share of the learner's time.
+
+    publish_period    float; Maximum number of seconds between snapshots,
+                      or None to only publish every publish_interval
+                      batches.  Checked after each batch.
+
+    replay_memory     ReplayMemory or equivalent; If not None, the learner
+                      adds incoming transitions to this memory and updates
+                      from its minibatches instead of the incoming batches.
+                      A PrioritizedReplayMemory also gets its priorities
+                      updated and its importance-sampling weights applied
+                      to the learning rate.
+
+    seed              int; Each actor seeds its RNG with a seed derived from
+                      this one and its actor number
+"""
+        if not envs:
+            raise ValueError('At least one environment is required')
+        if (publish_interval is None) and (publish_period is None):
+            raise ValueError('publish_interval and publish_period cannot '
+                             'both be None')
+        self.envs = envs
+        self.q_function = q_function
+        self.alpha = alpha
+        self.gamma = gamma
+        self.batch_size = batch_size
+        self.publish_interval = publish_interval
+        self.publish_period = publish_period
+        self.replay_memory = replay_memory
+        self.seed = seed
+        self.metrics = PipelineMetrics()
+
+        self._queue = Queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._threads = [ ]
+
+        # (version, snapshot).  Replacing the tuple is atomic, so actors
+        # always see a consistent pair without taking a lock.
+        self._published = (0, q_function.copy())
+        self._last_publish = (0, time.time())
+
+    @property
+    def version(self):
+        return self._published[0]
+
+    def run(self, num_transitions = None, duration = None):
+        """Run actors and learner until the learner has consumed
+num_transitions transitions or duration seconds have passed, whichever
+comes first.  Returns the metrics."""
+        if (num_transitions is None) and (duration is None):
+            raise ValueError('One of num_transitions or duration is required')
+        deadline = time.time() + duration if duration is not None else None
+        self.start()
+        try:
+            self._learn(num_transitions, deadline)
+        finally:
+            self.stop()
+        return self.metrics
+
+    def start(self):
+        """Start the actor threads.  The caller then runs the learner by
+calling learn_batch() repeatedly and calls stop() when done.  run() does all
+of this."""
+        if self._threads:
+            raise RuntimeError('Actors are already running')
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target = self._act, args = (i, env))
+            for (i, env) in enumerate(self.envs) ]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    def stop(self):
+        # Actors blocked on a full queue check the stop flag periodically
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        self._threads = [ ]
+
+        # Discard batches collected with the old snapshots
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Queue.Empty:
+            pass
+
+    def learn_batch(self, timeout = None):
+        """Take one batch off the queue and learn from it.  Returns the
+batch, or None if no batch arrived within timeout seconds."""
+        depth = self._queue.qsize()
+        start = time.time()
+        try:
+            batch = self._queue.get(True, timeout)
+        except Queue.Empty:
+            self.metrics.learner_wait += time.time() - start
+            return None
+        self.metrics.learner_wait += time.time() - start
+        self.metrics.queue_depths.append(depth)
+        self.metrics.staleness.append(self.version - batch.version)
+
+        if self.replay_memory is None:
+            self._update(batch.states, batch.actions, batch.rewards,
+                         batch.next_states)
+        else:
+            self._update_from_replay(batch)
+
+        self.metrics.batches += 1
+        self.metrics.transitions += len(batch)
+        (batches, published_at) = self._last_publish
+        if ((self.publish_interval is not None) and
+            (self.metrics.batches - batches >= self.publish_interval)) or \
+           ((self.publish_period is not None) and
+            (time.time() - published_at >= self.publish_period)):
+            self._publish()
+        return batch
+
+    def _learn(self, num_transitions, deadline):
+        while (num_transitions is None) or \
+              (self.metrics.transitions < num_transitions):
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0.0:
+                    break
+                self.learn_batch(min(remaining, 0.1))
+            else:
+                self.learn_batch(0.1)
+
+    def _update(self, states, actions, rewards, next_states, weights = None):
+        # Bootstraps from every next state, as QLearner does
+        xs = states[:, 0]
+        ys = states[:, 1]
+        targets = rewards + self.gamma * \
+                      self.q_function.max_q_batch(next_states[:, 0],
+                                                  next_states[:, 1])
+        td_errors = targets - self.q_function(xs, ys, actions)
+        alpha = self.alpha if weights is None else self.alpha * weights
+        self.q_function.update_batch(xs, ys, actions, targets, alpha)
+        return td_errors
+
+    def _update_from_replay(self, batch):
+        memory = self.replay_memory
+        for i in xrange(0, len(batch)):
+            memory.add_experience(batch.states[i], batch.actions[i],
+                                  batch.rewards[i], batch.next_states[i],
+                                  False)
+        (states, actions, rewards, next_states, _) = memory.get_minibatch()
+        weights = getattr(memory, 'weights', None)
+        td_errors = self._update(states, actions, rewards, next_states,
+                                 weights)
+        if hasattr(memory, 'update_priorities'):
+            memory.update_priorities(memory.indices, td_errors)
+
+    def _publish(self):
+        self._published = (self.version + 1, self.q_function.copy())
+        self._last_publish = (self.metrics.batches, time.time())
+        self.metrics.snapshots += 1
+
+    def _act(self, actor_index, env):
+        (rng, _) = np_random(derive_seed(self.seed, 'actor', actor_index))
+        (version, policy) = (None, None)
+
+        n = self.batch_size
+        states = np.empty((n, 2), dtype = np.int32)
+        actions = np.empty(n, dtype = np.int32)
+        rewards = np.empty(n, dtype = np.float64)
+        next_states = np.empty((n, 2), dtype = np.int32)
+
+        state = env.reset()
+        count = 0
+        while not self._stop.is_set():
+            if self._published[0] != version:
+                (version, snapshot) = self._published
+                policy = snapshot.with_rng(rng)
+
+            action = policy.select_soft(*state)
+            (next_state, reward, done, _) = env.step(action)
+            states[count] = state
+            actions[count] = action
+            rewards[count] = reward
+            next_states[count] = next_state
+            count += 1
+            state = env.reset() if done else next_state
+
+            if done or (count == n):
+                batch = TransitionBatch(states[:count].copy(),
+                                        actions[:count].copy(),
+                                        rewards[:count].copy(),
+                                        next_states[:count].copy(), version)
+                self._put(batch)
+                count = 0
+
+    def _put(self, batch):
+        start = time.time()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(batch, True, 0.1)
+                break
+            except Queue.Full:
+                pass
+        self.metrics.add_actor_wait(time.time() - start)
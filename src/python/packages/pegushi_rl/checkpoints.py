@@ -0,0 +1,211 @@
+"""Incremental checkpoints of Q functions and training state.
+
+A Checkpointer saves a Q function to a directory one piece at a time: the
+chunks of a ChunkedTabularQFunction, or blocks of block_rows x-coordinates
+of a TabularQFunction's table.  Each checkpoint only writes the pieces that
+changed since the previous one.  A ChunkedTabularQFunction tracks the chunks
+it writes.  For a TabularQFunction, a CRC-32 of every block is compared with
+the one saved last time.
+
+Every piece is written to a new file, which is renamed into place once it
+is complete, and the checkpoint is committed by renaming a new manifest over
+the old one.  The manifest lists the file of every piece along with the RNG
+state of the Q function, the episode number, the environment's seed and RNG
+state and any extra values given.  A crash at any point therefore leaves the
+previous checkpoint intact, and files the manifest no longer lists are
+removed only after it is committed.  restore() reads the pieces one at a
+time, so it never holds more than one file open."""
+
+from pegushi_rl.q_functions import ChunkedTabularQFunction, TabularQFunction
+
+import cPickle
+import numpy as np
+import os
+import zlib
+
+class Checkpointer:
+    def __init__(self, directory, block_rows = 64, fsync = True):
+        """Create a new Checkpointer.
+Arguments are:
+    directory   str; Directory the checkpoints are written to.  If it
+                already holds a checkpoint, the next checkpoint builds on
+                it.
+
+    block_rows  int; Number of x-coordinates in each block of a
+                TabularQFunction's table
+
+    fsync       bool; If True, wait for every file to reach the disk before
+                renaming it, and for the directory to record the renames,
+                so that a checkpoint also survives a power failure.
+                Checkpoints are atomic either way.
+"""
+        if block_rows < 1:
+            raise ValueError('block_rows must be > 0')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.block_rows = block_rows
+        self.fsync = fsync
+        self.manifest = _read_manifest(directory)
+
+        # Statistics of the last call to save()
+        self.pieces_written = 0
+        self.bytes_written = 0
+
+    @property
+    def exists(self):
+        return self.manifest is not None
+
+    def save(self, q_function, episode, env = None, extra = None):
+        """Write a checkpoint of q_function, which must be a
+ChunkedTabularQFunction or a TabularQFunction, after the given episode.
+If env is given, its seed and RNG state are saved too.  extra is any
+picklable value to save with the checkpoint.  Returns the number of pieces
+written."""
+        manifest = self.manifest
+        if isinstance(q_function, ChunkedTabularQFunction):
+            kind = 'chunked'
+            description = { 'shape' : q_function.shape,
+                            'chunk_shape' : q_function.chunk_shape,
+                            'dtype' : q_function.dtype.str,
+                            'initial_value' : q_function.initial_value }
+        else:
+            kind = 'dense'
+            description = { 'shape' : q_function.q_table.shape,
+                            'dtype' : q_function.q_table.dtype.str,
+                            'block_rows' : self.block_rows }
+
+        # Pieces saved by an earlier checkpoint of a different function
+        # cannot be reused
+        if (manifest is None) or (manifest['kind'] != kind) or \
+           (manifest['description'] != description):
+            (files, checksums) = ({ }, { })
+        else:
+            (files, checksums) = (dict(manifest['files']),
+                                  dict(manifest['checksums']))
+        version = 0 if manifest is None else manifest['version'] + 1
+
+        if kind == 'chunked':
+            # Chunks are only marked clean once the manifest is committed
+            dirty = set(q_function.dirty_chunks)
+            pieces = [ (key, q_function.get_chunk(key))
+                       for key in q_function.chunk_keys
+                       if (key in dirty) or (key not in files) ]
+        else:
+            pieces = [ ]
+            table = q_function.q_table
+            for start in xrange(0, table.shape[0], self.block_rows):
+                block = np.ascontiguousarray(
+                    table[start:start + self.block_rows])
+                checksum = zlib.crc32(block) & 0xffffffff
+                if (checksums.get(start) != checksum) or \
+                   (start not in files):
+                    pieces.append((start, block))
+                    checksums[start] = checksum
+
+        self.bytes_written = 0
+        for (key, values) in pieces:
+            name = 'piece-%d-%d.npy' % (key, version)
+            self._write(name, lambda f: np.save(f, values))
+            files[key] = name
+            self.bytes_written += values.nbytes
+        self.pieces_written = len(pieces)
+
+        env_seed = None if env is None else getattr(env, 'seed', None)
+        env_rng = getattr(env, 'rng', None)
+        new_manifest = {
+            'version' : version, 'kind' : kind,
+            'description' : description, 'files' : files,
+            'checksums' : checksums, 'episode' : episode,
+            'rng_state' : None if q_function.rng is None
+                              else q_function.rng.get_state(),
+            'env_seed' : env_seed,
+            'env_rng_state' : None if env_rng is None
+                                  else env_rng.get_state(),
+            'extra' : extra }
+
+        # The renames of the pieces must reach the disk before the manifest
+        # listing them, and the manifest's before the checkpoint counts as
+        # saved
+        self._sync_directory()
+        self._write('manifest.pkl',
+                    lambda f: cPickle.dump(new_manifest, f,
+                                           cPickle.HIGHEST_PROTOCOL))
+        self._sync_directory()
+        self.manifest = new_manifest
+        if kind == 'chunked':
+            q_function.mark_clean(key for (key, _) in pieces)
+        self._remove_unlisted_files()
+        return self.pieces_written
+
+    def restore(self, rng = None, env = None):
+        """Restore the last checkpoint.  Returns (q_function, episode,
+extra).  The Q function uses rng, or a new np.random.RandomState if rng is
+None, with its state set to the saved one.  If the saved function had no
+RNG, rng is used as is.  The pieces are read into memory, so training on
+the restored function never changes the checkpoint.  If env is given, its
+seed must match the saved one and its RNG state is restored."""
+        manifest = self.manifest
+        if manifest is None:
+            raise ValueError('There is no checkpoint in %s' % self.directory)
+        if env is not None:
+            if getattr(env, 'seed', None) != manifest['env_seed']:
+                raise ValueError('The checkpoint is for an environment with '
+                                 'seed %s' % manifest['env_seed'])
+            if manifest['env_rng_state'] is not None:
+                env.rng.set_state(manifest['env_rng_state'])
+        if manifest['rng_state'] is not None:
+            if rng is None:
+                rng = np.random.RandomState()
+            rng.set_state(manifest['rng_state'])
+
+        description = manifest['description']
+        if manifest['kind'] == 'chunked':
+            q_function = ChunkedTabularQFunction(
+                description['shape'], rng, description['chunk_shape'],
+                description['dtype'], description['initial_value'])
+            for (key, name) in manifest['files'].iteritems():
+                q_function.set_chunk(key, self._read(name))
+        else:
+            table = np.empty(description['shape'],
+                             dtype = np.dtype(description['dtype']))
+            rows = description['block_rows']
+            for (start, name) in manifest['files'].iteritems():
+                table[start:start + rows] = self._read(name)
+            q_function = TabularQFunction(table, rng)
+        return (q_function, manifest['episode'], manifest['extra'])
+
+    def _read(self, name):
+        return np.load(os.path.join(self.directory, name))
+
+    def _write(self, name, write):
+        # Write to a temporary file, then rename it, so the file never
+        # exists in a partly written state
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'wb') as f:
+            write(f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+
+    def _sync_directory(self):
+        if self.fsync:
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _remove_unlisted_files(self):
+        listed = set(self.manifest['files'].itervalues())
+        for name in os.listdir(self.directory):
+            if name.startswith('piece-') and (name not in listed):
+                os.remove(os.path.join(self.directory, name))
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.pkl'), 'rb') as f:
+            return cPickle.load(f)
+    except IOError:
+        return None
@@ -0,0 +1,321 @@
+"""Offline datasets of transitions.
+
+OfflineDatasetWriter appends transitions to a directory in chunks of a fixed
+number of transitions.  Each chunk is stored by column, with one .npy file
+for each of the states, actions, rewards, next states, done flags and
+episode numbers, and is described by an entry in the dataset's metadata.
+OfflineDataset maps the chunks into memory, so a dataset larger than memory
+can be read, and serves shuffled minibatches.  It can split the chunks
+among several readers, so that parallel_minibatches() can have worker
+processes read separate parts of the dataset at the same time.
+
+Transitions can come from any policy taking (x, y) and returning an
+action: random_policy() for random data, expert_policy() for shortest paths
+to the goal or a Q function's select_hard or select_soft for learned
+policies."""
+
+from pegushi_rl.evaluation import ShortestPathPolicy
+from pegushi_rl.learners import Trajectory
+from pegushi_rl.runner import derive_seed
+from gym.utils.seeding import np_random
+
+import collections
+import cPickle
+import multiprocessing
+import numpy as np
+import os
+import traceback
+
+# Type of each column, other than the states
+_COLUMN_TYPES = (('actions', np.int8), ('rewards', np.float32),
+                 ('dones', np.bool_), ('episodes', np.int64))
+
+class OfflineDatasetWriter:
+    def __init__(self, directory, chunk_size = 65536, state_shape = (2, ),
+                 state_dtype = np.int32):
+        """Create a new OfflineDatasetWriter.
+Arguments are:
+    directory    str; Directory the dataset is written to.  If it already
+                 holds a dataset, new transitions are added to it.
+
+    chunk_size   int; Number of transitions in each chunk
+
+    state_shape  tuple(int); Shape of a single state.  The default is
+                 suitable for the (x, y) states of FixedMazeEnvironment
+
+    state_dtype  numpy.dtype; Type used to store states
+"""
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be > 0')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.chunks = _read_metadata(directory)
+        self.num_episodes = max([ c['last_episode'] + 1
+                                  for c in self.chunks ] or [ 0 ])
+
+        self._states = np.empty((chunk_size, ) + tuple(state_shape),
+                                dtype = state_dtype)
+        self._next_states = np.empty_like(self._states)
+        self._columns = dict((name, np.empty(chunk_size, dtype = dtype))
+                             for (name, dtype) in _COLUMN_TYPES)
+        self._count = 0
+        self._sources = set()
+
+    @property
+    def num_transitions(self):
+        return sum(c['num_transitions'] for c in self.chunks) + self._count
+
+    def add_experience(self, state, action, reward, next_state, done,
+                       episode, source = None):
+        """Add one transition.  source labels where it came from, such as
+"random", "expert" or "learned", and is recorded in the metadata of the
+chunk."""
+        i = self._count
+        self._states[i] = state
+        self._next_states[i] = next_state
+        self._columns['actions'][i] = action
+        self._columns['rewards'][i] = reward
+        self._columns['dones'][i] = done
+        self._columns['episodes'][i] = episode
+        self._sources.add(source)
+        self._count += 1
+        if self._count == self.chunk_size:
+            self.flush()
+
+    def add_trajectory(self, trajectory, source = None):
+        """Add every transition of a Trajectory, or of a list of (state,
+action, reward) tuples as returned by sample_trajectory(), as a new episode.
+Returns the episode's number."""
+        if not isinstance(trajectory, Trajectory):
+            trajectory = Trajectory.from_list(trajectory)
+        episode = self.num_episodes
+        self.num_episodes += 1
+        n = len(trajectory)
+        dones = np.zeros(n, dtype = np.bool_)
+        dones[-1:] = True
+
+        # Copied in slices that fit in the current chunk
+        start = 0
+        while start < n:
+            end = min(n, start + self.chunk_size - self._count)
+            (i, j) = (self._count, self._count + end - start)
+            self._states[i:j] = trajectory.states[start:end]
+            self._next_states[i:j] = trajectory.states[start + 1:end + 1]
+            self._columns['actions'][i:j] = trajectory.actions[start:end]
+            self._columns['rewards'][i:j] = trajectory.rewards[start:end]
+            self._columns['dones'][i:j] = dones[start:end]
+            self._columns['episodes'][i:j] = episode
+            self._sources.add(source)
+            self._count = j
+            if self._count == self.chunk_size:
+                self.flush()
+            start = end
+        return episode
+
+    def collect(self, env, policy, num_episodes, source = None):
+        """Run num_episodes episodes of env, choosing actions with
+policy(x, y), and add them.  Returns the total reward of each episode."""
+        rewards = [ ]
+        for i in xrange(0, num_episodes):
+            trajectory = Trajectory.sample(env, policy)
+            self.add_trajectory(trajectory, source)
+            rewards.append(trajectory.total_reward)
+        return rewards
+
+    def flush(self):
+        """Write the transitions added since the last chunk was written as
+a chunk, even if it is not full"""
+        n = self._count
+        if n == 0:
+            return
+        index = len(self.chunks)
+        columns = dict((name, values[:n])
+                       for (name, values) in self._columns.iteritems())
+        columns['states'] = self._states[:n]
+        columns['next_states'] = self._next_states[:n]
+        for (name, values) in columns.iteritems():
+            np.save(_column_file(self.directory, index, name), values)
+
+        rewards = columns['rewards']
+        self.chunks.append({
+            'index' : index, 'num_transitions' : n,
+            'first_episode' : int(columns['episodes'][0]),
+            'last_episode' : int(columns['episodes'][-1]),
+            'num_episodes_ended' : int(columns['dones'].sum()),
+            'sources' : sorted(s for s in self._sources if s is not None),
+            'reward_sum' : float(rewards.sum()),
+            'reward_min' : float(rewards.min()),
+            'reward_max' : float(rewards.max()) })
+        _write_metadata(self.directory, self.chunks)
+        self._count = 0
+        self._sources = set()
+
+    def close(self):
+        self.flush()
+
+class OfflineDataset:
+    def __init__(self, directory, max_mapped_chunks = 4):
+        """Open the dataset an OfflineDatasetWriter wrote to directory.
+Every mapped column holds a file open, so only the max_mapped_chunks most
+recently used chunks stay mapped."""
+        if max_mapped_chunks < 1:
+            raise ValueError('max_mapped_chunks must be > 0')
+        self.directory = directory
+        self.chunks = _read_metadata(directory)
+        self.max_mapped_chunks = max_mapped_chunks
+
+        # Columns of recently used chunks by chunk index, least recently
+        # used first
+        self._mapped = collections.OrderedDict()
+
+    def __len__(self):
+        return self.num_transitions
+
+    @property
+    def num_transitions(self):
+        return sum(c['num_transitions'] for c in self.chunks)
+
+    @property
+    def num_chunks(self):
+        return len(self.chunks)
+
+    def chunk(self, index):
+        """Return a dictionary of the memory-mapped columns of a chunk:
+"states", "actions", "rewards", "next_states", "dones" and "episodes"."""
+        columns = self._mapped.pop(index, None)
+        if columns is None:
+            while len(self._mapped) >= self.max_mapped_chunks:
+                self._mapped.popitem(last = False)
+            columns = dict(
+                (name, np.load(_column_file(self.directory, index, name),
+                               mmap_mode = 'r'))
+                for name in _COLUMNS)
+        self._mapped[index] = columns
+        return columns
+
+    def minibatches(self, batch_size, rng, num_epochs = 1, worker = 0,
+                    num_workers = 1, chunks_per_shuffle = 4):
+        """Generate shuffled minibatches of (states, actions, rewards,
+next_states, dones, episodes).  Worker number worker of num_workers only
+reads chunks worker, worker + num_workers and so on, so workers with
+different numbers read disjoint parts of the dataset.  Each epoch visits the
+worker's chunks in a random order, chunks_per_shuffle at a time, and
+shuffles the transitions of those chunks together, so only that many
+chunks are read at once.  The last minibatch may be smaller than
+batch_size."""
+        if batch_size < 1:
+            raise ValueError('batch_size must be > 0')
+        if not (0 <= worker < num_workers):
+            raise ValueError('worker must be in [0, num_workers)')
+        chunks = np.arange(worker, self.num_chunks, num_workers)
+        pending = None
+        for epoch in xrange(0, num_epochs):
+            order = chunks[rng.permutation(len(chunks))]
+            for start in xrange(0, len(order), chunks_per_shuffle):
+                group = [ self.chunk(i)
+                          for i in order[start:start + chunks_per_shuffle] ]
+                columns = [ np.concatenate([ c[name] for c in group ])
+                            for name in _COLUMNS ]
+                if pending is not None:
+                    columns = [ np.concatenate((p, c))
+                                for (p, c) in zip(pending, columns) ]
+                permutation = rng.permutation(len(columns[0]))
+                n = (len(permutation) // batch_size) * batch_size
+                for i in xrange(0, n, batch_size):
+                    selected = permutation[i:i + batch_size]
+                    yield tuple(c[selected] for c in columns)
+
+                # Left over transitions go into the next group
+                selected = permutation[n:]
+                pending = [ c[selected] for c in columns ]
+        if (pending is not None) and len(pending[0]):
+            yield tuple(pending)
+
+def parallel_minibatches(directory, batch_size, num_workers, seed = 0,
+                         num_epochs = 1, max_queued_batches = 16,
+                         chunks_per_shuffle = 4):
+    """Generate minibatches of the dataset in directory, as
+OfflineDataset.minibatches() does, read by num_workers worker processes.
+Each worker reads its own share of the chunks with an RNG seeded from seed
+and its worker number, and up to max_queued_batches minibatches wait to be
+taken.  Minibatches from different workers arrive in no particular
+order.  If a worker fails, RuntimeError is raised with its traceback."""
+    if num_workers < 1:
+        raise ValueError('num_workers must be > 0')
+    queue = multiprocessing.Queue(max_queued_batches)
+    workers = [ multiprocessing.Process(
+                    target = _read_minibatches,
+                    args = (directory, batch_size, i, num_workers,
+                            derive_seed(seed, i), num_epochs,
+                            chunks_per_shuffle, queue))
+                for i in xrange(0, num_workers) ]
+    for w in workers:
+        w.daemon = True
+        w.start()
+    try:
+        finished = 0
+        while finished < num_workers:
+            batch = queue.get()
+            if batch is None:
+                finished += 1
+            elif isinstance(batch, str):
+                raise RuntimeError('A dataset reader failed:\n%s' % batch)
+            else:
+                yield batch
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+            w.join()
+
+def _read_minibatches(directory, batch_size, worker, num_workers, seed,
+                      num_epochs, chunks_per_shuffle, queue):
+    # Puts None on the queue once every minibatch is read, or the traceback
+    # of the exception that stopped the worker
+    try:
+        (rng, _) = np_random(seed)
+        dataset = OfflineDataset(directory, chunks_per_shuffle)
+        for batch in dataset.minibatches(batch_size, rng, num_epochs, worker,
+                                         num_workers, chunks_per_shuffle):
+            queue.put(batch)
+    except Exception:
+        queue.put(traceback.format_exc())
+    else:
+        queue.put(None)
+
+def random_policy(rng, num_actions = 4):
+    """Return a policy(x, y) that chooses actions uniformly at random"""
+    return lambda x, y: rng.randint(0, num_actions)
+
+def expert_policy(env):
+    """Return a policy(x, y) that always moves one step closer to env's
+goal"""
+    policy = ShortestPathPolicy()
+    layout = env._layout
+    goal_xs = np.asarray([ env.goal[0] ])
+    goal_ys = np.asarray([ env.goal[1] ])
+    return lambda x, y: int(policy(layout, np.asarray([ x ]),
+                                   np.asarray([ y ]), goal_xs, goal_ys)[0])
+
+# Names of the columns, in the order minibatches hold them
+_COLUMNS = ('states', 'actions', 'rewards', 'next_states', 'dones',
+            'episodes')
+
+def _column_file(directory, index, name):
+    return os.path.join(directory, 'chunk-%06d.%s.npy' % (index, name))
+
+def _read_metadata(directory):
+    try:
+        with open(os.path.join(directory, 'chunks.pkl'), 'rb') as f:
+            return cPickle.load(f)
+    except IOError:
+        return [ ]
+
+def _write_metadata(directory, chunks):
+    # Renaming is atomic, so readers never see a partly written file
+    path = os.path.join(directory, 'chunks.pkl')
+    with open(path + '.tmp', 'wb') as f:
+        cPickle.dump(chunks, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(path + '.tmp', path)
@@ -0,0 +1,292 @@
+"""Benchmark policies on many maze instances at once.
+
+An instance is a maze layout with a start and a goal.  evaluate_policy()
+groups instances by layout and steps every instance in a group in lockstep
+with numpy, so a batch policy chooses actions for the whole group with one
+call per step.  Optimal path lengths come from one breadth-first search per
+(layout, goal) pair rather than one search per instance.  Each distance
+field covers the whole maze, so the instances of a layout are stepped in
+batches that have at most goals_per_batch different goals, which bounds how
+many fields a policy such as ShortestPathPolicy needs at once."""
+
+from pegushi_gym.envs.maze import compute_adjacency_mask, \
+                                  compute_distance_field
+
+import collections
+import multiprocessing
+import numpy as np
+
+# Movement along x and y for each action (north, east, south, west)
+_DELTA_X = np.asarray([  0,  1,  0, -1 ], dtype = np.int32)
+_DELTA_Y = np.asarray([  1,  0, -1,  0 ], dtype = np.int32)
+
+class EvaluationInstance:
+    """A maze layout (as in FixedMazeEnvironment) with (x, y) start and goal
+locations"""
+    def __init__(self, layout, start, goal):
+        self.layout = layout
+        self.start = tuple(start)
+        self.goal = tuple(goal)
+
+    @staticmethod
+    def from_environment(env):
+        return EvaluationInstance(env._layout, env.start, env.goal)
+
+def random_instances(layouts, num_instances, rng):
+    """Create num_instances instances spread evenly over the given layouts,
+with starts and goals drawn uniformly at random and never coincident."""
+    instances = [ ]
+    for i in xrange(0, num_instances):
+        layout = layouts[i % len(layouts)]
+        (height, width) = layout.shape
+        if width * height < 2:
+            raise ValueError('Layouts must have at least two cells')
+        goal = (rng.randint(0, width), rng.randint(0, height))
+        start = goal
+        while start == goal:
+            start = (rng.randint(0, width), rng.randint(0, height))
+        instances.append(EvaluationInstance(layout, start, goal))
+    return instances
+
+class GreedyPolicy:
+    """Batch policy that picks the action with the highest value in a
+TabularQFunction, ignoring the layout and goal.  Only meaningful for the
+maze and goal the Q function was trained on."""
+    def __init__(self, q_function):
+        self.q_function = q_function
+
+    def __call__(self, layout, xs, ys, goal_xs, goal_ys):
+        return self.q_function.select_hard_batch(xs, ys)
+
+class RandomPolicy:
+    """Batch policy that picks actions uniformly at random"""
+    def __init__(self, rng, num_actions = 4):
+        self.rng = rng
+        self.num_actions = num_actions
+
+    def __call__(self, layout, xs, ys, goal_xs, goal_ys):
+        return self.rng.randint(0, self.num_actions, size = len(xs))
+
+class ShortestPathPolicy:
+    """Batch policy that always moves one step closer to the goal.  Useful
+as an upper bound on performance and for checking benchmarks.  It keeps the
+distance fields of the max_fields most recently used goals, and the
+adjacency mask of the last layout it was called with."""
+    def __init__(self, max_fields = 16):
+        if max_fields < 1:
+            raise ValueError('max_fields must be > 0')
+        self.max_fields = max_fields
+
+        # Maps (id(layout), goal) to (layout, distance field), least
+        # recently used first, and holds (layout, adjacency mask).  The
+        # layout is kept so its id cannot be reused by another array.
+        self._fields = collections.OrderedDict()
+        self._mask = (None, None)
+
+    def __call__(self, layout, xs, ys, goal_xs, goal_ys):
+        actions = np.zeros(len(xs), dtype = np.int32)
+        mask = self._adjacency_mask(layout)
+        for goal in set(zip(goal_xs.tolist(), goal_ys.tolist())):
+            field = self._distance_field(layout, goal)
+            selected = np.flatnonzero((goal_xs == goal[0]) & \
+                                      (goal_ys == goal[1]))
+            x = xs[selected]
+            y = ys[selected]
+            closer = field[y, x] - 1
+            cells = mask[y, x]
+            for a in xrange(0, 4):
+                open_ = (cells & (1 << a)) != 0
+                nx = np.where(open_, x + _DELTA_X[a], x)
+                ny = np.where(open_, y + _DELTA_Y[a], y)
+                actions[selected[open_ & (field[ny, nx] == closer)]] = a
+        return actions
+
+    def _distance_field(self, layout, goal):
+        key = (id(layout), goal)
+        entry = self._fields.pop(key, None)
+        if entry is None:
+            while len(self._fields) >= self.max_fields:
+                self._fields.popitem(last = False)
+            entry = (layout, compute_distance_field(layout, goal))
+        self._fields[key] = entry
+        return entry[1]
+
+    def _adjacency_mask(self, layout):
+        if self._mask[0] is not layout:
+            self._mask = (layout, compute_adjacency_mask(layout))
+        return self._mask[1]
+
+class EvaluationReport:
+    """Per-instance outcomes of an evaluation plus summary statistics.
+
+    success  np.ndarray[bool]; Whether each instance reached its goal within
+             the step limit
+
+    steps    np.ndarray[int]; Steps taken by each instance.  Instances that
+             failed took max_steps steps.
+
+    optimal  np.ndarray[int]; Length of each instance's shortest path
+
+    ratio    np.ndarray[float]; steps / optimal for successful instances
+             and NaN for the rest
+"""
+    def __init__(self, success, steps, optimal):
+        self.success = success
+        self.steps = steps
+        self.optimal = optimal
+
+        self.ratio = np.full(len(steps), np.nan)
+        ok = success & (optimal > 0)
+        self.ratio[ok] = steps[ok].astype(np.float64) / optimal[ok]
+        self.ratio[success & (optimal == 0)] = 1.0
+
+    @property
+    def num_instances(self):
+        return len(self.success)
+
+    @property
+    def success_rate(self):
+        return self.success.mean() if self.num_instances else np.nan
+
+    @property
+    def mean_ratio(self):
+        """Mean path-length ratio over successful instances"""
+        return self.ratio[self.success].mean() if self.success.any() \
+                   else np.nan
+
+    def ratio_percentiles(self, percentiles = (50, 90, 99)):
+        """Percentiles of the path-length ratio over successful instances"""
+        if not self.success.any():
+            return np.full(len(percentiles), np.nan)
+        return np.percentile(self.ratio[self.success], percentiles)
+
+    def steps_percentiles(self, percentiles = (50, 90, 99)):
+        """Percentiles of the number of steps to the goal over successful
+instances"""
+        if not self.success.any():
+            return np.full(len(percentiles), np.nan)
+        return np.percentile(self.steps[self.success], percentiles)
+
+    def steps_histogram(self, bins = 20):
+        """Histogram of steps to the goal over successful instances, as
+returned by numpy.histogram()"""
+        return np.histogram(self.steps[self.success], bins = bins)
+
+    def summary(self, percentiles = (50, 90, 99)):
+        lines = [ 'Instances:     %d' % self.num_instances,
+                  'Success rate:  %.4f' % self.success_rate,
+                  'Mean ratio:    %.4f' % self.mean_ratio ]
+        for (p, r, s) in zip(percentiles,
+                             self.ratio_percentiles(percentiles),
+                             self.steps_percentiles(percentiles)):
+            lines.append('P%-2d ratio:     %.4f  steps: %.1f' % (p, r, s))
+        return '\n'.join(lines)
+
+def evaluate_policy(instances, policy, max_steps = 10000, num_processes = 1,
+                    goals_per_batch = 16):
+    """Run policy on every instance and return an EvaluationReport whose
+arrays are in the same order as instances.
+
+policy is called as policy(layout, xs, ys, goal_xs, goal_ys) with arrays
+holding the positions and goals of the instances on that layout that have
+not yet reached their goals.  It returns an array with one action per
+instance.
+
+Instances of a layout are stepped together in batches with at most
+goals_per_batch different goals.
+
+If num_processes is greater than one, the layouts are split among a pool of
+worker processes, in which case policy must be picklable.  Each worker
+then uses its own copy of the policy, so a policy that draws from an RNG
+does not give the same results as it would in a single process."""
+    groups = collections.OrderedDict()
+    for (i, instance) in enumerate(instances):
+        groups.setdefault(id(instance.layout), [ ]).append(i)
+
+    tasks = [ (instances[members[0]].layout,
+               np.asarray([ instances[i].start for i in members ],
+                          dtype = np.int32).reshape((-1, 2)),
+               np.asarray([ instances[i].goal for i in members ],
+                          dtype = np.int32).reshape((-1, 2)),
+               policy, max_steps, goals_per_batch)
+              for members in groups.itervalues() ]
+
+    if num_processes > 1:
+        pool = multiprocessing.Pool(num_processes)
+        try:
+            results = pool.map(_evaluate_layout_task, tasks, 1)
+            pool.close()
+        finally:
+            pool.join()
+    else:
+        results = map(_evaluate_layout_task, tasks)
+
+    n = len(instances)
+    success = np.zeros(n, dtype = np.bool_)
+    steps = np.zeros(n, dtype = np.int64)
+    optimal = np.zeros(n, dtype = np.int64)
+    for (members, (s, t, o)) in zip(groups.itervalues(), results):
+        success[members] = s
+        steps[members] = t
+        optimal[members] = o
+    return EvaluationReport(success, steps, optimal)
+
+def _evaluate_layout_task(task):
+    return evaluate_layout(*task)
+
+def evaluate_layout(layout, starts, goals, policy, max_steps = 10000,
+                    goals_per_batch = 16):
+    """Run policy from every start in the (n, 2) array starts to the
+matching goal in goals on one layout.  Instances are stepped together in
+batches with at most goals_per_batch different goals, and only one distance
+field is computed at a time.  Returns (success, steps, optimal) arrays as
+described in EvaluationReport."""
+    if goals_per_batch < 1:
+        raise ValueError('goals_per_batch must be > 0')
+    n = len(starts)
+    xs = starts[:, 0].copy()
+    ys = starts[:, 1].copy()
+    goal_xs = goals[:, 0]
+    goal_ys = goals[:, 1]
+
+    # Number each instance's goal, in order of the goals' cell indices
+    (_, goal_numbers) = np.unique(goal_ys.astype(np.int64) * layout.shape[1]
+                                      + goal_xs, return_inverse = True)
+    order = np.argsort(goal_numbers, kind = 'mergesort')
+    bounds = np.concatenate(([ 0 ],
+                             np.flatnonzero(np.diff(goal_numbers[order])) + 1,
+                             [ n ]))
+
+    optimal = np.zeros(n, dtype = np.int64)
+    for (start, end) in zip(bounds[:-1], bounds[1:]):
+        members = order[start:end]
+        i = members[0]
+        field = compute_distance_field(layout, (goal_xs[i], goal_ys[i]))
+        optimal[members] = field[ys[members], xs[members]]
+
+    mask = compute_adjacency_mask(layout)
+    steps = np.zeros(n, dtype = np.int64)
+    success = (xs == goal_xs) & (ys == goal_ys)
+    for first in xrange(0, len(bounds) - 1, goals_per_batch):
+        last = min(first + goals_per_batch, len(bounds) - 1)
+        batch = order[bounds[first]:bounds[last]]
+        active = batch[~success[batch]]
+        tick = 0
+        while (tick < max_steps) and len(active):
+            tick += 1
+            ax = xs[active]
+            ay = ys[active]
+            actions = np.asarray(policy(layout, ax, ay, goal_xs[active],
+                                        goal_ys[active]))
+            open_ = (mask[ay, ax] >> actions) & 1
+            ax += _DELTA_X[actions] * open_
+            ay += _DELTA_Y[actions] * open_
+            xs[active] = ax
+            ys[active] = ay
+            steps[active] = tick
+
+            arrived = (ax == goal_xs[active]) & (ay == goal_ys[active])
+            success[active[arrived]] = True
+            active = active[~arrived]
+
+    return (success, steps, optimal)
@@ -0,0 +1,142 @@
+"""Preprocessing and stacking of pixel observations"""
+
+import numpy as np
+
+# Luminance weights used by tf.image.rgb_to_grayscale()
+_GRAYSCALE_WEIGHTS = np.asarray([ 0.2989, 0.5870, 0.1140 ], dtype = np.float32)
+
+class FrameProcessor:
+    """Crops, downsamples and converts RGB frames to grayscale in NumPy.
+Works on a single (height, width, 3) frame or on a batch of frames with
+shape (n, height, width, 3)."""
+    def __init__(self, frame_height = 84, frame_width = 84, crop = None):
+        """Create a new FrameProcessor.
+Arguments are:
+    frame_height  int; Height of the processed frames
+
+    frame_width   int; Width of the processed frames
+
+    crop          tuple(int, int, int, int); (top, left, height, width) of
+                  the region of the input frame to keep.  If None, the
+                  entire frame is kept.
+"""
+        self.frame_height = frame_height
+        self.frame_width = frame_width
+        self.crop = crop
+
+        # Row and column indices for nearest-neighbor downsampling,
+        # computed for the first input shape seen and reused afterwards
+        self._input_shape = None
+        self._rows = None
+        self._cols = None
+
+    def process(self, frames):
+        """Return the processed frame(s) as uint8 with shape
+(frame_height, frame_width) or (n, frame_height, frame_width)."""
+        frames = np.asarray(frames)
+        if (frames.ndim not in (3, 4)) or (frames.shape[-1] != 3):
+            raise ValueError('Frames must have shape (height, width, 3) or '
+                             '(n, height, width, 3)')
+        if frames.shape[-3:-1] != self._input_shape:
+            self._compute_indices(frames.shape[-3:-1])
+
+        # Sampling before the color conversion means only the pixels that
+        # survive the downsampling get converted
+        sampled = frames[..., self._rows, self._cols, :]
+        gray = np.dot(sampled, _GRAYSCALE_WEIGHTS)
+        return np.clip(np.rint(gray), 0, 255).astype(np.uint8)
+
+    __call__ = process
+
+    def _compute_indices(self, input_shape):
+        if self.crop:
+            (top, left, height, width) = self.crop
+            if (top + height > input_shape[0]) or \
+               (left + width > input_shape[1]):
+                raise ValueError('Crop region %s does not fit in a %dx%d '
+                                 'frame' % (repr(self.crop), input_shape[1],
+                                            input_shape[0]))
+        else:
+            (top, left) = (0, 0)
+            (height, width) = input_shape
+
+        rows = top + (np.arange(self.frame_height) * height) // \
+                     self.frame_height
+        cols = left + (np.arange(self.frame_width) * width) // \
+                      self.frame_width
+        self._rows = rows[:, np.newaxis]
+        self._cols = cols[np.newaxis, :]
+        self._input_shape = tuple(input_shape)
+
+class FrameStack:
+    """Ring buffer holding the last history_length frames.  The stacked state
+is a view into the buffer, so pushing a frame copies only that frame rather
+than the whole stack.
+
+The buffer holds each frame twice, at slots i and i + history_length, so the
+last history_length frames always occupy a contiguous run of slots.  Views
+returned by state and state_hwc change when the next frame is pushed; copy
+them if they need to outlive that."""
+    def __init__(self, history_length = 4, frame_shape = (84, 84),
+                 dtype = np.uint8):
+        if history_length < 1:
+            raise ValueError('history_length must be > 0')
+        self.history_length = history_length
+        self.frame_shape = tuple(frame_shape)
+        self._frames = np.zeros((2 * history_length, ) + self.frame_shape,
+                                dtype = dtype)
+        self._head = 0
+
+    @property
+    def state(self):
+        """The stacked frames, oldest first, with shape
+(history_length, ) + frame_shape"""
+        return self._frames[self._head:self._head + self.history_length]
+
+    @property
+    def state_hwc(self):
+        """The stacked frames with the history along the last axis, the
+layout used by the DQN in the ddqn_atari notebook"""
+        return np.rollaxis(self.state, 0, self.state.ndim)
+
+    def reset(self, frame):
+        """Fill the history with copies of frame and return the state"""
+        self._frames[:] = frame
+        self._head = 0
+        return self.state
+
+    def push(self, frame):
+        """Append frame to the history, dropping the oldest frame, and return
+the state"""
+        self._frames[self._head] = frame
+        self._frames[self._head + self.history_length] = frame
+        self._head = (self._head + 1) % self.history_length
+        return self.state
+
+class PixelObservations:
+    """Wraps an environment that renders to "rgb_array" so reset() and step()
+return stacked, preprocessed frames instead of the environment's own
+observations.  The environment's observation is available as
+underlying_state."""
+    def __init__(self, env, processor = None, history_length = 4):
+        self.env = env
+        self.processor = processor if processor else FrameProcessor()
+        self.action_space = env.action_space
+        self.underlying_state = None
+        frame_shape = (self.processor.frame_height,
+                       self.processor.frame_width)
+        self.frames = FrameStack(history_length, frame_shape)
+
+    def reset(self):
+        self.underlying_state = self.env.reset()
+        return self.frames.reset(self._observe())
+
+    def step(self, action):
+        (self.underlying_state, reward, done, info) = self.env.step(action)
+        return (self.frames.push(self._observe()), reward, done, info)
+
+    def close(self):
+        self.env.close()
+
+    def _observe(self):
+        return self.processor.process(self.env.render('rgb_array'))
@@ -0,0 +1,152 @@
+"""Hogwild-style parallel tabular Q-learning.
+
+Several worker processes run Q-learning episodes on their own copies of one
+maze and update a single SharedTabularQFunction without locks.  Workers are
+forked, so the environment and the shared table are inherited rather than
+pickled."""
+
+from pegushi_rl.learners import QLearner, sample_trajectory
+from pegushi_rl.q_functions import SharedTabularQFunction
+from pegushi_rl.runner import derive_seed
+from gym.utils.seeding import np_random
+
+import multiprocessing
+import multiprocessing.sharedctypes
+import time
+
+class HogwildTrainer:
+    def __init__(self, env, q_function, num_workers, alpha = 0.1,
+                 gamma = 0.5, seed = 0):
+        """Create a new HogwildTrainer.
+Arguments are:
+    env          FixedMazeEnvironment or equivalent; Each worker gets its
+                 own copy when it is forked
+
+    q_function   SharedTabularQFunction; The table all workers update
+
+    num_workers  int; Number of worker processes
+
+    alpha        float; Learning rate
+
+    gamma        float; Discount rate
+
+    seed         int; Each worker seeds its RNG with a seed derived from
+                 this one and its worker number
+"""
+        if num_workers < 1:
+            raise ValueError('num_workers must be > 0')
+        self.env = env
+        self.q_function = q_function
+        self.num_workers = num_workers
+        self.alpha = alpha
+        self.gamma = gamma
+        self.seed = seed
+
+        # Each worker only writes its own slot, so no locks are needed
+        self._steps = multiprocessing.sharedctypes.RawArray('l', num_workers)
+        self._episodes = \
+            multiprocessing.sharedctypes.RawArray('l', num_workers)
+        self._stop = multiprocessing.Event()
+        self._workers = [ ]
+
+    @property
+    def steps(self):
+        """Total number of environment steps taken by all workers"""
+        return sum(self._steps)
+
+    @property
+    def episodes(self):
+        """Total number of episodes completed by all workers"""
+        return sum(self._episodes)
+
+    @property
+    def running(self):
+        return any(w.is_alive() for w in self._workers)
+
+    def snapshot(self):
+        """Copy the shared table, for evaluation while workers keep
+learning"""
+        return self.q_function.snapshot()
+
+    def start(self, num_episodes = None):
+        """Start the workers.  Each runs num_episodes episodes, or until
+stop() is called if num_episodes is None."""
+        if self._workers:
+            raise RuntimeError('Workers are already running')
+        self._stop.clear()
+        for i in xrange(0, self.num_workers):
+            self._steps[i] = 0
+            self._episodes[i] = 0
+        self._workers = [
+            multiprocessing.Process(target = self._work,
+                                    args = (i, num_episodes))
+            for i in xrange(0, self.num_workers) ]
+        for w in self._workers:
+            w.daemon = True
+            w.start()
+
+    def stop(self):
+        """Ask the workers to stop after their current episode and wait for
+them to exit"""
+        self._stop.set()
+        self.join()
+
+    def join(self):
+        for w in self._workers:
+            w.join()
+        self._workers = [ ]
+
+    def run(self, num_episodes = None, duration = None,
+            snapshot_interval = None, on_snapshot = None):
+        """Run the workers until each has completed num_episodes episodes or
+duration seconds have passed, whichever comes first.  If on_snapshot is
+given, call on_snapshot(snapshot, steps) every snapshot_interval seconds
+and once more at the end.  Returns the number of steps taken."""
+        if (num_episodes is None) and (duration is None):
+            raise ValueError('One of num_episodes or duration is required')
+        start = time.time()
+        next_snapshot = start + snapshot_interval if snapshot_interval \
+                            else None
+        self.start(num_episodes)
+        try:
+            while self.running:
+                now = time.time()
+                if (duration is not None) and (now - start >= duration):
+                    break
+                if next_snapshot and on_snapshot and (now >= next_snapshot):
+                    on_snapshot(self.snapshot(), self.steps)
+                    next_snapshot += snapshot_interval
+                time.sleep(0.01)
+        finally:
+            self.stop()
+        if on_snapshot:
+            on_snapshot(self.snapshot(), self.steps)
+        return self.steps
+
+    def _work(self, worker_index, num_episodes):
+        (rng, _) = np_random(derive_seed(self.seed, 'hogwild', worker_index))
+        q = self.q_function.with_rng(rng)
+        learner = QLearner(q, self.alpha, self.gamma)
+        episode = 0
+        while not self._stop.is_set():
+            if (num_episodes is not None) and (episode >= num_episodes):
+                break
+            t = sample_trajectory(self.env, q.select_soft)
+            learner.update_trajectory(t)
+            episode += 1
+            self._steps[worker_index] += len(t) - 1
+            self._episodes[worker_index] = episode
+
+def measure_scaling(env, worker_counts, duration, alpha = 0.1, gamma = 0.5,
+                    seed = 0):
+    """Measure learning throughput for each number of workers in
+worker_counts, starting from a fresh table and running for duration seconds
+each time.  Returns a list of (number of workers, steps per second)."""
+    results = [ ]
+    for n in worker_counts:
+        q = SharedTabularQFunction.from_maze_zeros(env, None)
+        trainer = HogwildTrainer(env, q, n, alpha, gamma, seed)
+        start = time.time()
+        steps = trainer.run(duration = duration)
+        results.append((n, steps / (time.time() - start)))
+    return results
@@ -0,0 +1,186 @@
+"""Q-learning for tabular Q functions"""
+
+import numpy as np
+
+class Trajectory:
+    """Array-backed trajectory of T steps.
+Attributes are:
+    states   np.ndarray[int32]; (T + 1, 2) array of the (x, y) states
+             visited, including the final state
+
+    actions  np.ndarray[int32]; (T, ) array of the actions taken
+
+    rewards  np.ndarray[float64]; (T, ) array of the rewards received
+"""
+    def __init__(self, states, actions, rewards):
+        if (len(states) != len(actions) + 1) or \
+           (len(actions) != len(rewards)):
+            raise ValueError('A trajectory needs one more state than '
+                             'actions and rewards')
+        self.states = states
+        self.actions = actions
+        self.rewards = rewards
+
+    def __len__(self):
+        return len(self.actions)
+
+    @property
+    def total_reward(self):
+        return self.rewards.sum()
+
+    @staticmethod
+    def from_list(trajectory):
+        """Convert a list of (state, action, reward) tuples terminated by
+(final_state, None, 0.0), as returned by sample_trajectory()"""
+        steps = trajectory[0:-1]
+        states = np.asarray([ s for (s, _, _) in trajectory ],
+                            dtype = np.int32).reshape((-1, 2))
+        actions = np.asarray([ a for (_, a, _) in steps ], dtype = np.int32)
+        rewards = np.asarray([ r for (_, _, r) in steps ],
+                             dtype = np.float64)
+        return Trajectory(states, actions, rewards)
+
+    @staticmethod
+    def sample(env, policy):
+        """Run one episode, choosing actions with policy(x, y)"""
+        return Trajectory.from_list(sample_trajectory(env, policy))
+
+def discounted_cumsum(values, discount):
+    """Return y with y[t] = sum over k >= t of discount ** (k - t) * values[k],
+computed with numpy.  Works in blocks short enough that discount raised to
+the block length does not underflow, so long trajectories are safe."""
+    values = np.asarray(values, dtype = np.float64)
+    n = len(values)
+    result = np.empty(n)
+    if (n == 0) or (discount == 0.0):
+        result[:] = values
+        return result
+    if discount >= 1.0:
+        block = n
+    else:
+        block = max(1, int(-250.0 / np.log10(discount)))
+
+    carry = 0.0
+    for end in xrange(n, 0, -block):
+        start = max(0, end - block)
+        powers = discount ** np.arange(0, end - start, dtype = np.float64)
+        weighted = values[start:end] * powers
+        sums = np.cumsum(weighted[::-1])[::-1] / powers
+        result[start:end] = sums + carry * discount * powers[::-1]
+        carry = result[start]
+    return result
+
+class QLearner:
+    def __init__(self, policy, alpha = 0.1, gamma = 0.5):
+        # Q-function being learned
+        self.q = policy
+
+        # Learning rate
+        self.alpha = alpha
+
+        # Discount rate
+        self.gamma = gamma
+
+    def update(self, state, action, reward, next_state):
+        t = self.target(reward, next_state)
+        self.q.update(state[0], state[1], action, t, self.alpha)
+        return self
+
+    def update_trajectory(self, trajectory):
+        """Trajectory is a sequence of (state, action, reward) tuples."""
+        next_state = trajectory[-1][0]
+        for (state, action, reward) in reversed(trajectory[0:-1]):
+            self.update(state, action, reward, next_state)
+            next_state = state
+        return self
+
+    def update_trajectory_n_step(self, trajectory, n):
+        """Update every step of a trajectory towards its n-step return,
+bootstrapping from the final state for steps within n of the end.  The
+trajectory may be a Trajectory or a list as returned by
+sample_trajectory().  n = 1 gives the same targets as update_trajectory(),
+but all of them are computed from the Q function as it was before the
+update."""
+        trajectory = _as_trajectory(trajectory)
+        return self._apply_targets(trajectory,
+                                   self.n_step_targets(trajectory, n))
+
+    def update_trajectory_lambda(self, trajectory, lambda_):
+        """Update every step of a trajectory towards its lambda-return,
+bootstrapping from max_q of each next state (Peng's Q(lambda) targets).
+lambda_ = 0 gives one-step targets and lambda_ = 1 gives the discounted
+return bootstrapped from the final state."""
+        trajectory = _as_trajectory(trajectory)
+        return self._apply_targets(trajectory,
+                                   self.lambda_targets(trajectory, lambda_))
+
+    def n_step_targets(self, trajectory, n):
+        if n < 1:
+            raise ValueError('n must be > 0')
+        T = len(trajectory)
+        t = np.arange(0, T)
+        horizon = np.minimum(t + n, T)
+        returns = discounted_cumsum(trajectory.rewards, self.gamma)
+        tail = np.append(returns, 0.0)[horizon]
+        discount = self.gamma ** (horizon - t)
+        bootstrap = self.q.max_q_batch(trajectory.states[horizon, 0],
+                                       trajectory.states[horizon, 1])
+        return returns - discount * tail + discount * bootstrap
+
+    def lambda_targets(self, trajectory, lambda_):
+        next_states = trajectory.states[1:]
+        next_values = self.q.max_q_batch(next_states[:, 0], next_states[:, 1])
+        weights = np.full(len(trajectory), 1.0 - lambda_)
+        if len(weights):
+            weights[-1] = 1.0
+        blended = trajectory.rewards + self.gamma * weights * next_values
+        return discounted_cumsum(blended, self.gamma * lambda_)
+
+    def _apply_targets(self, trajectory, targets):
+        # Apply in reverse so that, as in update_trajectory(), the earliest
+        # visit to a (state, action) pair is the one that sticks
+        states = trajectory.states[-2::-1]
+        self.q.update_batch(states[:, 0], states[:, 1],
+                            trajectory.actions[::-1], targets[::-1],
+                            self.alpha)
+        return self
+
+    def target(self, reward, next_state):
+        future_rewards = \
+            self.gamma * self.q.max_q(*next_state) if next_state else 0.0
+        return reward + future_rewards
+
+def _as_trajectory(trajectory):
+    if isinstance(trajectory, Trajectory):
+        return trajectory
+    return Trajectory.from_list(trajectory)
+
+def sample_trajectory(env, policy):
+    """Run one episode, choosing actions with policy(x, y).  Returns a list
+of (state, action, reward) tuples terminated by (final_state, None, 0.0)"""
+    state = env.reset()
+    done = False
+    trajectory = [ ]
+    while not done:
+        action = policy(*state)
+        next_state, reward, done, _ = env.step(action)
+        trajectory.append((state, action, reward))
+        state = next_state
+
+    trajectory.append((state, None, 0.0))
+    return trajectory
+
+def trajectory_reward(trajectory):
+    return sum(x[2] for x in trajectory)
+
+def learn(env, policy, num_iterations, alpha = 0.1, gamma = 0.5):
+    """Learn the Q function "policy" with num_iterations episodes of
+Q-learning, choosing actions with policy.select_soft.  Returns a list of
+(trajectory, total reward) tuples, one per episode."""
+    learner = QLearner(policy, alpha, gamma)
+    trajectories = [ ]
+    for i in xrange(0, num_iterations):
+        t = sample_trajectory(env, policy.select_soft)
+        trajectories.append((t, trajectory_reward(t)))
+        learner.update_trajectory(t)
+    return trajectories
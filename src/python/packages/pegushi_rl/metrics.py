@@ -0,0 +1,125 @@
+"""Append-only logs of episode statistics.
+
+MetricsLog keeps one METRICS_RECORD per episode in a fixed-size array and
+appends the array to a binary file whenever it fills up or flush_interval
+seconds have passed, so logging an episode costs an assignment rather than a
+write, memory use does not grow with the number of episodes and a crash loses
+at most one buffer.  read_metrics() can read the log while training is still
+appending to it, and downsample_metrics() averages long logs down to a
+manageable number of points for plotting."""
+
+import numpy as np
+import os
+import time
+
+# One record per episode
+METRICS_RECORD = np.dtype([ ('episode', '<i8'), ('reward', '<f8'),
+                            ('length', '<i4'), ('wall_hits', '<i4'),
+                            ('duration', '<f8'), ('time', '<f8') ])
+
+# Records returned by downsample_metrics()
+_DOWNSAMPLED_RECORD = np.dtype([ (name, '<i8' if name == 'episode' else '<f8')
+                                 for name in METRICS_RECORD.names ])
+
+class MetricsLog:
+    def __init__(self, path, buffer_size = 1024, flush_interval = 10.0):
+        """Create a new MetricsLog.
+Arguments are:
+    path            str; Name of the log file.  Records are appended to it
+                    if it already exists.
+
+    buffer_size     int; Number of records buffered before they are written
+
+    flush_interval  float; Maximum number of seconds records stay in the
+                    buffer, or None to only write full buffers.  The
+                    interval is checked when a record is added.
+"""
+        if buffer_size < 1:
+            raise ValueError('buffer_size must be > 0')
+        self.path = path
+        self.flush_interval = flush_interval
+        self.num_flushes = 0
+        self._file = open(path, 'ab')
+        self._buffer = np.zeros(buffer_size, dtype = METRICS_RECORD)
+        self._count = 0
+        self._last_flush = time.time()
+
+        # Drop any partial record left by a crash, so new records start on
+        # a record boundary, and continue numbering after the whole ones
+        self.num_episodes = os.path.getsize(path) // METRICS_RECORD.itemsize
+        os.ftruncate(self._file.fileno(),
+                     self.num_episodes * METRICS_RECORD.itemsize)
+
+    def record(self, reward, length, wall_hits = 0, duration = 0.0):
+        """Record the statistics of the next episode.  Returns its
+number."""
+        now = time.time()
+        self._buffer[self._count] = (self.num_episodes, reward, length,
+                                     wall_hits, duration, now)
+        self._count += 1
+        self.num_episodes += 1
+        if (self._count == len(self._buffer)) or \
+           ((self.flush_interval is not None) and
+            (now - self._last_flush >= self.flush_interval)):
+            self.flush()
+        return self.num_episodes - 1
+
+    def record_trajectory(self, trajectory, duration = 0.0):
+        """Record an episode from its Trajectory or list of (state, action,
+reward) tuples, as returned by sample_trajectory().  Steps that leave the
+agent where it was count as wall hits."""
+        if isinstance(trajectory, list):
+            states = np.asarray([ s for (s, _, _) in trajectory ])
+            reward = sum(r for (_, _, r) in trajectory)
+        else:
+            (states, reward) = (trajectory.states, trajectory.total_reward)
+        length = len(states) - 1
+        wall_hits = int(np.all(states[1:] == states[:-1], axis = 1).sum()) \
+                        if length else 0
+        return self.record(reward, length, wall_hits, duration)
+
+    def flush(self):
+        if self._count:
+            self._buffer[:self._count].tofile(self._file)
+            self._file.flush()
+            self._count = 0
+            self.num_flushes += 1
+        self._last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+def read_metrics(path):
+    """Return the METRICS_RECORDs written to the log at path so far,
+mapped into memory"""
+    try:
+        n = os.path.getsize(path) // METRICS_RECORD.itemsize
+    except OSError:
+        n = 0
+    if n == 0:
+        return np.zeros(0, dtype = METRICS_RECORD)
+
+    # A log may be in the middle of writing the last record
+    return np.memmap(path, dtype = METRICS_RECORD, mode = 'r', shape = (n, ))
+
+def downsample_metrics(records, num_points):
+    """Average consecutive records into at most num_points records with
+the fields of METRICS_RECORD, all float64 except "episode".  Every field
+holds the mean over its group of records except "episode" and "time", which
+hold the values of the last record in the group."""
+    if num_points < 1:
+        raise ValueError('num_points must be > 0')
+    n = len(records)
+    if n <= num_points:
+        return np.array(records).astype(_DOWNSAMPLED_RECORD)
+    starts = (np.arange(num_points, dtype = np.int64) * n) // num_points
+    ends = np.concatenate((starts[1:], [ n ]))
+    counts = ends - starts
+    result = np.zeros(num_points, dtype = _DOWNSAMPLED_RECORD)
+    result['episode'] = records['episode'][ends - 1]
+    result['time'] = records['time'][ends - 1]
+    for name in ('reward', 'length', 'wall_hits', 'duration'):
+        sums = np.add.reduceat(records[name].astype(np.float64), starts)
+        result[name] = sums / counts
+    return result
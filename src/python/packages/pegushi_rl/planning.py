@@ -0,0 +1,306 @@
+"""Planning-augmented Q-learning for maze environments.
+
+The dynamics of a FixedMazeEnvironment are deterministic and fully described
+by its layout, so a MazeModel can compute the outcome of every (state,
+action) pair up front, along with a table of the (state, action) pairs that
+lead into each cell.  DynaQLearner replays random previously experienced
+pairs through the model after every real step.  PrioritizedSweepingLearner
+keeps a priority queue of pairs whose values are out of date, backs up the
+largest changes first and pushes the predecessors of every state whose value
+changed, so value changes flow backwards from the goal without the agent
+having to walk there again."""
+
+from pegushi_gym.envs.maze import compute_adjacency_mask
+
+import heapq
+import numpy as np
+
+class MazeModel:
+    """Deterministic model of a maze.
+Attributes are:
+    next_x, next_y  np.ndarray[int32]; (width, height, 4) arrays indexed
+                    [x, y, a] with the state reached by taking action a in
+                    state (x, y)
+
+    rewards         np.ndarray[float64]; (width, height, 4) array of the
+                    rewards for each (state, action) pair
+
+    terminal        np.ndarray[bool]; (width, height, 4) array that is True
+                    for the pairs that reach the goal
+"""
+    def __init__(self, layout, goal, goal_reward = 100.0, step_reward = -1.0,
+                 hit_wall_reward = -5.0):
+        """Create a new MazeModel.
+Arguments are:
+    layout           np.ndarray; Maze layout, as in FixedMazeEnvironment
+
+    goal             tuple(int, int); (x, y) coordinates of the goal
+
+    goal_reward      float; Reward for reaching the goal
+
+    step_reward      float; Reward for a step that does not hit a wall
+
+    hit_wall_reward  float; Reward for bumping into a wall
+"""
+        (height, width) = layout.shape
+        self.layout = layout
+        self.goal = tuple(goal)
+        self.width = width
+        self.height = height
+
+        # Work in [x, y] order to match the Q table
+        cells = compute_adjacency_mask(layout).T
+        xs = np.arange(0, width, dtype = np.int32)[:, np.newaxis]
+        ys = np.arange(0, height, dtype = np.int32)[np.newaxis, :]
+        xs = np.broadcast_to(xs, cells.shape)
+        ys = np.broadcast_to(ys, cells.shape)
+        open_ = ((cells[:, :, np.newaxis] >> np.arange(0, 4)) & 1) \
+                    .astype(np.bool_)
+
+        self.next_x = xs[:, :, np.newaxis] + \
+                          open_ * np.asarray([ 0, 1, 0, -1 ], dtype = np.int32)
+        self.next_y = ys[:, :, np.newaxis] + \
+                          open_ * np.asarray([ 1, 0, -1, 0 ], dtype = np.int32)
+        self.terminal = (self.next_x == goal[0]) & (self.next_y == goal[1]) & \
+                            open_
+        self.rewards = np.where(open_, step_reward, hit_wall_reward)
+        self.rewards[self.terminal] = goal_reward
+
+        self._build_predecessors()
+
+    @staticmethod
+    def from_environment(env):
+        return MazeModel(env._layout, env.goal, env.goal_reward,
+                         env.step_reward, env.hit_wall_reward)
+
+    def predecessors(self, x, y):
+        """Return (xs, ys, actions) arrays with every (state, action) pair
+that leads to state (x, y).  Pairs that bump into a wall lead back to their
+own state, and the goal is never a predecessor because episodes end there."""
+        i = x * self.height + y
+        start = self._offsets[i]
+        end = self._offsets[i + 1]
+        return (self._predecessor_x[start:end],
+                self._predecessor_y[start:end],
+                self._predecessor_actions[start:end])
+
+    def targets(self, q_function, xs, ys, actions, gamma):
+        """One-step Q-learning targets for arrays of (state, action) pairs,
+computed from the model.  Pairs that reach the goal do not bootstrap."""
+        nx = self.next_x[xs, ys, actions]
+        ny = self.next_y[xs, ys, actions]
+        future = q_function.max_q_batch(nx, ny)
+        return self.rewards[xs, ys, actions] + \
+                   gamma * np.where(self.terminal[xs, ys, actions], 0.0,
+                                    future)
+
+    def _build_predecessors(self):
+        # Compressed rows keyed by the flat index x * height + y of the
+        # state each pair leads to
+        (xs, ys, actions) = np.meshgrid(
+            np.arange(0, self.width, dtype = np.int32),
+            np.arange(0, self.height, dtype = np.int32),
+            np.arange(0, 4, dtype = np.int32), indexing = 'ij')
+        keep = (xs != self.goal[0]) | (ys != self.goal[1])
+        xs = xs[keep]
+        ys = ys[keep]
+        actions = actions[keep]
+
+        destinations = self.next_x[xs, ys, actions] * self.height + \
+                           self.next_y[xs, ys, actions]
+        order = np.argsort(destinations, kind = 'mergesort')
+        counts = np.bincount(destinations,
+                             minlength = self.width * self.height)
+        self._offsets = np.concatenate(([ 0 ], np.cumsum(counts)))
+        self._predecessor_x = xs[order]
+        self._predecessor_y = ys[order]
+        self._predecessor_actions = actions[order]
+
+class DynaQLearner:
+    def __init__(self, q_function, model, alpha = 0.1, gamma = 0.5,
+                 planning_steps = 10):
+        """Create a new DynaQLearner.
+Arguments are:
+    q_function      TabularQFunction or equivalent; The Q function being
+                    learned.  Its RNG chooses the pairs to replay.
+
+    model           MazeModel; Model of the maze
+
+    alpha           float; Learning rate
+
+    gamma           float; Discount rate
+
+    planning_steps  int; Number of (state, action) pairs replayed through
+                    the model after each real step
+"""
+        self.q = q_function
+        self.model = model
+        self.alpha = alpha
+        self.gamma = gamma
+        self.planning_steps = planning_steps
+
+        # Pairs seen so far, as flat indices into the Q table
+        self._seen = np.zeros(model.terminal.shape, dtype = np.bool_)
+        self._experienced = np.empty(model.terminal.size, dtype = np.int64)
+        self._num_experienced = 0
+
+    @property
+    def num_experienced(self):
+        """Number of distinct (state, action) pairs experienced so far"""
+        return self._num_experienced
+
+    def update(self, state, action, reward, next_state):
+        (x, y) = state
+        if next_state == self.model.goal:
+            target = reward
+        else:
+            target = reward + self.gamma * self.q.max_q(*next_state)
+        self.q.update(x, y, action, target, self.alpha)
+
+        if not self._seen[x, y, action]:
+            self._seen[x, y, action] = True
+            self._experienced[self._num_experienced] = \
+                np.ravel_multi_index((x, y, action), self._seen.shape)
+            self._num_experienced += 1
+
+        self.plan(self.planning_steps)
+        return self
+
+    def plan(self, num_steps):
+        """Replay num_steps randomly chosen experienced pairs through the
+model with one batched update"""
+        if (num_steps < 1) or not self._num_experienced:
+            return self
+        picks = self.q.rng.randint(0, self._num_experienced, size = num_steps)
+        (xs, ys, actions) = \
+            np.unravel_index(self._experienced[picks], self._seen.shape)
+        targets = self.model.targets(self.q, xs, ys, actions, self.gamma)
+        self.q.update_batch(xs, ys, actions, targets, self.alpha)
+        return self
+
+class PrioritizedSweepingLearner:
+    def __init__(self, q_function, model, alpha = 1.0, gamma = 0.5,
+                 theta = 1e-6, planning_steps = 100):
+        """Create a new PrioritizedSweepingLearner.
+Arguments are:
+    q_function      TabularQFunction or equivalent; The Q function being
+                    learned
+
+    model           MazeModel; Model of the maze
+
+    alpha           float; Learning rate.  The model is exact, so the
+                    default replaces values with their targets outright.
+
+    gamma           float; Discount rate
+
+    theta           float; Pairs whose values would change by no more than
+                    this are not queued
+
+    planning_steps  int; Maximum number of queued pairs backed up after each
+                    real step
+"""
+        self.q = q_function
+        self.model = model
+        self.alpha = alpha
+        self.gamma = gamma
+        self.theta = theta
+        self.planning_steps = planning_steps
+
+        # The queue holds (-priority, x, y, action).  A pair may be queued
+        # more than once; entries whose priority no longer matches
+        # self._priority are stale and skipped.
+        self._queue = [ ]
+        self._priority = np.zeros(model.terminal.shape)
+        self.num_backups = 0
+
+    @property
+    def queue_size(self):
+        """Number of entries in the queue, including stale ones"""
+        return len(self._queue)
+
+    def update(self, state, action, reward, next_state):
+        """Queue the pair that was just experienced and run up to
+planning_steps backups.  The reward and next state come from the model,
+which agrees with the environment."""
+        (x, y) = state
+        self._queue_pairs(np.asarray([ x ]), np.asarray([ y ]),
+                          np.asarray([ action ]))
+        self.plan(self.planning_steps)
+        return self
+
+    def queue_all(self):
+        """Queue every (state, action) pair whose value is out of date.
+Following this with sweep() solves the maze without any real steps."""
+        shape = self.model.terminal.shape
+        (xs, ys, actions) = \
+            np.unravel_index(np.arange(0, self._priority.size), shape)
+        keep = (xs != self.model.goal[0]) | (ys != self.model.goal[1])
+        self._queue_pairs(xs[keep], ys[keep], actions[keep])
+        return self
+
+    def plan(self, num_backups):
+        """Back up at most num_backups pairs in order of priority.  Returns
+the number of backups performed."""
+        count = 0
+        while self._queue and (count < num_backups):
+            (priority, x, y, a) = heapq.heappop(self._queue)
+            if -priority != self._priority[x, y, a]:
+                continue
+            self._priority[x, y, a] = 0.0
+
+            target = self.model.targets(self.q, x, y, a, self.gamma)
+            self.q.update(x, y, a, target, self.alpha)
+            count += 1
+
+            # The value of (x, y) may have changed, which changes the
+            # targets of everything leading into it
+            self._queue_pairs(*self.model.predecessors(x, y))
+
+        self.num_backups += count
+        return count
+
+    def sweep(self, max_backups = None):
+        """Back up pairs until the queue is empty or max_backups backups
+have been performed.  Returns the number of backups performed."""
+        if max_backups is None:
+            max_backups = np.inf
+        return self.plan(max_backups)
+
+    def _queue_pairs(self, xs, ys, actions):
+        if not len(xs):
+            return
+        targets = self.model.targets(self.q, xs, ys, actions, self.gamma)
+        priorities = np.abs(targets - self.q(xs, ys, actions))
+        queued = (priorities > self.theta) & \
+                     (priorities > self._priority[xs, ys, actions])
+        for i in np.flatnonzero(queued):
+            (x, y, a, p) = (xs[i], ys[i], actions[i], priorities[i])
+            self._priority[x, y, a] = p
+            heapq.heappush(self._queue, (-p, x, y, a))
+
+def run_episode(env, learner):
+    """Run one episode, choosing actions with learner.q.select_soft and
+calling learner.update() after every step.  Returns the trajectory in the
+same form as pegushi_rl.learners.sample_trajectory()."""
+    state = env.reset()
+    done = False
+    trajectory = [ ]
+    while not done:
+        action = learner.q.select_soft(*state)
+        (next_state, reward, done, _) = env.step(action)
+        learner.update(state, action, reward, next_state)
+        trajectory.append((state, action, reward))
+        state = next_state
+
+    trajectory.append((state, None, 0.0))
+    return trajectory
+
+def learn_with_planning(env, learner, num_iterations):
+    """Run num_iterations episodes with run_episode().  Returns a list of
+(trajectory, total reward) tuples, one per episode, as
+pegushi_rl.learners.learn() does."""
+    results = [ ]
+    for i in xrange(0, num_iterations):
+        t = run_episode(env, learner)
+        results.append((t, sum(step[2] for step in t)))
+    return results
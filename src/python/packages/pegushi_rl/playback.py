@@ -0,0 +1,243 @@
+"""Episode files and their playback.
+
+An EpisodeFileWriter appends trajectories to a file of fixed-size STEP_RECORDs
+and a second file, with the same name plus ".index", holding the first record
+and number of records of every episode.  EpisodeFile maps both into memory
+instead of reading them, so opening a file of any size is quick and only the
+episodes actually looked at are read from disk.  An episode is only listed in
+the index once all its records are written, so a file can be read while
+training is still writing it.
+
+TrajectoryPlayer replays an EpisodeFile on a FixedMazeEnvironment of its
+own, which only ever renders, at a given number of steps per second.  It can
+seek to any step of any episode, so it never needs the training environment
+or the whole run in memory."""
+
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+from pegushi_rl.learners import Trajectory
+
+import numpy as np
+import os
+import time
+
+# One record per state of an episode.  The record of the final state has
+# action -1 and reward 0.
+STEP_RECORD = np.dtype([ ('x', '<i4'), ('y', '<i4'), ('action', '<i1'),
+                         ('reward', '<f8') ])
+
+# One record per episode in an episode file's index
+EPISODE_INDEX_RECORD = np.dtype([ ('start', '<i8'), ('length', '<i4') ])
+
+class EpisodeFileWriter:
+    def __init__(self, path, append = True):
+        """Create a new EpisodeFileWriter.
+Arguments are:
+    path    str; Name of the episode file.  The index is written to path
+            plus ".index".
+
+    append  bool; If True, add episodes to the end of an existing file.
+            Otherwise, replace it.
+"""
+        mode = 'ab' if append else 'wb'
+        self.path = path
+        self._steps = open(path, mode)
+        self._index = open(path + '.index', mode)
+
+        # A crash can leave a partial index record, or steps of an episode
+        # that never made it into the index.  Both are dropped, so the new
+        # episodes follow the last complete one.
+        num_episodes = os.path.getsize(path + '.index') // \
+                           EPISODE_INDEX_RECORD.itemsize
+        os.ftruncate(self._index.fileno(),
+                     num_episodes * EPISODE_INDEX_RECORD.itemsize)
+        index = _map_records(path + '.index', EPISODE_INDEX_RECORD)
+        self._start = int(index[-1]['start']) + int(index[-1]['length']) \
+                          if len(index) else 0
+        del index
+        os.ftruncate(self._steps.fileno(),
+                     self._start * STEP_RECORD.itemsize)
+
+    def append(self, trajectory):
+        """Append a Trajectory, or a list of (state, action, reward) tuples
+as returned by sample_trajectory()"""
+        if not isinstance(trajectory, Trajectory):
+            trajectory = Trajectory.from_list(trajectory)
+        n = len(trajectory.states)
+        records = np.zeros(n, dtype = STEP_RECORD)
+        records['x'] = trajectory.states[:, 0]
+        records['y'] = trajectory.states[:, 1]
+        records['action'][0:-1] = trajectory.actions
+        records['action'][-1] = -1
+        records['reward'][0:-1] = trajectory.rewards
+        records.tofile(self._steps)
+        self._steps.flush()
+
+        # Written last, so readers never see an episode without its steps
+        np.asarray([ (self._start, n) ],
+                   dtype = EPISODE_INDEX_RECORD).tofile(self._index)
+        self._index.flush()
+        self._start += n
+
+    def close(self):
+        self._steps.close()
+        self._index.close()
+
+class EpisodeFile:
+    def __init__(self, path):
+        """Open the episode file written by an EpisodeFileWriter at path"""
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        """Pick up episodes written since the file was opened"""
+        self._index = _map_records(self.path + '.index', EPISODE_INDEX_RECORD)
+        self._records = _map_records(self.path, STEP_RECORD)
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def num_episodes(self):
+        return len(self._index)
+
+    def episode_length(self, episode):
+        """Number of steps (not states) in the given episode"""
+        return int(self._index[episode]['length']) - 1
+
+    def records(self, episode):
+        """Return the STEP_RECORDs of the given episode, without copying
+them"""
+        (start, length) = self._index[episode]
+        return self._records[start:start + length]
+
+    def trajectory(self, episode):
+        records = self.records(episode)
+        states = np.column_stack((records['x'], records['y']))
+        return Trajectory(states, records['action'][0:-1].astype(np.int32),
+                          np.array(records['reward'][0:-1]))
+
+def _map_records(path, dtype):
+    # Maps the complete records in the file.  A writer may be in the middle
+    # of appending the last one.
+    try:
+        n = os.path.getsize(path) // dtype.itemsize
+    except OSError:
+        n = 0
+    if n == 0:
+        return np.zeros(0, dtype = dtype)
+    return np.memmap(path, dtype = dtype, mode = 'r', shape = (n, ))
+
+class TrajectoryPlayer:
+    def __init__(self, episodes, layout, goal, steps_per_second = 10.0,
+                 tile_size = 32, viewport = None, mode = 'human'):
+        """Create a new TrajectoryPlayer.
+Arguments are:
+    episodes          EpisodeFile; Episodes to play back
+
+    layout            np.ndarray; Layout of the maze the episodes were
+                      recorded in, as in FixedMazeEnvironment
+
+    goal              tuple(int, int); (x, y) coordinates of the goal
+
+    steps_per_second  float; Playback speed.  It can be changed at any time.
+
+    tile_size, viewport
+                      Passed to the player's own FixedMazeEnvironment
+
+    mode              str; Rendering mode used to show each state.  Use
+                      "rgb_array" to play back offscreen.
+"""
+        if steps_per_second <= 0:
+            raise ValueError('steps_per_second must be > 0')
+        self.episodes = episodes
+        self.steps_per_second = steps_per_second
+        self.mode = mode
+        self._display = FixedMazeEnvironment(layout = layout, goal = goal,
+                                             tile_size = tile_size,
+                                             viewport = viewport)
+        self.episode = 0
+        self.step = 0
+
+    @staticmethod
+    def for_environment(episodes, env, **kwargs):
+        """Create a TrajectoryPlayer for episodes recorded in env.  The
+player copies env's layout and goal and never touches env itself."""
+        kwargs.setdefault('tile_size', env.tile_size)
+        kwargs.setdefault('viewport', env.viewport)
+        return TrajectoryPlayer(episodes, env._layout.copy(), env.goal,
+                                **kwargs)
+
+    @property
+    def at_end(self):
+        """True if the player is at the last state of the last episode"""
+        return (self.episode >= self.episodes.num_episodes - 1) and \
+            (self.step >= self.episodes.episode_length(self.episode))
+
+    @property
+    def state(self):
+        record = self.episodes.records(self.episode)[self.step]
+        return (int(record['x']), int(record['y']))
+
+    def seek(self, episode, step = 0):
+        """Move to the given step of the given episode and show it.  Returns
+what the rendering mode does."""
+        if not (0 <= episode < self.episodes.num_episodes):
+            raise ValueError('There is no episode %d' % episode)
+        if not (0 <= step <= self.episodes.episode_length(episode)):
+            raise ValueError('Episode %d has no step %d' % (episode, step))
+        (self.episode, self.step) = (episode, step)
+        return self.show()
+
+    def skip_to_episode(self, episode):
+        return self.seek(episode, 0)
+
+    def fast_forward(self, num_steps):
+        """Move num_steps steps forward, across episodes if necessary,
+without showing the steps in between.  Stops at the end of the last
+episode.  Returns what the rendering mode does."""
+        (episode, step) = (self.episode, self.step + num_steps)
+        last = self.episodes.num_episodes - 1
+        while (episode < last) and \
+              (step > self.episodes.episode_length(episode)):
+            step -= self.episodes.episode_length(episode) + 1
+            episode += 1
+        return self.seek(episode,
+                         min(step, self.episodes.episode_length(episode)))
+
+    def advance(self):
+        """Move to the next state and show it.  Returns False, without
+moving, at the end of the last episode."""
+        if self.at_end:
+            return False
+        self.fast_forward(1)
+        return True
+
+    def show(self):
+        self._display.teleport(*self.state)
+        return self._display.render(self.mode)
+
+    def play(self, num_steps = None, to_end_of_episode = False):
+        """Show states one after another at steps_per_second until
+num_steps steps have been shown, the current episode ends (if
+to_end_of_episode is True) or the last episode ends.  Returns the number
+of steps shown."""
+        shown = 0
+        next_time = time.time()
+        while (num_steps is None) or (shown < num_steps):
+            if to_end_of_episode and \
+               (self.step >= self.episodes.episode_length(self.episode)):
+                break
+            next_time += 1.0 / self.steps_per_second
+            if not self.advance():
+                break
+            shown += 1
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Don't try to catch up after falling behind
+                next_time = time.time()
+        return shown
+
+    def close(self):
+        self._display.close()
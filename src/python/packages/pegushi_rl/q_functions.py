@@ -0,0 +1,401 @@
+"""Tabular Q functions"""
+
+import collections
+import copy
+import multiprocessing.sharedctypes
+import numpy as np
+import os.path
+
+class TabularQFunction:
+    """Implementation of Q function with a 3D tensor (x, y, action) with both
+hard and soft action selection functions."""
+    def __init__(self, q_table, rng):
+        self.q_table = q_table
+        self.num_actions = q_table.shape[-1]
+        self.rng = rng
+
+    def __call__(self, x, y, a):
+        return self.q_table[x, y, a]
+
+    def max_q(self, x, y):
+        return np.max(self.q_table[x, y, :])
+
+    def max_q_batch(self, xs, ys):
+        """Vectorized max_q() for arrays of x and y coordinates"""
+        return self.q_table[xs, ys, :].max(axis = -1)
+
+    def select_hard(self, x, y, mask = None):
+        """Select the action with the highest q-value and lowest action
+number.  If mask is not None, only actions where it is True are considered,
+as with the action masks reported by FixedMazeEnvironment."""
+        return _masked(self.q_table[x, y, :], mask).argmax()
+
+    def select_hard_batch(self, xs, ys, masks = None):
+        """Vectorized select_hard() for arrays of x and y coordinates and an
+optional (n, actions) array of masks"""
+        return _masked(self.q_table[xs, ys, :], masks).argmax(axis = -1)
+
+    def select_soft(self, x, y, mask = None):
+        """Draw action from a categorical distribution whose parameters are
+computed from a softmax over the q-values for the given state.  If mask is
+not None, actions where it is False are never chosen."""
+        q = self.soft_q_distribution(x, y, mask)
+        p = self.rng.uniform()
+
+        # Assume action space is relatively small, so a linear search is
+        # not very inefficient.  Otherwise, replace with a binary search
+        for i in xrange(0, self.num_actions):
+            if p < q[i]:
+                return i
+            p -= q[i]
+
+        return self.num_actions - 1
+
+    def soft_q_distribution(self, x, y, mask = None):
+        values = _masked(self.q_table[x, y, :], mask)
+        values = np.exp(values - np.max(values))
+        return values / np.sum(values)
+
+    def update(self, x, y, a, v, alpha = 1.0):
+        u = self.q_table[x, y, a]
+        self.q_table[x, y, a] = (1.0 - alpha) * u + alpha * v
+
+    def update_batch(self, xs, ys, actions, targets, alpha = 1.0):
+        """Vectorized update().  alpha may be a scalar or an array.  If a
+(state, action) pair appears more than once, only its last update takes
+effect."""
+        u = self.q_table[xs, ys, actions]
+        self.q_table[xs, ys, actions] = (1.0 - alpha) * u + alpha * targets
+
+    def copy(self):
+        return TabularQFunction(self.q_table.copy(), self.rng)
+
+    def with_rng(self, rng):
+        """Return a TabularQFunction that shares this function's table but
+uses a different RNG"""
+        return TabularQFunction(self.q_table, rng)
+
+    @staticmethod
+    def zeros(q_function):
+        return TabularQFunction(np.zeros(q_function.q_table.shape),
+                                q_function.rng)
+
+    @staticmethod
+    def from_maze_zeros(maze, rng):
+        """Q-function for maze environment initialized to all zeros"""
+        q_table = np.zeros(_maze_q_table_shape(maze))
+        return TabularQFunction(q_table, rng)
+
+    @staticmethod
+    def from_maze_normal(maze, rng):
+        """Q function for maze environment initialized with standard normal
+distribution"""
+        q_table = rng.normal(0.0, 1.0, size = _maze_q_table_shape(maze))
+        return TabularQFunction(q_table, rng)
+
+class SharedTabularQFunction(TabularQFunction):
+    """TabularQFunction whose table lives in shared memory.  Processes forked
+after the table is created see and modify the same table, with no locking,
+as in Hogwild! (Niu et al.).  Updates from different processes can
+interleave, so a reader may see a partly updated state's values."""
+    def __init__(self, shape, rng, initial_values = None):
+        """Create a new SharedTabularQFunction.
+Arguments are:
+    shape           tuple(int, int, int); Shape of the table as
+                    (width, height, number of actions)
+
+    rng             np.random.RandomState or equivalent; The Q function's
+                    source of random numbers.  Each process using the table
+                    should call with_rng() to get its own.
+
+    initial_values  np.ndarray; Initial contents of the table.  If None,
+                    the table starts at zero.
+"""
+        self._shared = multiprocessing.sharedctypes.RawArray(
+            'd', int(np.prod(shape)))
+        q_table = np.frombuffer(self._shared, dtype = np.float64)\
+                    .reshape(shape)
+        if initial_values is not None:
+            q_table[:] = initial_values
+        TabularQFunction.__init__(self, q_table, rng)
+
+    def snapshot(self):
+        """Return a TabularQFunction holding a private copy of the table"""
+        return TabularQFunction(self.q_table.copy(), self.rng)
+
+    @staticmethod
+    def from_maze_zeros(maze, rng):
+        return SharedTabularQFunction(_maze_q_table_shape(maze), rng)
+
+class ChunkedTabularQFunction(TabularQFunction):
+    """TabularQFunction whose table is split into fixed-size chunks of
+chunk_shape[0] x chunk_shape[1] states that are allocated the first time one
+of their values is written.  Reads from unallocated chunks return
+initial_value.  Memory use is proportional to the area the agent has
+explored rather than the size of the maze.
+
+If spill_directory is given, at most max_resident_chunks chunks are kept in
+memory.  When another chunk is allocated, the least-recently-used resident
+chunk moves to a memory-mapped file in spill_directory, where the operating
+system can page it out.  Spilled chunks stay memory-mapped.  They all live
+in one sparse file, chunks.dat, with a slot for every chunk of the table,
+so spilling holds a single file open however many chunks are spilled.
+
+This class has the same methods as TabularQFunction, but no q_table
+attribute.  Use to_dense() to get the whole table as an array."""
+    def __init__(self, shape, rng, chunk_shape = (64, 64),
+                 dtype = np.float32, initial_value = 0.0,
+                 spill_directory = None, max_resident_chunks = None):
+        if (spill_directory is None) != (max_resident_chunks is None):
+            raise ValueError('spill_directory and max_resident_chunks must '
+                             'be given together')
+        self.shape = tuple(shape)
+        self.num_actions = shape[-1]
+        self.rng = rng
+        self.chunk_shape = tuple(chunk_shape)
+        self.dtype = np.dtype(dtype)
+        self.initial_value = initial_value
+        self.spill_directory = spill_directory
+        self.max_resident_chunks = max_resident_chunks
+
+        # Chunk (i, j) covers x in [i * chunk_shape[0], (i + 1) *
+        # chunk_shape[0]) and likewise for y.  It is stored under the key
+        # i * self._chunks_y + j.
+        self._chunks_y = -(-shape[1] // chunk_shape[1])
+        self._chunks = { }
+
+        # Memory-mapped spill file, indexed by chunk key.  Created when the
+        # first chunk is spilled.
+        self._spill_file = None
+
+        # Keys of chunks held in memory, least recently used first.  Only
+        # maintained when spilling is enabled.
+        self._resident = collections.OrderedDict()
+
+        # Keys of chunks written since they were last marked clean
+        self._dirty = set()
+
+    @property
+    def num_chunks(self):
+        """Number of allocated chunks, resident or spilled"""
+        return len(self._chunks)
+
+    @property
+    def num_resident_chunks(self):
+        if self.spill_directory is None:
+            return len(self._chunks)
+        return len(self._resident)
+
+    @property
+    def chunk_keys(self):
+        """Keys of the allocated chunks, in increasing order"""
+        return sorted(self._chunks)
+
+    @property
+    def dirty_chunks(self):
+        """Keys of the chunks written since they were last passed to
+mark_clean(), or since the function was created"""
+        return sorted(self._dirty)
+
+    def mark_clean(self, keys = None):
+        """Stop counting the chunks with the given keys, or all chunks if
+keys is None, as dirty until they are written again"""
+        if keys is None:
+            self._dirty.clear()
+        else:
+            self._dirty.difference_update(keys)
+
+    def get_chunk(self, key):
+        """Return the chunk with the given key, or None if it is not
+allocated"""
+        return self._get_chunk(key)
+
+    def set_chunk(self, key, values):
+        """Make values, an array of shape chunk_shape + (num_actions, ),
+the chunk with the given key.  The array is used as is, not copied, so it
+can be memory-mapped.  The chunk is not marked dirty."""
+        if values.shape != self.chunk_shape + (self.num_actions, ):
+            raise ValueError('A chunk must have shape %s'
+                             % repr(self.chunk_shape + (self.num_actions, )))
+        if key in self._resident:
+            del self._resident[key]
+        self._chunks[key] = values
+
+    @property
+    def allocated_bytes(self):
+        """Bytes allocated for chunks held in memory"""
+        return self.num_resident_chunks * self._chunk_bytes()
+
+    def __call__(self, x, y, a):
+        if np.ndim(x) == 0:
+            chunk = self._find_chunk(x, y)
+            if chunk is None:
+                return self.dtype.type(self.initial_value)
+            return chunk[x % self.chunk_shape[0], y % self.chunk_shape[1], a]
+        return self._gather(x, y, a)
+
+    def values(self, x, y):
+        """Return the values of every action in state (x, y)"""
+        chunk = self._find_chunk(x, y)
+        if chunk is None:
+            return np.full(self.num_actions, self.initial_value,
+                           dtype = self.dtype)
+        return chunk[x % self.chunk_shape[0], y % self.chunk_shape[1], :]
+
+    def max_q(self, x, y):
+        return np.max(self.values(x, y))
+
+    def max_q_batch(self, xs, ys):
+        return self._gather(xs, ys).max(axis = -1)
+
+    def select_hard(self, x, y, mask = None):
+        return _masked(self.values(x, y), mask).argmax()
+
+    def select_hard_batch(self, xs, ys, masks = None):
+        return _masked(self._gather(xs, ys), masks).argmax(axis = -1)
+
+    def soft_q_distribution(self, x, y, mask = None):
+        values = _masked(self.values(x, y).astype(np.float64), mask)
+        values = np.exp(values - np.max(values))
+        return values / np.sum(values)
+
+    def update(self, x, y, a, v, alpha = 1.0):
+        chunk = self._find_chunk(x, y, True)
+        (i, j) = (x % self.chunk_shape[0], y % self.chunk_shape[1])
+        chunk[i, j, a] = (1.0 - alpha) * chunk[i, j, a] + alpha * v
+
+    def update_batch(self, xs, ys, actions, targets, alpha = 1.0):
+        alpha = np.broadcast_to(alpha, np.shape(targets))
+        for (key, selected, cx, cy) in self._group_by_chunk(xs, ys):
+            chunk = self._get_chunk(key, True)
+            a = np.asarray(actions)[selected]
+            rate = alpha[selected]
+            u = chunk[cx, cy, a]
+            chunk[cx, cy, a] = (1.0 - rate) * u + \
+                               rate * np.asarray(targets)[selected]
+
+    def copy(self):
+        """Return a copy with every chunk held in memory and spilling
+disabled"""
+        result = ChunkedTabularQFunction(self.shape, self.rng,
+                                         self.chunk_shape, self.dtype,
+                                         self.initial_value)
+        result._chunks = dict((k, np.array(c))
+                              for (k, c) in self._chunks.iteritems())
+        result._dirty = set(self._chunks)
+        return result
+
+    def with_rng(self, rng):
+        """Return a ChunkedTabularQFunction that shares this function's
+chunks and spill state but uses a different RNG"""
+        result = copy.copy(self)
+        result.rng = rng
+        return result
+
+    def to_dense(self):
+        """Return the whole table as a (width, height, actions) array"""
+        table = np.full(self.shape, self.initial_value, dtype = self.dtype)
+        (w, h) = self.chunk_shape
+        for (key, chunk) in self._chunks.iteritems():
+            (i, j) = divmod(key, self._chunks_y)
+            region = table[i * w:(i + 1) * w, j * h:(j + 1) * h]
+            region[:] = chunk[:region.shape[0], :region.shape[1]]
+        return table
+
+    @staticmethod
+    def from_maze_zeros(maze, rng, **kwargs):
+        """Q function for maze environment initialized to all zeros.
+Keyword arguments are passed to the constructor."""
+        return ChunkedTabularQFunction(_maze_q_table_shape(maze), rng,
+                                       **kwargs)
+
+    def _chunk_bytes(self):
+        return self.chunk_shape[0] * self.chunk_shape[1] * \
+               self.num_actions * self.dtype.itemsize
+
+    def _find_chunk(self, x, y, create = False):
+        key = (x // self.chunk_shape[0]) * self._chunks_y + \
+              (y // self.chunk_shape[1])
+        return self._get_chunk(key, create)
+
+    def _get_chunk(self, key, create = False):
+        chunk = self._chunks.get(key)
+        if self.spill_directory is not None:
+            if key in self._resident:
+                # Mark as most recently used
+                del self._resident[key]
+                self._resident[key] = True
+            elif (chunk is None) and create:
+                self._spill_if_needed()
+                self._resident[key] = True
+        if create:
+            self._dirty.add(key)
+            if chunk is None:
+                chunk = np.full(self.chunk_shape + (self.num_actions, ),
+                                self.initial_value, dtype = self.dtype)
+                self._chunks[key] = chunk
+        return chunk
+
+    def _spill_if_needed(self):
+        while len(self._resident) >= self.max_resident_chunks:
+            (key, _) = self._resident.popitem(last = False)
+            if self._spill_file is None:
+                num_chunks = -(-self.shape[0] // self.chunk_shape[0]) * \
+                                 self._chunks_y
+                self._spill_file = np.memmap(
+                    os.path.join(self.spill_directory, 'chunks.dat'),
+                    dtype = self.dtype, mode = 'w+',
+                    shape = (num_chunks, ) + self.chunk_shape +
+                                (self.num_actions, ))
+            spilled = self._spill_file[key]
+            spilled[:] = self._chunks[key]
+            self._chunks[key] = spilled
+
+    def _group_by_chunk(self, xs, ys):
+        """Yield (chunk key, indices into xs and ys, x offsets within the
+chunk, y offsets within the chunk) for each chunk the states fall in"""
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        if len(xs) == 0:
+            return
+        keys = (xs // self.chunk_shape[0]) * self._chunks_y + \
+               (ys // self.chunk_shape[1])
+
+        # A stable sort keeps states within a chunk in their original
+        # order, so the last of several updates to one value wins
+        order = np.argsort(keys, kind = 'mergesort')
+        sorted_keys = keys[order]
+        bounds = np.concatenate(([ 0 ],
+                                 np.flatnonzero(np.diff(sorted_keys)) + 1,
+                                 [ len(order) ]))
+        for (start, end) in zip(bounds[:-1], bounds[1:]):
+            selected = order[start:end]
+            yield (sorted_keys[start], selected,
+                   xs[selected] % self.chunk_shape[0],
+                   ys[selected] % self.chunk_shape[1])
+
+    def _gather(self, xs, ys, actions = None):
+        n = len(xs)
+        shape = (n, ) if actions is not None else (n, self.num_actions)
+        result = np.full(shape, self.initial_value, dtype = self.dtype)
+        for (key, selected, cx, cy) in self._group_by_chunk(xs, ys):
+            chunk = self._get_chunk(key)
+            if chunk is None:
+                continue
+            if actions is None:
+                result[selected] = chunk[cx, cy, :]
+            else:
+                result[selected] = chunk[cx, cy,
+                                         np.asarray(actions)[selected]]
+        return result
+
+def _masked(values, mask):
+    # Masked-out actions get -inf, so they lose every argmax and get zero
+    # probability in a softmax
+    if mask is None:
+        return values
+    return np.where(mask, values, -np.inf)
+
+def _maze_q_table_shape(maze):
+    return (maze.observation_space.nvec[0], maze.observation_space.nvec[1],
+            maze.action_space.n)
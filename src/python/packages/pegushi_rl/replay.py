@@ -0,0 +1,208 @@
+"""Experience replay memories"""
+
+from gym.utils.seeding import np_random
+import numpy as np
+
+class ReplayMemory:
+    """Replay memory that stores the last "size" transitions and samples
+minibatches from them uniformly."""
+    def __init__(self, size = 1000000, state_shape = (2, ),
+                 state_dtype = np.int32, batch_size = 32, rng = None):
+        """Create a new ReplayMemory.
+Arguments are:
+    size         int; Number of stored transitions.  Once the memory is
+                 full, new transitions overwrite the oldest ones.
+
+    state_shape  tuple(int); Shape of a single state.  The default is
+                 suitable for the (x, y) states of FixedMazeEnvironment
+
+    state_dtype  numpy.dtype; Type used to store states
+
+    batch_size   int; Number of transitions returned in a minibatch
+
+    rng          np.random.RandomState or equivalent; Source of random
+                 numbers used to sample minibatches.  If None, the memory
+                 creates its own using gym.utils.seeding.np_random()
+"""
+        if size < 1:
+            raise ValueError('size must be > 0')
+        if batch_size < 1:
+            raise ValueError('batch_size must be > 0')
+        if rng is None:
+            (rng, _) = np_random()
+
+        self.size = size
+        self.state_shape = tuple(state_shape)
+        self.batch_size = batch_size
+        self.rng = rng
+        self.count = 0
+        self.current = 0
+
+        # Pre-allocate memory
+        self.states = np.empty((size, ) + self.state_shape,
+                               dtype = state_dtype)
+        self.actions = np.empty(size, dtype = np.int32)
+        self.rewards = np.empty(size, dtype = np.float32)
+        self.next_states = np.empty((size, ) + self.state_shape,
+                                    dtype = state_dtype)
+        self.terminal_flags = np.empty(size, dtype = np.bool_)
+
+        # Indices of the transitions in the last minibatch
+        self.indices = np.empty(batch_size, dtype = np.int64)
+
+    def __len__(self):
+        return self.count
+
+    def add_experience(self, state, action, reward, next_state, terminal):
+        """Add a transition to the memory and return the slot it occupies."""
+        index = self.current
+        self.states[index] = state
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.next_states[index] = next_state
+        self.terminal_flags[index] = terminal
+        self.count = max(self.count, index + 1)
+        self.current = (index + 1) % self.size
+        return index
+
+    def add_trajectory(self, trajectory):
+        """Add every transition in a trajectory of (state, action, reward)
+tuples, terminated by a (state, None, 0.0) tuple, as returned by
+sample_trajectory()"""
+        last = len(trajectory) - 2
+        for i in xrange(0, last + 1):
+            (state, action, reward) = trajectory[i]
+            next_state = trajectory[i + 1][0]
+            self.add_experience(state, action, reward, next_state, i == last)
+
+    def get_minibatch(self):
+        """Sample a minibatch of self.batch_size transitions.  Returns
+(states, actions, rewards, next_states, terminal_flags).  The indices of the
+sampled transitions are left in self.indices."""
+        if self.count == 0:
+            raise ValueError('The replay memory is empty')
+        self.indices[:] = self._sample_indices()
+        return self._gather(self.indices)
+
+    def _sample_indices(self):
+        return self.rng.randint(0, self.count, size = self.batch_size)
+
+    def _gather(self, indices):
+        return (self.states[indices], self.actions[indices],
+                self.rewards[indices], self.next_states[indices],
+                self.terminal_flags[indices])
+
+class SumTree:
+    """Array-backed binary tree whose internal nodes hold the sum of the
+priorities of the leaves below them.  Supports O(log n) updates and O(log n)
+proportional sampling, both batched over numpy arrays."""
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('capacity must be > 0')
+        self.capacity = capacity
+
+        # Number of leaves, rounded up to a power of two so every leaf
+        # is at the same depth.  Node i has children 2i and 2i + 1 and
+        # the root is node 1.  Node 0 is unused.
+        self._depth = int(np.ceil(np.log2(capacity))) if capacity > 1 else 0
+        self._first_leaf = 1 << self._depth
+        self._tree = np.zeros(2 * self._first_leaf, dtype = np.float64)
+
+    @property
+    def total(self):
+        return self._tree[1]
+
+    def __getitem__(self, indices):
+        return self._tree[self._first_leaf + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        """Set the priorities of the leaves at the given indices.  Both
+arguments may be scalars or arrays.  If an index appears more than once,
+the last priority given for it wins."""
+        nodes = self._first_leaf + np.atleast_1d(indices)
+        self._tree[nodes] = priorities
+        for _ in xrange(0, self._depth):
+            nodes = np.unique(nodes >> 1)
+            self._tree[nodes] = self._tree[2 * nodes] + \
+                                self._tree[2 * nodes + 1]
+
+    def find(self, values):
+        """For each value in [0, total), return the index of the leaf whose
+cumulative priority range contains it."""
+        values = np.array(values, dtype = np.float64, ndmin = 1)
+        nodes = np.ones(values.shape, dtype = np.int64)
+        for _ in xrange(0, self._depth):
+            nodes <<= 1
+            left = self._tree[nodes]
+            go_right = values >= left
+            values -= np.where(go_right, left, 0.0)
+            nodes += go_right
+        leaves = nodes - self._first_leaf
+
+        # Rounding error can push a value just past the last leaf with
+        # nonzero priority into an empty one.
+        return np.minimum(leaves, self.capacity - 1)
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """Replay memory that samples transitions with probability proportional
+to their priority raised to the power alpha (Schaul et al., "Prioritized
+Experience Replay").  Priorities are kept in a SumTree.
+
+get_minibatch() returns the same tuple as ReplayMemory.get_minibatch().
+The importance-sampling weights for the batch are left in self.weights and
+the indices in self.indices.  After computing the TD errors for the batch,
+pass them to update_priorities() along with self.indices."""
+    def __init__(self, size = 1000000, state_shape = (2, ),
+                 state_dtype = np.int32, batch_size = 32, rng = None,
+                 alpha = 0.6, beta = 0.4, epsilon = 1.0e-6):
+        """Create a new PrioritizedReplayMemory.
+Arguments are the same as ReplayMemory, plus:
+    alpha    float; How strongly sampling favors high-priority transitions.
+             Zero gives uniform sampling.
+
+    beta     float; Exponent of the importance-sampling correction.  One
+             fully compensates for the non-uniform sampling.  Callers
+             usually anneal this towards one over the course of training.
+
+    epsilon  float; Added to the magnitude of each TD error so no
+             transition's priority falls to zero
+"""
+        ReplayMemory.__init__(self, size, state_shape, state_dtype,
+                              batch_size, rng)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.weights = np.ones(batch_size, dtype = np.float32)
+        self._priorities = SumTree(size)
+
+    def add_experience(self, state, action, reward, next_state, terminal):
+        # New transitions get the largest priority seen so far, so they
+        # are sampled at least once before their TD error is known.
+        index = ReplayMemory.add_experience(self, state, action, reward,
+                                            next_state, terminal)
+        self._priorities.update(index, self.max_priority ** self.alpha)
+        return index
+
+    def get_minibatch(self):
+        batch = ReplayMemory.get_minibatch(self)
+
+        probabilities = self._priorities[self.indices] / self._priorities.total
+        weights = (self.count * probabilities) ** -self.beta
+        self.weights[:] = weights / weights.max()
+        return batch
+
+    def update_priorities(self, indices, td_errors):
+        """Set the priorities of the transitions at the given indices from
+the magnitudes of their TD errors."""
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, priorities.max())
+        self._priorities.update(indices, priorities ** self.alpha)
+
+    def _sample_indices(self):
+        # Stratified sampling: split the total priority into batch_size
+        # equal segments and draw one value from each
+        segment = self._priorities.total / self.batch_size
+        values = (np.arange(self.batch_size) + \
+                  self.rng.uniform(size = self.batch_size)) * segment
+        return np.minimum(self._priorities.find(values), self.count - 1)
@@ -0,0 +1,192 @@
+"""Run many tabular Q-learning trials in parallel.
+
+A trial trains a TabularQFunction on one FixedMazeEnvironment with one seed,
+learning rate and discount rate.  run_trials() farms trials out to a pool of
+worker processes.  Each worker appends one record per episode to the trial's
+file in a TrialResultsStore as soon as the episode finishes, so the learning
+curves of a sweep can be read while it is still running."""
+
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+from pegushi_rl.learners import QLearner, sample_trajectory, \
+                                trajectory_reward
+from pegushi_rl.q_functions import TabularQFunction
+from gym.utils.seeding import hash_seed, np_random
+
+import cPickle
+import itertools
+import multiprocessing
+import numpy as np
+import os
+import os.path
+
+# One record per episode in a trial's results file
+EPISODE_RECORD = np.dtype([ ('episode', '<i4'), ('reward', '<f8'),
+                            ('length', '<i4') ])
+
+def derive_seed(base_seed, *keys):
+    """Derive a seed from base_seed and a sequence of keys (usually trial
+coordinates such as the maze and replicate numbers).  The same arguments
+always produce the same seed, and different keys produce uncorrelated
+seeds."""
+    return hash_seed(':'.join(str(k) for k in (base_seed, ) + keys))
+
+class Trial:
+    """Parameters for a single training run"""
+    def __init__(self, index, maze, seed, alpha, gamma, num_episodes):
+        """Create a new Trial.
+Arguments are:
+    index         int; Unique number of the trial within its sweep
+
+    maze          dict; Keyword arguments for FixedMazeEnvironment.  These
+                  should include "layout" or "seed" so every trial using
+                  the same configuration trains on the same maze
+
+    seed          int; Seed for the Q function's RNG
+
+    alpha         float; Learning rate
+
+    gamma         float; Discount rate
+
+    num_episodes  int; Number of episodes to train for
+"""
+        self.index = index
+        self.maze = maze
+        self.seed = seed
+        self.alpha = alpha
+        self.gamma = gamma
+        self.num_episodes = num_episodes
+
+    def __repr__(self):
+        return 'Trial(index = %d, seed = %d, alpha = %s, gamma = %s)' % \
+            (self.index, self.seed, self.alpha, self.gamma)
+
+def make_trials(maze_configs, num_seeds, alphas, gammas, num_episodes,
+                base_seed = 0):
+    """Create one trial for every combination of maze configuration,
+replicate, alpha and gamma.  Seeds depend only on base_seed and the maze and
+replicate numbers, so trials that differ only in alpha or gamma share the
+same seed.  Maze configurations without a "seed" get one derived from
+base_seed, even if they give a "layout", since the environment's RNG also
+places the start and goal when they are not given."""
+    trials = [ ]
+    for (m, config) in enumerate(maze_configs):
+        if config.get('seed') is None:
+            config = dict(config, seed = derive_seed(base_seed, 'maze', m))
+        for (r, alpha, gamma) in itertools.product(xrange(0, num_seeds),
+                                                   alphas, gammas):
+            seed = derive_seed(base_seed, 'trial', m, r)
+            trials.append(Trial(len(trials), config, seed, alpha, gamma,
+                                num_episodes))
+    return trials
+
+class TrialResultsStore:
+    """Directory holding the trials of a sweep and their results.  The file
+"trials.pkl" lists the trials, "trial-NNNNNN.dat" holds the EPISODE_RECORDs
+for trial NNNNNN in episode order, and "trial-NNNNNN.done" marks a trial
+that finished.  Readers may open the store while workers are still
+writing."""
+    def __init__(self, path):
+        self.path = path
+
+    def initialize(self, trials):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(os.path.join(self.path, 'trials.pkl'), 'wb') as f:
+            cPickle.dump(trials, f, cPickle.HIGHEST_PROTOCOL)
+
+    def trials(self):
+        with open(os.path.join(self.path, 'trials.pkl'), 'rb') as f:
+            return cPickle.load(f)
+
+    def writer(self, trial_index):
+        return _TrialResultsWriter(self._results_file(trial_index))
+
+    def mark_done(self, trial_index):
+        open(self._done_file(trial_index), 'w').close()
+
+    def is_done(self, trial_index):
+        return os.path.exists(self._done_file(trial_index))
+
+    def read(self, trial_index):
+        """Return the EPISODE_RECORDs written so far for the given trial"""
+        try:
+            with open(self._results_file(trial_index), 'rb') as f:
+                data = f.read()
+        except IOError:
+            return np.zeros(0, dtype = EPISODE_RECORD)
+
+        # A worker may be in the middle of writing the last record
+        n = len(data) // EPISODE_RECORD.itemsize
+        return np.frombuffer(data[:n * EPISODE_RECORD.itemsize],
+                             dtype = EPISODE_RECORD)
+
+    def learning_curves(self):
+        """Return a dict mapping trial index to the records written so far
+for every trial in the store"""
+        return dict((t.index, self.read(t.index)) for t in self.trials())
+
+    def _results_file(self, trial_index):
+        return os.path.join(self.path, 'trial-%06d.dat' % trial_index)
+
+    def _done_file(self, trial_index):
+        return os.path.join(self.path, 'trial-%06d.done' % trial_index)
+
+class _TrialResultsWriter:
+    def __init__(self, filename):
+        self._file = open(filename, 'wb')
+        self._record = np.zeros(1, dtype = EPISODE_RECORD)
+
+    def append(self, episode, reward, length):
+        self._record[0] = (episode, reward, length)
+        self._record.tofile(self._file)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def run_trial(trial, store):
+    """Train a Q function for the given trial, streaming one record per
+episode into the store.  Returns the trained Q function."""
+    env = FixedMazeEnvironment(**trial.maze)
+    (rng, _) = np_random(trial.seed)
+    policy = TabularQFunction.from_maze_zeros(env, rng)
+    learner = QLearner(policy, trial.alpha, trial.gamma)
+
+    writer = store.writer(trial.index)
+    try:
+        for episode in xrange(0, trial.num_episodes):
+            t = sample_trajectory(env, policy.select_soft)
+            learner.update_trajectory(t)
+            writer.append(episode, trajectory_reward(t), len(t) - 1)
+    finally:
+        writer.close()
+        env.close()
+    store.mark_done(trial.index)
+    return policy
+
+def _run_trial_in_worker(args):
+    (trial, store_path) = args
+    run_trial(trial, TrialResultsStore(store_path))
+    return trial.index
+
+def run_trials(trials, store_path, num_processes = None):
+    """Run trials on a pool of num_processes worker processes (one per core
+if None), writing results to a TrialResultsStore at store_path.  Trials
+already marked done in the store are skipped, so an interrupted sweep can
+be restarted.  Returns the store."""
+    store = TrialResultsStore(store_path)
+    store.initialize(trials)
+    pending = [ (t, store_path) for t in trials if not store.is_done(t.index) ]
+
+    pool = multiprocessing.Pool(num_processes)
+    try:
+        # chunksize = 1 so long trials don't hold up a queue of short ones
+        for _ in pool.imap_unordered(_run_trial_in_worker, pending, 1):
+            pass
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return store
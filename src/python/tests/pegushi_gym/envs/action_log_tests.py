@@ -0,0 +1,162 @@
+"""Unit tests for pegushi_gym.envs.action_log"""
+from pegushi_gym.envs.action_log import *
+from pegushi_gym.envs.maze import FixedMazeEnvironment, generate_random_maze
+from pegushi_gym.envs.grid.generic.environment import GenericGridEnvironment
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import cPickle
+import gym.spaces
+import numpy as np
+import os
+import shutil
+import tempfile
+
+class _Agent:
+    action_space = gym.spaces.Discrete(2)
+
+class _CounterState:
+    # Minimal state for GenericGridEnvironment: a counter that action 1
+    # increments, and that randomly decrements
+    state_space = gym.spaces.Discrete(1000)
+    agent = _Agent()
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.count = 0
+
+    def visible(self):
+        return self.count
+
+    def execute(self, action):
+        self.count += action - (self.rng.rand() < 0.3)
+        return (self, 1.0)
+
+    def is_terminal(self):
+        return False
+
+    def save(self):
+        return cPickle.dumps(self.count)
+
+    def restore(self, saved):
+        self.count = cPickle.loads(saved)
+
+class ActionLogTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.layout = generate_random_maze(10, 8, 'kruskal', seed = 9)
+        self.maze = FixedMazeEnvironment(layout = self.layout,
+                                         start = (0, 0), goal = (9, 7),
+                                         seed = 9, max_steps = 100)
+
+        # Record two episodes of random actions, keeping every state
+        writer = ActionLogWriter(self.directory, keyframe_interval = 16)
+        (rng, _) = np_random(9)
+        self.states = [ ]
+        for episode in xrange(0, 2):
+            states = [ self.maze.reset() ]
+            writer.begin_episode(self.maze)
+            done = False
+            while not done:
+                action = rng.randint(0, 4)
+                (state, _, done, _) = self.maze.step(action)
+                writer.record(action)
+                states.append(state)
+            self.assertEqual(episode, writer.end_episode())
+            self.states.append(states)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_restore(self):
+        log = ActionLog(self.directory)
+        self.assertEqual(2, log.num_episodes)
+        self.assertEqual(9, log.header(0)['seed'])
+        copy = FixedMazeEnvironment(layout = self.layout.copy(),
+                                    start = (0, 0), goal = (9, 7), seed = 1,
+                                    max_steps = 100)
+        for episode in (1, 0):
+            states = self.states[episode]
+            self.assertEqual(len(states) - 1, log.episode_length(episode))
+            for step in xrange(len(states) - 1, -1, -1):
+                replayed = log.restore(copy, episode, step)
+                self.assertTrue(replayed < 16)
+                self.assertEqual(states[step], copy.current_state)
+                self.assertEqual(step, copy.tick)
+
+        replayed = [ s for (s, _, _, _) in log.replay(copy, 1) ]
+        self.assertEqual(self.states[1][1:], replayed)
+        self.assertRaises(ValueError, log.restore, copy, 0,
+                          len(self.states[0]))
+
+    def test_unused_rng_state_is_not_saved(self):
+        # Stepping a maze never draws from its rng
+        log = ActionLog(self.directory)
+        rng_states = log._load(0)['rng_states'].tobytes()
+        self.assertEqual(None, cPickle.loads(rng_states))
+        state = self.maze.rng.get_state()
+        log.restore(self.maze, 0, 20)
+        self.assertTrue(np.array_equal(state[1],
+                                       self.maze.rng.get_state()[1]))
+
+    def test_storage_is_compact(self):
+        size = sum(os.path.getsize(os.path.join(self.directory, name))
+                   for name in os.listdir(self.directory))
+        steps = sum(len(s) - 1 for s in self.states)
+        self.assertTrue(size < 4000 + steps)
+
+    def test_layout_is_checked(self):
+        other = FixedMazeEnvironment(
+            layout = generate_random_maze(10, 8, 'kruskal', seed = 10),
+            start = (0, 0), goal = (9, 7), seed = 9)
+        self.assertRaises(ValueError, ActionLog(self.directory).restore,
+                          other, 0, 1)
+
+    def test_writer_appends(self):
+        writer = ActionLogWriter(self.directory)
+        self.assertEqual(2, writer.num_episodes)
+        self.maze.reset()
+        writer.begin_episode(self.maze)
+        self.assertRaises(RuntimeError, writer.begin_episode, self.maze)
+        writer.record(1)
+        self.assertEqual(2, writer.end_episode())
+        self.assertEqual(3, ActionLog(self.directory).num_episodes)
+
+class GenericGridActionLogTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_restore(self):
+        (rng, _) = np_random(4)
+        env = GenericGridEnvironment(_CounterState(rng), rng)
+        writer = ActionLogWriter(self.directory, keyframe_interval = 4)
+        writer.begin_episode(env)
+        states = [ env.state ]
+        for i in xrange(0, 10):
+            action = i % 2
+            states.append(env.step(action)[0])
+            writer.record(action)
+        writer.end_episode()
+
+        log = ActionLog(self.directory)
+        self.assertEqual(None, log.header(0)['layout_checksum'])
+        (rng, _) = np_random(5)
+        copy = GenericGridEnvironment(_CounterState(rng), rng)
+        for step in (10, 5, 0, 7):
+            log.restore(copy, 0, step)
+            self.assertEqual((states[step], step), (copy.state, copy.tick))
+        log.restore(copy, 0, 0)
+        self.assertEqual(states[1:],
+                         [ s for (s, _, _, _) in log.replay(copy, 0) ])
+
+        # Stepping drew from the rng, so its state was saved and restored
+        log.restore(copy, 0, 4)
+        first = copy.rng.randint(0, 1000000)
+        log.restore(copy, 0, 4)
+        self.assertEqual(first, copy.rng.randint(0, 1000000))
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,92 @@
+"""Unit tests for pegushi_gym.envs.dynamic"""
+from pegushi_gym.envs.dynamic import *
+from pegushi_gym.envs.maze import compute_adjacency_mask, \
+                                  compute_distance_field, generate_random_maze
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import cPickle
+import numpy as np
+
+class DynamicDistanceFieldTests(TestCase):
+    def test_random_edits(self):
+        layout = generate_random_maze(20, 15, 'kruskal', seed = 4)
+        maze = DynamicMazeEnvironment(layout = layout, start = (0, 0),
+                                      goal = (10, 7), seed = 4)
+        (rng, _) = np_random(4)
+        for i in xrange(0, 300):
+            x = rng.randint(0, 20)
+            y = rng.randint(0, 15)
+            direction = rng.randint(0, 4)
+            if ((direction == 0) and (y == 14)) or \
+               ((direction == 1) and (x == 19)) or \
+               ((direction == 2) and (y == 0)) or \
+               ((direction == 3) and (x == 0)):
+                continue
+            maze.set_wall(x, y, direction, rng.uniform() < 0.5)
+            truth = compute_distance_field(maze._layout, (10, 7))
+            self.assertTrue(np.array_equal(truth,
+                                           maze.distance_field.distance))
+            mask = compute_adjacency_mask(maze._layout)
+            self.assertTrue(np.array_equal(mask, maze._adjacency))
+
+        # The environment's copy of the layout changes, not the caller's
+        self.assertTrue(np.array_equal(
+            generate_random_maze(20, 15, 'kruskal', seed = 4), layout))
+
+    def test_updates_are_local(self):
+        layout = generate_random_maze(40, 40, 'kruskal', seed = 8)
+        field = DynamicDistanceField(compute_adjacency_mask(layout), (0, 0))
+
+        # Cut the opening into a dead end: only that cell changes
+        mask = field.adjacency
+        degree = np.asarray([ bin(m).count('1') for m in mask.ravel() ])\
+                   .reshape(mask.shape)
+        (y, x) = [ (y, x) for (y, x) in zip(*np.nonzero(degree == 1))
+                   if (x, y) != (0, 0) ][0]
+        direction = [ d for d in xrange(0, 4) if mask[y, x] & (1 << d) ][0]
+        self.assertEqual(1, field.set_wall(x, y, direction, False))
+        self.assertEqual(-1, field[(x, y)])
+        self.assertEqual(1, field.set_wall(x, y, direction, True))
+        self.assertTrue(field[(x, y)] > 0)
+        self.assertEqual(0, field.set_wall(x, y, direction, True))
+
+    def test_outer_walls(self):
+        layout = generate_random_maze(4, 3, 'kruskal', seed = 42)
+        field = DynamicDistanceField(compute_adjacency_mask(layout), (3, 2))
+        self.assertRaises(ValueError, field.set_wall, 3, 0, 1, True)
+        self.assertRaises(ValueError, field.set_wall, 0, 2, 0, True)
+
+class DynamicMazeEnvironmentTests(TestCase):
+    def test_close_door_mid_episode(self):
+        maze = DynamicMazeEnvironment(width = 4, height = 3, seed = 42,
+                                      start = (0, 0), goal = (3, 2))
+        self.assertEqual(5, maze.distance_to_goal())
+        maze.step(1)
+        self.assertEqual(4, maze.distance_to_goal())
+
+        # (2, 0) -> (2, 1) is on the only path to the goal
+        maze.close_wall(2, 0, 0)
+        self.assertEqual(-1, maze.distance_to_goal())
+        self.assertFalse(maze.action_mask((2, 0))[0])
+        maze.open_wall(1, 1, 0)
+        maze.open_wall(1, 2, 1)
+        self.assertEqual(4, maze.distance_to_goal())
+        self.assertEqual(4, maze.compute_solution_length('astar') - 1)
+
+    def test_pickled_copy_keeps_walls_in_step(self):
+        maze = DynamicMazeEnvironment(width = 4, height = 3, seed = 42,
+                                      start = (0, 0), goal = (3, 2))
+        copy = cPickle.loads(cPickle.dumps(maze, cPickle.HIGHEST_PROTOCOL))
+        self.assertTrue(np.shares_memory(copy._adjacency,
+                                         copy.distance_field._mask))
+        copy.step(1)
+        copy.step(1)
+        self.assertEqual((2, 0), copy.current_state)
+        copy.close_wall(2, 0, 0)
+        copy.step(0)
+        self.assertEqual((2, 0), copy.current_state)
+        self.assertEqual(-1, copy.distance_to_goal())
+
+if __name__ == '__main__':
+    unit_test_main()
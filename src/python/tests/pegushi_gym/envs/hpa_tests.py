@@ -0,0 +1,87 @@
+"""Unit tests for pegushi_gym.envs.hpa"""
+from pegushi_gym.envs.hpa import *
+from pegushi_gym.envs.maze import compute_adjacency_mask, \
+                                  compute_distance_field, generate_random_maze
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+import os
+import shutil
+import tempfile
+
+class HierarchicalPathIndexTests(TestCase):
+    def setUp(self):
+        self.layout = generate_random_maze(40, 30, 'kruskal', seed = 11)
+        self.index = HierarchicalPathIndex(self.layout, cluster_size = 8)
+        self.mask = compute_adjacency_mask(self.layout)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_valid_path(self, path, start, goal):
+        self.assertEqual(start, path[0])
+        self.assertEqual(goal, path[-1])
+        moves = { (0, 1) : 0, (1, 0) : 1, (0, -1) : 2, (-1, 0) : 3 }
+        for ((x, y), (nx, ny)) in zip(path, path[1:]):
+            a = moves[(nx - x, ny - y)]
+            self.assertTrue(self.mask[y, x] & (1 << a))
+
+    def test_paths_are_shortest(self):
+        (rng, _) = np_random(1)
+        for i in xrange(0, 30):
+            start = (rng.randint(0, 40), rng.randint(0, 30))
+            if i < 10:
+                # Same cluster
+                goal = ((start[0] // 8) * 8 + rng.randint(0, 8),
+                        (start[1] // 8) * 8 + rng.randint(0, 6))
+            else:
+                goal = (rng.randint(0, 40), rng.randint(0, 30))
+            field = compute_distance_field(self.layout, goal)
+            path = self.index.find_path(start, goal)
+            self.assert_valid_path(path, start, goal)
+            self.assertEqual(field[start[1], start[0]], len(path) - 1)
+            self.assertEqual(len(path) - 1,
+                             self.index.path_length(start, goal))
+
+    def test_start_is_goal(self):
+        self.assertEqual(((3, 4), ), self.index.find_path((3, 4), (3, 4)))
+        self.assertEqual(0, self.index.path_length((3, 4), (3, 4)))
+
+    def test_unreachable_goal(self):
+        layout = self.layout.copy()
+        layout[:, 19] &= ~0x1
+        index = HierarchicalPathIndex(layout, cluster_size = 8)
+        self.assertIsNone(index.find_path((0, 0), (39, 29)))
+        self.assertEqual(-1, index.path_length((0, 0), (39, 29)))
+
+        field = compute_distance_field(layout, (0, 0))
+        for goal in ((19, 29), (5, 20), (12, 3)):
+            expected = field[goal[1], goal[0]]
+            self.assertEqual(expected, index.path_length((0, 0), goal))
+            path = index.find_path((0, 0), goal)
+            self.assertEqual(expected, -1 if path is None else len(path) - 1)
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmp_dir, 'index.npz')
+        self.index.save(path)
+        index = HierarchicalPathIndex.load(path, self.layout)
+        self.assertEqual(8, index.cluster_size)
+        self.assertEqual(self.index.num_nodes, index.num_nodes)
+        self.assertEqual(self.index.num_edges, index.num_edges)
+        self.assertEqual(self.index.find_path((0, 0), (39, 29)),
+                         index.find_path((0, 0), (39, 29)))
+
+        other = generate_random_maze(40, 30, 'kruskal', seed = 12)
+        self.assertRaises(ValueError, HierarchicalPathIndex.load, path, other)
+
+    def test_save_without_extension(self):
+        path = os.path.join(self.tmp_dir, 'index')
+        self.index.save(path)
+        self.assertEqual([ 'index' ], os.listdir(self.tmp_dir))
+        index = HierarchicalPathIndex.load(path, self.layout)
+        self.assertEqual(self.index.num_edges, index.num_edges)
+
+if __name__ == '__main__':
+    unit_test_main()
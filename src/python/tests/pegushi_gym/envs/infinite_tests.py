@@ -0,0 +1,87 @@
+"""Unit tests for pegushi_gym.envs.infinite"""
+from pegushi_gym.envs.infinite import *
+from pegushi_gym.envs.maze import compute_distance_field
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+
+class InfiniteMazeTests(TestCase):
+    def test_chunks_are_deterministic(self):
+        a = InfiniteMaze(5, chunk_size = 8, max_resident_chunks = 2)
+        b = InfiniteMaze(5, chunk_size = 8, max_resident_chunks = 100)
+        first = a.window(-20, -20, 40, 40)
+        for (cx, cy) in ((3, 3), (-3, 1), (0, 0)):
+            b.chunk(cx, cy)
+        self.assertTrue(np.array_equal(first, b.window(-20, -20, 40, 40)))
+        self.assertTrue(np.array_equal(first, a.window(-20, -20, 40, 40)))
+
+        c = InfiniteMaze(6, chunk_size = 8)
+        self.assertFalse(np.array_equal(first, c.window(-20, -20, 40, 40)))
+
+    def test_borders_agree(self):
+        maze = InfiniteMaze(5, chunk_size = 8)
+        mask = maze.window(-12, -12, 30, 30)
+        east = (mask[:, :-1] & EAST_OPEN) != 0
+        west = (mask[:, 1:] & WEST_OPEN) != 0
+        north = (mask[:-1, :] & NORTH_OPEN) != 0
+        south = (mask[1:, :] & SOUTH_OPEN) != 0
+        self.assertTrue(np.array_equal(east, west))
+        self.assertTrue(np.array_equal(north, south))
+
+    def test_connected(self):
+        maze = InfiniteMaze(5, chunk_size = 8)
+        layout = maze.layout_window(-16, -8, 32, 24)
+        field = compute_distance_field(layout, (0, 0))
+        self.assertTrue((field >= 0).all())
+
+    def test_cache_is_bounded(self):
+        maze = InfiniteMaze(5, chunk_size = 4, max_resident_chunks = 3)
+        for cx in xrange(0, 10):
+            maze.adjacency(cx * 4, 0)
+        self.assertEqual(3, maze.num_resident_chunks)
+        self.assertEqual(10, maze.chunks_generated)
+
+        # Recently used chunks stay resident
+        maze.adjacency(36, 0)
+        self.assertEqual(10, maze.chunks_generated)
+        maze.adjacency(0, 0)
+        self.assertEqual(11, maze.chunks_generated)
+
+class InfiniteMazeEnvironmentTests(TestCase):
+    def test_step(self):
+        env = InfiniteMazeEnvironment(seed = 5, chunk_size = 8,
+                                      max_resident_chunks = 4,
+                                      max_steps = 2000)
+        (rng, _) = np_random(5)
+        state = env.reset()
+        done = False
+        while not done:
+            mask = env.action_mask()
+            action = rng.randint(0, 4)
+            (next_state, reward, done, info) = env.step(action)
+            if mask[action]:
+                self.assertEqual(env.step_reward, reward)
+                self.assertNotEqual(state, next_state)
+            else:
+                self.assertEqual(env.hit_wall_reward, reward)
+                self.assertEqual(state, next_state)
+            state = next_state
+        self.assertEqual(2000, env.tick)
+        self.assertTrue(env.maze.num_resident_chunks <= 4)
+        self.assertRaises(IndexError, env.step, 4)
+        self.assertRaises(IndexError, env.step, -1)
+
+    def test_goal(self):
+        maze = InfiniteMaze(5, chunk_size = 8)
+        action = maze.action_mask(0, 0).tolist().index(True)
+        goal = ((0, 1, 0, -1)[action], (1, 0, -1, 0)[action])
+        env = InfiniteMazeEnvironment(seed = 5, chunk_size = 8,
+                                      start = (0, 0), goal = goal)
+        (state, reward, done, _) = env.step(action)
+        self.assertEqual(goal, state)
+        self.assertEqual(env.goal_reward, reward)
+        self.assertTrue(done)
+
+if __name__ == '__main__':
+    unit_test_main()
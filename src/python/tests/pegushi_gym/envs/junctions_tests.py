@@ -0,0 +1,168 @@
+"""Unit tests for pegushi_gym.envs.junctions"""
+from pegushi_gym.envs.junctions import *
+from pegushi_gym.envs.maze import FixedMazeEnvironment, generate_random_maze
+from unittest import TestCase
+from unittest import main as unit_test_main
+import cPickle
+import numpy as np
+import os
+import shutil
+import tempfile
+
+class JunctionGraphTests(TestCase):
+    def setUp(self):
+        self.maze = FixedMazeEnvironment(width = 12, height = 9, seed = 5,
+                                         start = (0, 0), goal = (11, 8))
+        self.graph = JunctionGraph(self.maze._layout,
+                                   (self.maze.start, self.maze.goal))
+
+    def test_nodes(self):
+        degree = np.asarray([ bin(m).count('1')
+                              for m in self.maze.adjacency_mask.ravel() ])\
+                   .reshape((9, 12))
+        for y in xrange(0, 9):
+            for x in xrange(0, 12):
+                expected = (degree[y, x] != 2) or ((x, y) in ((0, 0), (11, 8)))
+                self.assertEqual(expected, self.graph.is_node(x, y))
+        self.assertTrue(self.graph.num_nodes < 12 * 9)
+
+    def test_edges_follow_corridors(self):
+        total_length = 0
+        for i in xrange(0, self.graph.num_nodes):
+            (x, y) = self.graph.node_cells[i]
+            for d in xrange(0, 4):
+                target = self.graph.edge_targets[i, d]
+                if target < 0:
+                    self.assertFalse(self.maze.action_mask((x, y))[d])
+                    continue
+                actions = self.graph.edge_actions(i, d)
+                self.assertEqual(self.graph.edge_lengths[i, d], len(actions))
+                self.assertEqual(d, actions[0])
+                total_length += len(actions)
+
+                self.maze.teleport(x, y)
+                for (k, a) in enumerate(actions):
+                    (state, reward, _, _) = self.maze.step(a)
+                    self.assertNotEqual(self.maze.hit_wall_reward, reward)
+                    if k < len(actions) - 1:
+                        self.assertFalse(self.graph.is_node(*state))
+                self.assertEqual(tuple(self.graph.node_cells[target]), state)
+
+        # Every link between cells of a perfect maze is walked once in each
+        # direction
+        self.assertEqual(2 * (12 * 9 - 1), total_length)
+        self.assertEqual(total_length, self.graph.edge_lengths.sum())
+
+    def test_follow_from_corridor(self):
+        (ys, xs) = np.nonzero(self.graph.node_index < 0)
+        (x, y) = (xs[0], ys[0])
+        for d in xrange(0, 4):
+            (actions, end) = self.graph.follow(x, y, d)
+            if self.maze.action_mask((x, y))[d]:
+                self.assertTrue(len(actions) > 0)
+                self.assertTrue(self.graph.is_node(*end))
+            else:
+                self.assertEqual(0, len(actions))
+                self.assertEqual((x, y), end)
+
+class CorridorMazeEnvironmentTests(TestCase):
+    def setUp(self):
+        self.maze = CorridorMazeEnvironment(width = 12, height = 9, seed = 5,
+                                            start = (0, 0), goal = (11, 8))
+        self.graph = self.maze.graph
+
+    def test_step_follows_corridor(self):
+        for d in xrange(0, 4):
+            if self.maze.action_mask()[d]:
+                break
+        (actions, end) = self.graph.follow(0, 0, d)
+        (state, reward, done, info) = self.maze.step(d)
+        self.assertEqual(end, state)
+        self.assertEqual(len(actions) * self.maze.step_reward, reward)
+        self.assertFalse(done)
+        self.assertEqual(len(actions), self.maze.tick)
+        self.assertEqual(len(actions), info['steps'])
+        self.assertEqual(actions.tolist(), info['actions'].tolist())
+        self.assertEqual(self.maze.action_mask().tolist(),
+                         info['action_mask'].tolist())
+
+    def test_hit_wall(self):
+        d = self.maze.action_mask().tolist().index(False)
+        (state, reward, done, info) = self.maze.step(d)
+        self.assertEqual((0, 0), state)
+        self.assertEqual(self.maze.hit_wall_reward, reward)
+        self.assertEqual(1, self.maze.tick)
+        self.assertRaises(IndexError, self.maze.step, -1)
+        self.assertRaises(IndexError, self.maze.step, 4)
+
+    def test_reach_goal_along_solution(self):
+        # Following the solution path from node to node reaches the goal in
+        # as many primitive steps as the solution has
+        path = self.maze.compute_solution_path()
+        total = 0.0
+        calls = 0
+        done = False
+        while not done:
+            (x, y) = self.maze.current_state
+            i = path.index((x, y))
+            (nx, ny) = path[i + 1]
+            d = [ (0, 1), (1, 0), (0, -1), (-1, 0) ].index((nx - x, ny - y))
+            (state, reward, done, _) = self.maze.step(d)
+            total += reward
+            calls += 1
+        length = len(path) - 1
+        self.assertEqual(self.maze.goal, state)
+        self.assertEqual(length, self.maze.tick)
+        self.assertEqual((length - 1) * self.maze.step_reward + \
+                         self.maze.goal_reward, total)
+        self.assertTrue(calls < length)
+
+    def test_step_many(self):
+        actions = [ 0, 1, 2, 3 ] * 5
+        truth = [ ]
+        for a in actions:
+            truth.append(self.maze.step(a)[0:3])
+        self.maze.reset()
+        (states, rewards, dones, count) = self.maze.step_many(actions)
+        self.assertEqual(20, count)
+        self.assertEqual([ s for (s, _, _) in truth ],
+                         [ tuple(s) for s in states.tolist() ])
+        self.assertEqual([ r for (_, r, _) in truth ], rewards.tolist())
+
+    def test_max_steps_stops_partway(self):
+        maze = CorridorMazeEnvironment(width = 12, height = 9, seed = 5,
+                                       start = (0, 0), goal = (11, 8),
+                                       max_steps = 1)
+        d = maze.action_mask().tolist().index(True)
+        (state, reward, done, info) = maze.step(d)
+        self.assertTrue(done)
+        self.assertEqual(1, maze.tick)
+        self.assertEqual(1, info['steps'])
+        self.assertEqual(maze.step_reward, reward)
+
+    def test_graph_shares_environment_arrays(self):
+        self.assertTrue(self.graph.adjacency is self.maze._adjacency)
+
+    def test_pickle_shared_layout(self):
+        directory = tempfile.mkdtemp()
+        try:
+            layout = generate_random_maze(60, 50, 'kruskal', seed = 3)
+            maze = CorridorMazeEnvironment(layout = layout, start = (0, 0),
+                                           goal = (59, 49), seed = 3)
+            unshared = len(cPickle.dumps(maze, cPickle.HIGHEST_PROTOCOL))
+            maze.share_layout(os.path.join(directory, 'layout.npy'))
+            self.assertTrue(maze.graph.layout is maze._layout)
+            data = cPickle.dumps(maze, cPickle.HIGHEST_PROTOCOL)
+            self.assertTrue(len(data) + layout.nbytes +
+                            maze._adjacency.nbytes <= unshared)
+
+            copy = cPickle.loads(data)
+            self.assertTrue(isinstance(copy.graph.layout, np.memmap))
+            self.assertTrue(copy.graph.adjacency is copy._adjacency)
+            for a in (0, 1, 2, 3):
+                self.assertEqual(maze.step(a)[0:3], copy.step(a)[0:3])
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unit_test_main()
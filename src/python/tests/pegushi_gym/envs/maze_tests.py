@@ -2,9 +2,13 @@
 from pegushi_gym.envs.maze import *
 from unittest import TestCase
 from unittest import main as unit_test_main
+from gym.utils.seeding import np_random
+import cPickle
 import numpy as np
 import os.path
+import shutil
 import sys
+import tempfile
 
 RESOURCE_DIR = ''
 AGENT_IMAGE_FILE = ''
@@ -102,6 +106,70 @@ class FixedMazeEnvironmentTests(TestCase):
         self.assertEqual((1, 1), self.maze.current_state)
         self.assertEqual(1, self.maze.tick)
         
+    def test_step_reports_action_mask(self):
+        self.maze.teleport(1, 1)
+        _, _, _, info = self.maze.step(0)
+        self.assertEqual([False, False, True, False],
+                         info['action_mask'].tolist())
+        _, _, _, info = self.maze.step(2)
+        self.assertEqual([True, True, False, True],
+                         info['action_mask'].tolist())
+
+    def test_invalid_actions(self):
+        self.maze.teleport(1, 1)
+        for action in (-1, 4):
+            self.assertRaises(IndexError, self.maze.step, action)
+            self.assertRaises(IndexError, self.maze.step_many,
+                              [ 0, action ])
+        self.assertEqual((1, 1), self.maze.current_state)
+        self.assertEqual(0, self.maze.tick)
+
+    def test_step_many_matches_step(self):
+        (rng, _) = np_random(3)
+        actions = rng.randint(0, 4, size = 200)
+        maze = FixedMazeEnvironment(width = 6, height = 6, seed = 3,
+                                    start = (0, 0), goal = (5, 5),
+                                    max_steps = 150)
+        truth = [ ]
+        for a in actions:
+            truth.append(maze.step(a)[0:3])
+            if truth[-1][2]:
+                break
+        final = (maze.current_state, maze.tick)
+
+        maze.reset()
+        (states, rewards, dones, count) = maze.step_many(actions)
+        self.assertEqual(len(truth), count)
+        self.assertEqual([ s for (s, _, _) in truth ],
+                         [ tuple(s) for s in states.tolist() ])
+        self.assertEqual([ r for (_, r, _) in truth ], rewards.tolist())
+        self.assertEqual([ d for (_, _, d) in truth ], dones.tolist())
+        self.assertEqual(final, (maze.current_state, maze.tick))
+
+    def test_step_many_stops_at_goal(self):
+        maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
+                                    start = (0, 0), goal = (3, 2))
+        (states, rewards, dones, count) = \
+            maze.step_many([ 1, 1, 0, 0, 1, 3, 3 ])
+        self.assertEqual(5, count)
+        self.assertEqual((3, 2), tuple(states[-1]))
+        self.assertEqual([-1.0, -1.0, -1.0, -1.0, 100.0], rewards.tolist())
+        self.assertEqual([False, False, False, False, True], dones.tolist())
+
+        (states, rewards, dones, count) = self.maze.step_many([ ])
+        self.assertEqual(0, count)
+        self.assertEqual((0, 2), states.shape)
+
+    def test_action_masks(self):
+        self.assertEqual([True, True, False, False],
+                         self.maze.action_mask().tolist())
+        self.assertEqual([False, False, True, False],
+                         self.maze.action_mask((1, 1)).tolist())
+        masks = self.maze.action_masks([ (0, 0), (1, 1), (3, 2) ])
+        self.assertEqual([ [True, True, False, False],
+                           [False, False, True, False],
+                           [False, False, False, True] ], masks.tolist())
+
     def test_move_east(self):
         state, reward, done, _ = self.maze.step(1)
         self.assertEqual((1, 0), state)
@@ -232,6 +300,35 @@ class FixedMazeEnvironmentTests(TestCase):
 *********"""
         self.assertEqual(truth, self.maze.render('ansi'))
 
+    def test_render_to_rgb_array(self):
+        maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
+                                    tile_size = 2)
+        frame = maze.render('rgb_array')
+        self.assertEqual((14, 18, 3), frame.shape)
+        self.assertEqual(np.uint8, frame.dtype)
+
+        # Compare the wall pattern against the ANSI rendering
+        ansi = maze.render('ansi').split('\n')
+        for (row, line) in enumerate(ansi):
+            for (col, c) in enumerate(line):
+                pixel = frame[2 * row, 2 * col].tolist()
+                if c == '*':
+                    self.assertEqual([0, 0, 0], pixel)
+                elif c == '#':
+                    self.assertEqual([0, 0, 255], pixel)
+                elif c == '$':
+                    self.assertEqual([0, 192, 0], pixel)
+                else:
+                    self.assertEqual([255, 255, 255], pixel)
+
+    def test_render_to_rgb_array_follows_agent(self):
+        first = self.maze.render('rgb_array')
+        self.maze.step(1)
+        second = self.maze.render('rgb_array')
+        self.assertEqual([0, 0, 255], second[5 * 24, 3 * 24].tolist())
+        self.assertEqual([255, 255, 255], second[5 * 24, 1 * 24].tolist())
+        self.assertEqual([0, 0, 255], first[5 * 24, 1 * 24].tolist())
+
 #    def test_render_human(self):
 #        maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
 #                                    start = (0, 0), goal = (3, 2),
@@ -256,6 +353,205 @@ class FixedMazeEnvironmentTests(TestCase):
                                     start = (0, 0), goal = (3, 2))
         self.assertEqual(5, maze.compute_solution_length())
 
+    def test_compute_solution_with_other_methods(self):
+        maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
+                                    start = (0, 0), goal = (3, 2))
+        truth = ((0, 0), (1, 0), (2, 0), (2, 1), (2, 2), (3, 2))
+        for method in ('astar', 'bidirectional'):
+            self.assertEqual(truth, maze.compute_solution_path(method))
+            self.assertEqual(5, maze.compute_solution_length(method))
+        self.assertRaises(ValueError, maze.compute_solution_length, 'bfs')
+
+class MazeSolverTests(TestCase):
+    def test_matches_distance_field(self):
+        layout = generate_random_maze(30, 20, 'kruskal', seed = 9)
+        mask = compute_adjacency_mask(layout)
+        solver = MazeSolver(layout)
+        (rng, _) = np_random(9)
+        moves = { (0, 1) : 0, (1, 0) : 1, (0, -1) : 2, (-1, 0) : 3 }
+        for i in xrange(0, 20):
+            start = (rng.randint(0, 30), rng.randint(0, 20))
+            goal = (rng.randint(0, 30), rng.randint(0, 20))
+            field = compute_distance_field(layout, goal)
+            for method in MazeSolver.METHODS:
+                length = solver.path_length(start, goal, method)
+                self.assertEqual(field[start[1], start[0]], length)
+                path = solver.find_path(start, goal, method)
+                self.assertEqual(length, len(path) - 1)
+                self.assertEqual(start, path[0])
+                self.assertEqual(goal, path[-1])
+                for ((x, y), (nx, ny)) in zip(path, path[1:]):
+                    self.assertTrue(mask[y, x] & (1 << moves[(nx - x,
+                                                              ny - y)]))
+
+        # Every query leaves the scratch buffers as it found them
+        self.assertEqual(-1, max(solver._distance))
+        self.assertEqual(-1, max(solver._back_distance))
+
+    def test_unreachable_and_trivial_queries(self):
+        solver = MazeSolver(np.asarray([ [ 1, 0, 0 ] ]))
+        for method in MazeSolver.METHODS:
+            self.assertIsNone(solver.find_path((0, 0), (2, 0), method))
+            self.assertEqual(-1, solver.path_length((0, 0), (2, 0), method))
+            self.assertEqual(((1, 0), ),
+                             solver.find_path((1, 0), (1, 0), method))
+            self.assertEqual(((1, 0), (0, 0)),
+                             solver.find_path((1, 0), (0, 0), method))
+
+class ComputeDistanceFieldTests(TestCase):
+    def test_compute_distance_field(self):
+        layout = generate_random_maze(4, 3, 'kruskal', seed = 42)
+        truth = np.asarray([ [ 5, 4, 3, 4 ],
+                             [ 6, 5, 2, 5 ],
+                             [ 7, 2, 1, 0 ] ])
+        field = compute_distance_field(layout, (3, 2))
+        self.assertEqual(np.int32, field.dtype)
+        if not np.array_equal(truth, field):
+            self.fail('%s is not equal to\n%s' % (repr(truth), repr(field)))
+
+    def test_unreachable_cells(self):
+        layout = np.asarray([ [ 1, 0, 0 ] ])
+        self.assertEqual([[0, 1, -1]],
+                         compute_distance_field(layout, (0, 0)).tolist())
+
+class MazeViewportTests(TestCase):
+    def setUp(self):
+        self.layout = generate_random_maze(30, 20, 'kruskal', seed = 6)
+        self.full = render_layout_rgb(self.layout, 2)
+
+    def test_view_matches_full_rendering(self):
+        viewport = MazeViewport(self.layout, None, tile_size = 2,
+                                view_tiles = (11, 9), minimap_size = None)
+        self.assertEqual((18, 22, 3), viewport.frame_shape)
+        agent = (15, 10)
+        frame = viewport.render(agent)
+        self.assertEqual(viewport.frame_shape, frame.shape)
+        (top, left) = viewport.camera(agent)
+        self.assertEqual((2 * (20 - 10) - 1 - 4, 2 * 15 + 1 - 5), (top, left))
+
+        expected = self.full[2 * top:2 * (top + 9),
+                             2 * left:2 * (left + 11)].copy()
+        expected[8:10, 10:12] = (0, 0, 255)
+        self.assertTrue(np.array_equal(expected, frame))
+
+    def test_camera_stays_inside_maze(self):
+        viewport = MazeViewport(self.layout, (29, 19), tile_size = 1,
+                                view_tiles = (11, 9), minimap_size = None)
+        self.assertEqual((0, 50), viewport.camera((29, 19)))
+        self.assertEqual((32, 0), viewport.camera((0, 0)))
+        frame = viewport.render((28, 19))
+        self.assertEqual((0, 192, 0), tuple(frame[1, 9]))
+        self.assertEqual((0, 0, 255), tuple(frame[1, 7]))
+
+        small = MazeViewport(generate_random_maze(2, 2, 'kruskal', seed = 1),
+                             tile_size = 1, view_tiles = (9, 7))
+        self.assertEqual((-1, -2), small.camera((0, 0)))
+        self.assertIsNone(small.minimap())
+        frame = small.render((0, 0))
+        self.assertEqual((7, 9, 3), frame.shape)
+        self.assertEqual((0, 0, 0), tuple(frame[0, 0]))
+
+    def test_minimap(self):
+        viewport = MazeViewport(self.layout, (29, 19), tile_size = 2,
+                                view_tiles = (21, 21), minimap_size = 16)
+        minimap = viewport.minimap((0, 0))
+        self.assertEqual((11, 16, 3), minimap.shape)
+        self.assertEqual((0, 0, 255), tuple(minimap[39 // 4, 0]))
+        self.assertEqual((0, 192, 0), tuple(minimap[0, 59 // 4]))
+
+        frame = viewport.render((0, 0))
+        self.assertTrue(np.array_equal(minimap, frame[0:11, 42 - 16:42]))
+
+    def test_environment_viewport(self):
+        maze = FixedMazeEnvironment(layout = self.layout, start = (0, 0),
+                                    goal = (29, 19), seed = 6, tile_size = 2,
+                                    viewport = (11, 9))
+        self.assertEqual((18, 22, 3), maze.render('rgb_array').shape)
+
+class ComputeAdjacencyMaskTests(TestCase):
+    def test_compute_adjacency_mask(self):
+        maze = FixedMazeEnvironment(width = 7, height = 5, seed = 3)
+        mask = compute_adjacency_mask(maze._layout)
+        self.assertEqual(np.uint8, mask.dtype)
+        self.assertEqual((5, 7), mask.shape)
+        moves = (maze._can_move_north, maze._can_move_east,
+                 maze._can_move_south, maze._can_move_west)
+        for y in xrange(0, 5):
+            for x in xrange(0, 7):
+                for (a, can_move) in enumerate(moves):
+                    self.assertEqual(bool(can_move(x, y)),
+                                     bool(mask[y, x] & (1 << a)))
+
+class PicklingTests(TestCase):
+    def test_pickle_drops_render_state(self):
+        maze = FixedMazeEnvironment(width = 7, height = 5, seed = 3,
+                                    tile_size = 2)
+        maze.render('rgb_array')
+        maze.step(1)
+        copy = cPickle.loads(cPickle.dumps(maze, cPickle.HIGHEST_PROTOCOL))
+        self.assertEqual(None, copy._rgb_background)
+        self.assertTrue(np.array_equal(maze._layout, copy._layout))
+        self.assertEqual(maze.current_state, copy.current_state)
+        self.assertEqual(maze.step(0)[0:3], copy.step(0)[0:3])
+        self.assertTrue(np.array_equal(maze.render('rgb_array'),
+                                       copy.render('rgb_array')))
+
+    def test_share_layout(self):
+        directory = tempfile.mkdtemp()
+        try:
+            layout = generate_random_maze(40, 30, 'kruskal', seed = 7)
+            maze = FixedMazeEnvironment(layout = layout, start = (0, 0),
+                                        goal = (39, 29), seed = 7)
+            path = os.path.join(directory, 'layout.npy')
+            self.assertEqual(path, maze.share_layout(path))
+            self.assertTrue(isinstance(maze._layout, np.memmap))
+            self.assertTrue(np.array_equal(layout, maze._layout))
+
+            unshared = FixedMazeEnvironment(layout = layout, start = (0, 0),
+                                            goal = (39, 29), seed = 7)
+            data = cPickle.dumps(maze, cPickle.HIGHEST_PROTOCOL)
+            self.assertTrue(len(data) + layout.nbytes <
+                            len(cPickle.dumps(unshared,
+                                              cPickle.HIGHEST_PROTOCOL)))
+            copy = cPickle.loads(data)
+            self.assertTrue(isinstance(copy._layout, np.memmap))
+            self.assertFalse(copy._layout.flags.writeable)
+            self.assertTrue(np.array_equal(layout, copy._layout))
+            self.assertTrue(np.array_equal(compute_adjacency_mask(layout),
+                                           copy._adjacency))
+            self.assertEqual(maze.compute_solution_length(),
+                             copy.compute_solution_length())
+            for a in (0, 1, 2, 3):
+                self.assertEqual(maze.step(a)[0:3], copy.step(a)[0:3])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_share_layout_default_path(self):
+        maze = FixedMazeEnvironment(width = 5, height = 4, seed = 2)
+        path = maze.share_layout()
+        try:
+            self.assertTrue(os.path.exists(path))
+            self.assertTrue(os.path.exists(path + '.adjacency'))
+
+            # Only the environment that shared the layout removes the files
+            copy = cPickle.loads(cPickle.dumps(maze,
+                                               cPickle.HIGHEST_PROTOCOL))
+            copy.close()
+            self.assertTrue(os.path.exists(path))
+            maze.close()
+            self.assertFalse(os.path.exists(path))
+            self.assertFalse(os.path.exists(path + '.adjacency'))
+
+            # Both still work, and maze now pickles its own layout
+            self.assertEqual(maze.step(1)[0:3], copy.step(1)[0:3])
+            copy = cPickle.loads(cPickle.dumps(maze,
+                                               cPickle.HIGHEST_PROTOCOL))
+            self.assertTrue(np.array_equal(maze._layout, copy._layout))
+        finally:
+            for name in (path, path + '.adjacency'):
+                if os.path.exists(name):
+                    os.remove(name)
+
 def full_split(path):
     if path == '/':
         return (path, )
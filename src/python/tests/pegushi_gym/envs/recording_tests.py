@@ -0,0 +1,99 @@
+"""Unit tests for pegushi_gym.envs.recording"""
+from pegushi_gym.envs.recording import *
+from pegushi_gym.envs.maze import FixedMazeEnvironment, generate_random_maze
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+
+class SlowWriter:
+    def __init__(self):
+        self.release = threading.Event()
+        self.frames = [ ]
+        self.closed = False
+
+    def write(self, episode, step, frame):
+        self.release.wait()
+        self.frames.append((episode, step))
+
+    def end_episode(self, episode):
+        pass
+
+    def close(self):
+        self.closed = True
+
+class RecordingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record_to_archive(self):
+        layout = generate_random_maze(6, 5, 'kruskal', seed = 2)
+        maze = FixedMazeEnvironment(layout = layout, start = (0, 0),
+                                    goal = (5, 4), seed = 2, tile_size = 4,
+                                    max_steps = 10)
+        writer = AsyncFrameWriter(FrameArchiveWriter(self.directory,
+                                                     frames_per_file = 3),
+                                  block = True)
+        env = RecordingWrapper(maze, writer, frame_skip = 4,
+                               episode_interval = 2)
+
+        # Frames expected from episodes 0 and 2 only, at steps 0, 4, 8 and
+        # the last step, 10
+        expected = [ ]
+        for episode in xrange(0, 3):
+            env.reset()
+            if episode != 1:
+                expected.append((episode, 0, maze.render('rgb_array')))
+            done = False
+            step = 0
+            while not done:
+                (_, _, done, _) = env.step(step % 4)
+                step += 1
+                if (episode != 1) and ((step % 4 == 0) or done):
+                    expected.append((episode, step,
+                                     maze.render('rgb_array')))
+        env.close()
+
+        recorded = list(read_frame_archive(self.directory))
+        self.assertEqual([ (e, s) for (e, s, _) in expected ],
+                         [ (e, s) for (e, s, _) in recorded ])
+        for ((_, _, a), (_, _, b)) in zip(expected, recorded):
+            self.assertTrue(np.array_equal(a, b))
+        self.assertEqual(len(expected), writer.frames_written)
+        self.assertEqual(0, writer.frames_dropped)
+
+    def test_full_queue_drops_frames(self):
+        slow = SlowWriter()
+        writer = AsyncFrameWriter(slow, max_queued_frames = 2)
+        frame = np.zeros((2, 2, 3), dtype = np.uint8)
+        results = [ writer.record(0, i, frame) for i in xrange(0, 10) ]
+
+        # The writer's thread holds one frame and the queue holds two
+        self.assertTrue(3 >= results.count(True) >= 2)
+        self.assertEqual(results.count(False), writer.frames_dropped)
+        self.assertTrue(writer.queue_depth <= 2)
+
+        slow.release.set()
+        writer.close()
+        self.assertTrue(slow.closed)
+        self.assertEqual(results.count(True), len(slow.frames))
+        self.assertEqual(sorted(slow.frames), slow.frames)
+
+    def test_writer_errors_are_raised_on_close(self):
+        # Each frame is written by the background thread as soon as it is
+        # recorded, into a directory that no longer exists
+        directory = os.path.join(self.directory, 'frames')
+        writer = AsyncFrameWriter(FrameArchiveWriter(directory,
+                                                     frames_per_file = 1))
+        shutil.rmtree(directory)
+        writer.record(0, 0, np.zeros((2, 2, 3), dtype = np.uint8))
+        self.assertRaises(IOError, writer.close)
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,105 @@
+"""Unit tests for pegushi_gym.envs.rendering"""
+from pegushi_gym.envs.rendering import *
+from pegushi_gym.envs.maze import FixedMazeEnvironment, generate_random_maze
+from unittest import TestCase
+from unittest import main as unit_test_main
+import time
+
+class RecordingDisplay:
+    def __init__(self, log):
+        self.log = log
+
+    def draw(self, location):
+        self.log.append(('draw', location))
+
+    def move_agent(self, old, new):
+        self.log.append(('move', new))
+
+    def close(self):
+        self.log.append(('close', None))
+
+def wait_for(condition, timeout = 5.0):
+    end = time.time() + timeout
+    while not condition() and (time.time() < end):
+        time.sleep(0.01)
+    return condition()
+
+class BackgroundRendererTests(TestCase):
+    def test_draws_latest_position(self):
+        log = [ ]
+        renderer = BackgroundRenderer(lambda: RecordingDisplay(log),
+                                      max_fps = 20)
+        renderer.start()
+        try:
+            for i in xrange(0, 10000):
+                renderer.publish((i, 0))
+            self.assertTrue(wait_for(lambda: renderer.last_drawn == (9999, 0)))
+        finally:
+            renderer.stop()
+        self.assertFalse(renderer.running)
+
+        # Positions published between frames are skipped
+        self.assertTrue(renderer.frames_drawn < 10)
+        self.assertEqual('draw', log[0][0])
+        self.assertEqual(('move', (9999, 0, 0, 0)) if len(log) > 2
+                             else ('draw', (9999, 0, 0, 0)), log[-2])
+        self.assertEqual(('close', None), log[-1])
+
+    def test_frame_rate_is_capped(self):
+        log = [ ]
+        renderer = BackgroundRenderer(lambda: RecordingDisplay(log),
+                                      max_fps = 10)
+        renderer.start()
+        start = time.time()
+        try:
+            while time.time() - start < 0.5:
+                renderer.publish((0, 0))
+                renderer.publish((1, 0))
+        finally:
+            renderer.stop()
+        elapsed = time.time() - start
+        self.assertTrue(renderer.frames_drawn >= 1)
+        self.assertTrue(renderer.frames_drawn <= 10 * elapsed + 2)
+
+    def test_request_redraw(self):
+        log = [ ]
+        renderer = BackgroundRenderer(lambda: RecordingDisplay(log))
+        renderer.start()
+        try:
+            renderer.publish((1, 2))
+            self.assertTrue(wait_for(lambda: renderer.frames_drawn == 1))
+
+            # The latest position is drawn again on the new display
+            renderer.request_redraw()
+            self.assertTrue(wait_for(lambda: renderer.frames_drawn == 2))
+            renderer.publish((1, 3))
+            self.assertTrue(wait_for(lambda: renderer.frames_drawn == 3))
+        finally:
+            renderer.stop()
+        self.assertEqual([ ('draw', (1, 2, 0, 0)), ('close', None),
+                           ('draw', (1, 2, 0, 0)), ('move', (1, 3, 0, 0)),
+                           ('close', None) ], log)
+
+    def test_bad_frame_rate(self):
+        self.assertRaises(ValueError, BackgroundRenderer, lambda: None, 0)
+
+class BackgroundRenderingModeTests(TestCase):
+    def test_render_background(self):
+        layout = generate_random_maze(8, 6, 'kruskal', seed = 3)
+        maze = FixedMazeEnvironment(layout = layout, start = (0, 0),
+                                    goal = (7, 5), seed = 3, tile_size = 8)
+        try:
+            for i in xrange(0, 200):
+                maze.step(i % 4)
+                self.assertEqual(None, maze.render('background'))
+            state = maze.current_state
+            renderer = maze._background
+            self.assertTrue(renderer.running)
+            self.assertTrue(wait_for(lambda: renderer.last_drawn == state))
+        finally:
+            maze.close()
+        self.assertFalse(renderer.running)
+        self.assertEqual(None, maze._background)
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,97 @@
+"""Unit tests for pegushi_rl.actor_learner"""
+from pegushi_rl.actor_learner import *
+from pegushi_rl.evaluation import EvaluationInstance, GreedyPolicy, \
+                                  evaluate_policy
+from pegushi_rl.q_functions import TabularQFunction
+from pegushi_rl.replay import PrioritizedReplayMemory
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+
+def create_maze():
+    return FixedMazeEnvironment(width = 5, height = 5, seed = 42,
+                                start = (0, 0), goal = (4, 4),
+                                max_steps = 200)
+
+class ActorLearnerPipelineTests(TestCase):
+    def setUp(self):
+        (self.rng, _) = np_random(42)
+        self.envs = [ create_maze(), create_maze() ]
+        self.q = TabularQFunction.from_maze_zeros(self.envs[0], self.rng)
+
+    def assert_learned_path(self):
+        report = evaluate_policy(
+            [ EvaluationInstance.from_environment(self.envs[0]) ],
+            GreedyPolicy(self.q), max_steps = 100)
+        self.assertEqual(1.0, report.success_rate)
+
+    def test_run(self):
+        pipeline = ActorLearnerPipeline(self.envs, self.q, alpha = 1.0,
+                                        gamma = 0.99, batch_size = 16,
+                                        publish_interval = 1)
+        metrics = pipeline.run(num_transitions = 20000, duration = 30.0)
+
+        self.assertTrue(metrics.transitions >= 20000)
+        self.assertEqual(metrics.batches, metrics.snapshots)
+        self.assertEqual(metrics.batches, len(metrics.queue_depths))
+        self.assertEqual(metrics.snapshots, pipeline.version)
+        self.assertTrue(metrics.max_queue_depth <= 8)
+        self.assertTrue(metrics.mean_staleness >= 0.0)
+        self.assertTrue('transitions:' in metrics.summary())
+        self.assert_learned_path()
+
+    def test_actors_act_with_snapshots(self):
+        pipeline = ActorLearnerPipeline(self.envs, self.q, alpha = 1.0,
+                                        gamma = 0.99, publish_interval = 4,
+                                        publish_period = None)
+        pipeline.run(num_transitions = 2000, duration = 30.0)
+        (version, snapshot) = pipeline._published
+        self.assertEqual(pipeline.metrics.batches // 4, version)
+        self.assertFalse(np.may_share_memory(snapshot.q_table,
+                                             self.q.q_table))
+
+    def test_publish_period(self):
+        pipeline = ActorLearnerPipeline(self.envs, self.q,
+                                        publish_interval = None,
+                                        publish_period = 0.0)
+        pipeline.run(num_transitions = 500, duration = 30.0)
+        self.assertEqual(pipeline.metrics.batches, pipeline.version)
+        self.assertRaises(ValueError, ActorLearnerPipeline, self.envs,
+                          self.q, publish_interval = None,
+                          publish_period = None)
+
+    def test_backpressure(self):
+        # With nobody learning, the actors fill the queue and block
+        pipeline = ActorLearnerPipeline(self.envs, self.q, batch_size = 4,
+                                        queue_size = 2)
+        pipeline.start()
+        try:
+            time.sleep(0.3)
+            self.assertEqual(2, pipeline._queue.qsize())
+            batch = pipeline.learn_batch(1.0)
+            self.assertEqual(0, batch.version)
+            self.assertTrue(len(batch) <= 4)
+        finally:
+            pipeline.stop()
+        self.assertTrue(pipeline.metrics.actor_wait > 0.0)
+        self.assertEqual(0, pipeline._queue.qsize())
+
+    def test_run_with_prioritized_replay(self):
+        memory = PrioritizedReplayMemory(size = 10000, batch_size = 64,
+                                         rng = self.rng)
+        pipeline = ActorLearnerPipeline(self.envs, self.q, alpha = 1.0,
+                                        gamma = 0.99, batch_size = 16,
+                                        replay_memory = memory)
+        pipeline.run(num_transitions = 30000, duration = 30.0)
+        self.assertTrue(len(memory) > 0)
+        self.assertTrue(memory.max_priority > 1.0)
+        self.assert_learned_path()
+
+    def test_run_needs_a_limit(self):
+        pipeline = ActorLearnerPipeline(self.envs, self.q)
+        self.assertRaises(ValueError, pipeline.run)
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,146 @@
+"""Unit tests for pegushi_rl.checkpoints"""
+from pegushi_rl.checkpoints import *
+from pegushi_rl.q_functions import ChunkedTabularQFunction, \
+     SharedTabularQFunction, TabularQFunction
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+import os
+import resource
+import shutil
+import tempfile
+
+class CheckpointerTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        (self.rng, _) = np_random(3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_chunked_checkpoints_are_incremental(self):
+        q = ChunkedTabularQFunction((40, 30, 4), self.rng,
+                                    chunk_shape = (8, 8))
+        q.update_batch([ 0, 20, 39 ], [ 0, 10, 29 ], [ 0, 1, 2 ],
+                       [ 1.0, 2.0, 3.0 ])
+        checkpointer = Checkpointer(self.directory, fsync = False)
+        self.assertEqual(3, checkpointer.save(q, 10))
+        self.assertEqual([ ], q.dirty_chunks)
+        self.assertEqual(0, checkpointer.save(q, 11))
+
+        q.update(21, 11, 3, 5.0)
+        q.update(1, 29, 0, 7.0)
+        self.assertEqual(2, checkpointer.save(q, 12, extra = 'state'))
+        self.assertEqual(2 * 8 * 8 * 4 * 4, checkpointer.bytes_written)
+        self.assertEqual(4, len([ n for n in os.listdir(self.directory)
+                                  if n.startswith('piece-') ]))
+
+        # Restore from a new Checkpointer, as after a restart
+        (restored, episode, extra) = Checkpointer(self.directory).restore()
+        self.assertEqual((12, 'state'), (episode, extra))
+        self.assertTrue(np.array_equal(q.to_dense(), restored.to_dense()))
+        self.assertEqual([ ], restored.dirty_chunks)
+        self.assertEqual(q.rng.randint(0, 1000000),
+                         restored.rng.randint(0, 1000000))
+
+        # Training on the restored function leaves the checkpoint alone
+        restored.update(0, 0, 0, 100.0)
+        (again, _, _) = Checkpointer(self.directory).restore()
+        self.assertEqual(1.0, again(0, 0, 0))
+
+    def test_dense_checkpoints_are_incremental(self):
+        table = self.rng.normal(size = (50, 20, 4))
+        q = TabularQFunction(table, self.rng)
+        checkpointer = Checkpointer(self.directory, block_rows = 10,
+                                    fsync = False)
+        self.assertEqual(5, checkpointer.save(q, 1))
+        self.assertEqual(0, checkpointer.save(q, 2))
+        q.update(15, 3, 2, 9.0)
+        q.update(49, 0, 0, 9.0)
+        self.assertEqual(2, checkpointer.save(q, 3))
+
+        (restored, episode, _) = Checkpointer(self.directory).restore()
+        self.assertEqual(3, episode)
+        self.assertTrue(np.array_equal(table, restored.q_table))
+
+    def test_environment_state(self):
+        maze = FixedMazeEnvironment(width = 5, height = 4, seed = 8)
+        q = TabularQFunction.from_maze_zeros(maze, self.rng)
+        checkpointer = Checkpointer(self.directory, fsync = False)
+        checkpointer.save(q, 0, env = maze)
+        expected = maze.rng.randint(0, 1000000)
+
+        maze.rng.randint(0, 1000000)
+        checkpointer.restore(env = maze)
+        self.assertEqual(expected, maze.rng.randint(0, 1000000))
+
+        other = FixedMazeEnvironment(width = 5, height = 4, seed = 9)
+        self.assertRaises(ValueError, checkpointer.restore, env = other)
+
+    def test_interrupted_checkpoint(self):
+        q = ChunkedTabularQFunction((16, 16, 4), self.rng,
+                                    chunk_shape = (8, 8))
+        q.update(0, 0, 0, 1.0)
+        checkpointer = Checkpointer(self.directory, fsync = False)
+        checkpointer.save(q, 1)
+
+        # A crash while writing a piece leaves a temporary file and an
+        # unlisted piece, but the previous checkpoint is intact
+        for name in ('piece-0-1.npy', 'piece-9-1.npy.tmp'):
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write('garbage')
+        checkpointer = Checkpointer(self.directory, fsync = False)
+        (restored, episode, _) = checkpointer.restore()
+        self.assertEqual((1, 1.0), (episode, restored(0, 0, 0)))
+
+        # The next checkpoint cleans up
+        q.update(15, 15, 0, 2.0)
+        checkpointer.save(q, 2)
+        self.assertEqual(set([ 'manifest.pkl', 'piece-0-0.npy',
+                               'piece-3-1.npy' ]),
+                         set(os.listdir(self.directory)))
+
+    def test_fsync(self):
+        q = TabularQFunction(self.rng.normal(size = (4, 4, 4)), self.rng)
+        checkpointer = Checkpointer(self.directory)
+        self.assertEqual(1, checkpointer.save(q, 5))
+        (restored, episode, _) = Checkpointer(self.directory).restore()
+        self.assertEqual(5, episode)
+        self.assertTrue(np.array_equal(q.q_table, restored.q_table))
+
+    def test_restore_more_chunks_than_open_files(self):
+        (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = min(64, soft)
+        q = ChunkedTabularQFunction((4 * limit, 2, 4), self.rng,
+                                    chunk_shape = (2, 2))
+        xs = np.arange(0, 4 * limit, 2)
+        q.update_batch(xs, xs % 2, xs % 4, xs)
+        self.assertTrue(q.num_chunks > limit)
+        Checkpointer(self.directory, fsync = False).save(q, 1)
+
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        try:
+            (restored, _, _) = Checkpointer(self.directory).restore()
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        self.assertTrue(np.array_equal(q.to_dense(), restored.to_dense()))
+
+    def test_function_without_rng(self):
+        maze = FixedMazeEnvironment(width = 5, height = 4, seed = 8)
+        q = SharedTabularQFunction.from_maze_zeros(maze, None)
+        q.update(1, 2, 3, 4.0)
+        checkpointer = Checkpointer(self.directory, fsync = False)
+        checkpointer.save(q, 7)
+        (restored, episode, _) = checkpointer.restore()
+        self.assertEqual((7, 4.0, None),
+                         (episode, restored(1, 2, 3), restored.rng))
+
+    def test_no_checkpoint(self):
+        checkpointer = Checkpointer(self.directory)
+        self.assertFalse(checkpointer.exists)
+        self.assertRaises(ValueError, checkpointer.restore)
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,155 @@
+"""Unit tests for pegushi_rl.datasets"""
+from pegushi_rl.datasets import *
+from pegushi_rl.learners import Trajectory
+from pegushi_rl.q_functions import TabularQFunction
+from pegushi_gym.envs.maze import FixedMazeEnvironment, generate_random_maze
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+import os
+import resource
+import shutil
+import tempfile
+
+class OfflineDatasetTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        layout = generate_random_maze(8, 6, 'kruskal', seed = 4)
+        self.maze = FixedMazeEnvironment(layout = layout, start = (0, 0),
+                                         goal = (7, 5), seed = 4,
+                                         max_steps = 50)
+        (self.rng, _) = np_random(4)
+
+        writer = OfflineDatasetWriter(self.directory, chunk_size = 64)
+        self.random_rewards = writer.collect(self.maze,
+                                             random_policy(self.rng), 5,
+                                             'random')
+        self.expert_rewards = writer.collect(self.maze,
+                                             expert_policy(self.maze), 2,
+                                             'expert')
+        q = TabularQFunction.from_maze_zeros(self.maze, self.rng)
+        writer.collect(self.maze, q.select_soft, 1, 'learned')
+        writer.close()
+        self.num_transitions = writer.num_transitions
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_and_read(self):
+        dataset = OfflineDataset(self.directory)
+        self.assertEqual(self.num_transitions, len(dataset))
+        self.assertEqual((self.num_transitions + 63) // 64,
+                         dataset.num_chunks)
+        self.assertTrue(all(c['num_transitions'] == 64
+                            for c in dataset.chunks[:-1]))
+        self.assertEqual([ 'random' ], dataset.chunks[0]['sources'])
+        self.assertEqual([ 'learned' ], dataset.chunks[-1]['sources'])
+
+        chunk = dataset.chunk(0)
+        self.assertTrue(isinstance(chunk['states'], np.memmap))
+        self.assertEqual(np.int8, chunk['actions'].dtype)
+
+        # Rewards summed by episode match what collect() returned
+        columns = [ dataset.chunk(i) for i in xrange(0, dataset.num_chunks) ]
+        episodes = np.concatenate([ c['episodes'] for c in columns ])
+        rewards = np.concatenate([ c['rewards'] for c in columns ])
+        dones = np.concatenate([ c['dones'] for c in columns ])
+        totals = np.bincount(episodes, weights = rewards)
+        self.assertTrue(np.allclose(self.random_rewards + self.expert_rewards,
+                                    totals[0:7]))
+        self.assertEqual(8, dones.sum())
+
+        # Expert episodes take the shortest path
+        length = self.maze.compute_solution_length()
+        self.assertEqual([ length, length ],
+                         np.bincount(episodes)[5:7].tolist())
+
+        # Transitions chain within an episode
+        states = np.concatenate([ c['states'] for c in columns ])
+        next_states = np.concatenate([ c['next_states'] for c in columns ])
+        same = (episodes[1:] == episodes[:-1])
+        self.assertTrue(np.array_equal(next_states[:-1][same],
+                                       states[1:][same]))
+
+    def test_append(self):
+        writer = OfflineDatasetWriter(self.directory, chunk_size = 64)
+        self.assertEqual(8, writer.num_episodes)
+        self.assertEqual(8, writer.add_trajectory(
+            [ ((0, 0), 1, -1.0), ((1, 0), None, 0.0) ], 'random'))
+        writer.close()
+        dataset = OfflineDataset(self.directory)
+        self.assertEqual(self.num_transitions + 1, len(dataset))
+        self.assertEqual(8, dataset.chunk(dataset.num_chunks - 1)
+                                ['episodes'][-1])
+
+    def test_minibatches(self):
+        dataset = OfflineDataset(self.directory)
+        batches = list(dataset.minibatches(10, self.rng, num_epochs = 2,
+                                           chunks_per_shuffle = 2))
+        sizes = [ len(b[0]) for b in batches ]
+        self.assertEqual(2 * self.num_transitions, sum(sizes))
+        self.assertTrue(all(s == 10 for s in sizes[:-1]))
+
+        # Every transition is served once per epoch
+        keys = np.concatenate([ b[5] * 1000 + b[0][:, 0] * 10 + b[0][:, 1]
+                                for b in batches ])
+        columns = [ dataset.chunk(i) for i in xrange(0, dataset.num_chunks) ]
+        truth = np.concatenate([ c['episodes'] * 1000 +
+                                 c['states'][:, 0] * 10 + c['states'][:, 1]
+                                 for c in columns ])
+        self.assertTrue(np.array_equal(np.sort(np.concatenate((truth,
+                                                               truth))),
+                                       np.sort(keys)))
+
+    def test_workers_read_disjoint_chunks(self):
+        dataset = OfflineDataset(self.directory)
+        counts = [ sum(len(b[0]) for b in dataset.minibatches(
+                       7, self.rng, worker = i, num_workers = 2))
+                   for i in (0, 1) ]
+        self.assertEqual(self.num_transitions, sum(counts))
+        self.assertEqual(sum(c['num_transitions']
+                             for c in dataset.chunks[0::2]), counts[0])
+
+    def test_parallel_minibatches(self):
+        batches = list(parallel_minibatches(self.directory, 16, 3,
+                                            seed = 1))
+        self.assertEqual(self.num_transitions,
+                         sum(len(b[0]) for b in batches))
+
+    def test_many_chunks(self):
+        # More chunks than the process may have open files
+        (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = min(64, soft)
+        directory = tempfile.mkdtemp()
+        try:
+            writer = OfflineDatasetWriter(directory, chunk_size = 4)
+            states = np.zeros((4 * limit + 1, 2), dtype = np.int32)
+            actions = np.arange(0, 4 * limit) % 4
+            writer.add_trajectory(Trajectory(states, actions,
+                                             np.ones(4 * limit)))
+            writer.close()
+
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+            try:
+                dataset = OfflineDataset(directory)
+                batches = list(dataset.minibatches(16, self.rng))
+            finally:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+            self.assertEqual(limit, dataset.num_chunks)
+            self.assertEqual(4, len(dataset._mapped))
+            self.assertEqual(4 * limit, sum(len(b[0]) for b in batches))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_parallel_minibatches_worker_failure(self):
+        os.remove(os.path.join(self.directory, 'chunk-000001.rewards.npy'))
+        batches = parallel_minibatches(self.directory, 16, 2, seed = 1)
+        try:
+            list(batches)
+            self.fail('RuntimeError not raised')
+        except RuntimeError as e:
+            self.assertTrue('chunk-000001.rewards.npy' in str(e))
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,107 @@
+"""Unit tests for pegushi_rl.evaluation"""
+from pegushi_rl.evaluation import *
+from pegushi_rl.q_functions import TabularQFunction
+from pegushi_gym.envs.maze import FixedMazeEnvironment, generate_random_maze
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+
+class EvaluatePolicyTests(TestCase):
+    def setUp(self):
+        (self.rng, _) = np_random(42)
+        self.maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
+                                         start = (0, 0), goal = (3, 2))
+
+    def test_shortest_path_policy_is_optimal(self):
+        layouts = [ generate_random_maze(8, 6, seed = s)
+                    for s in xrange(1, 4) ]
+        instances = random_instances(layouts, 200, self.rng)
+        report = evaluate_policy(instances, ShortestPathPolicy())
+
+        self.assertEqual(200, report.num_instances)
+        self.assertEqual(1.0, report.success_rate)
+        self.assertTrue(np.array_equal(report.optimal, report.steps))
+        self.assertEqual(1.0, report.mean_ratio)
+        self.assertTrue(np.allclose([1.0, 1.0],
+                                    report.ratio_percentiles((50, 99))))
+
+    def test_optimal_lengths(self):
+        instance = EvaluationInstance.from_environment(self.maze)
+        report = evaluate_policy([ instance ], ShortestPathPolicy())
+        self.assertEqual([self.maze.compute_solution_length()],
+                         report.optimal.tolist())
+
+    def test_greedy_policy(self):
+        q = TabularQFunction.from_maze_zeros(self.maze, self.rng)
+        for (x, y, a) in ((0, 0, 1), (1, 0, 1), (2, 0, 0), (2, 1, 0),
+                          (2, 2, 1)):
+            q.update(x, y, a, 1.0)
+        instances = [ EvaluationInstance(self.maze._layout, (0, 0), (3, 2)),
+                      EvaluationInstance(self.maze._layout, (2, 1), (3, 2)) ]
+        report = evaluate_policy(instances, GreedyPolicy(q))
+        self.assertEqual([True, True], report.success.tolist())
+        self.assertEqual([5, 2], report.steps.tolist())
+        self.assertEqual([1.0, 1.0], report.ratio.tolist())
+
+    def test_failures_and_wall_hits(self):
+        # Always moving west from (3, 0) ends up stuck against the west
+        # border at (0, 0)
+        instances = [ EvaluationInstance(self.maze._layout, (3, 0), (3, 2)),
+                      EvaluationInstance(self.maze._layout, (3, 2), (1, 2)) ]
+        policy = lambda layout, xs, ys, gx, gy: np.full(len(xs), 3)
+        report = evaluate_policy(instances, policy, max_steps = 10)
+        self.assertEqual([False, True], report.success.tolist())
+        self.assertEqual([10, 2], report.steps.tolist())
+        self.assertEqual([4, 2], report.optimal.tolist())
+        self.assertTrue(np.isnan(report.ratio[0]))
+        self.assertEqual(0.5, report.success_rate)
+        self.assertEqual(1.0, report.mean_ratio)
+
+    def test_parallel_evaluation_matches_serial(self):
+        layouts = [ generate_random_maze(6, 6, seed = s)
+                    for s in xrange(1, 5) ]
+        instances = random_instances(layouts, 100, self.rng)
+
+        # Each worker gets its own copy of a stochastic policy's RNG, so
+        # only a deterministic policy gives the same results either way.
+        # Greedy actions of a random Q table reach some goals but not all.
+        q = TabularQFunction(self.rng.normal(size = (6, 6, 4)), self.rng)
+        serial = evaluate_policy(instances, GreedyPolicy(q), max_steps = 50)
+        parallel = evaluate_policy(instances, GreedyPolicy(q),
+                                   max_steps = 50, num_processes = 2)
+        self.assertEqual(100, parallel.num_instances)
+        self.assertTrue(0 < serial.success.sum() < 100)
+        self.assertTrue(np.array_equal(serial.optimal, parallel.optimal))
+        self.assertTrue(np.array_equal(serial.success, parallel.success))
+        self.assertTrue(np.array_equal(serial.steps, parallel.steps))
+
+    def test_distance_fields_are_bounded(self):
+        layouts = [ generate_random_maze(10, 8, seed = 2) ]
+        instances = random_instances(layouts, 60, self.rng)
+        policy = ShortestPathPolicy(max_fields = 3)
+        report = evaluate_policy(instances, policy, goals_per_batch = 3)
+        self.assertEqual(1.0, report.success_rate)
+        self.assertTrue(np.array_equal(report.optimal, report.steps))
+        self.assertTrue(len(policy._fields) <= 3)
+
+        # Batching by goal does not change the results
+        q = TabularQFunction(self.rng.normal(size = (10, 8, 4)), self.rng)
+        one = evaluate_policy(instances, GreedyPolicy(q), max_steps = 40,
+                              goals_per_batch = 1)
+        all_ = evaluate_policy(instances, GreedyPolicy(q), max_steps = 40,
+                               goals_per_batch = 60)
+        for name in ('success', 'steps', 'optimal'):
+            self.assertTrue(np.array_equal(getattr(one, name),
+                                           getattr(all_, name)))
+
+    def test_steps_histogram_and_summary(self):
+        layouts = [ generate_random_maze(8, 6, seed = 1) ]
+        report = evaluate_policy(random_instances(layouts, 50, self.rng),
+                                 ShortestPathPolicy())
+        (counts, _) = report.steps_histogram(bins = 5)
+        self.assertEqual(50, counts.sum())
+        self.assertTrue('Success rate:  1.0000' in report.summary())
+
+if __name__ == '__main__':
+    unit_test_main()
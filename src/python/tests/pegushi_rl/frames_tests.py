@@ -0,0 +1,104 @@
+"""Unit tests for pegushi_rl.frames"""
+from pegushi_rl.frames import *
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+
+class FrameProcessorTests(TestCase):
+    def test_grayscale(self):
+        frame = np.zeros((2, 2, 3), dtype = np.uint8)
+        frame[0, 0] = (255, 255, 255)
+        frame[0, 1] = (255, 0, 0)
+        frame[1, 0] = (0, 255, 0)
+        frame[1, 1] = (0, 0, 255)
+        processor = FrameProcessor(2, 2)
+        self.assertEqual([[255, 76], [150, 29]],
+                         processor.process(frame).tolist())
+
+    def test_downsample(self):
+        frame = np.arange(16, dtype = np.uint8).reshape((4, 4, 1))\
+                  .repeat(3, axis = 2)
+        processor = FrameProcessor(2, 2)
+        self.assertEqual([[0, 2], [8, 10]], processor.process(frame).tolist())
+
+    def test_crop(self):
+        frame = np.arange(16, dtype = np.uint8).reshape((4, 4, 1))\
+                  .repeat(3, axis = 2)
+        processor = FrameProcessor(2, 2, crop = (1, 1, 2, 2))
+        self.assertEqual([[5, 6], [9, 10]], processor.process(frame).tolist())
+
+    def test_crop_too_large(self):
+        frame = np.zeros((4, 4, 3), dtype = np.uint8)
+        processor = FrameProcessor(2, 2, crop = (1, 1, 4, 4))
+        self.assertRaises(ValueError, processor.process, frame)
+
+    def test_batch(self):
+        frames = np.arange(32, dtype = np.uint8).reshape((2, 4, 4, 1))\
+                   .repeat(3, axis = 3)
+        processor = FrameProcessor(2, 2)
+        result = processor.process(frames)
+        self.assertEqual((2, 2, 2), result.shape)
+        self.assertEqual([[16, 18], [24, 26]], result[1].tolist())
+
+    def test_bad_shape(self):
+        processor = FrameProcessor(2, 2)
+        self.assertRaises(ValueError, processor.process,
+                          np.zeros((4, 4), dtype = np.uint8))
+
+class FrameStackTests(TestCase):
+    def setUp(self):
+        self.stack = FrameStack(3, (1, 2))
+
+    def frame(self, v):
+        return np.full((1, 2), v, dtype = np.uint8)
+
+    def stacked_values(self):
+        return self.stack.state[:, 0, 0].tolist()
+
+    def test_reset(self):
+        state = self.stack.reset(self.frame(7))
+        self.assertEqual((3, 1, 2), state.shape)
+        self.assertEqual([7, 7, 7], self.stacked_values())
+
+    def test_push(self):
+        self.stack.reset(self.frame(0))
+        for v in xrange(1, 8):
+            self.stack.push(self.frame(v))
+            self.assertEqual([max(v - 2, 0), max(v - 1, 0), v],
+                             self.stacked_values())
+
+    def test_state_is_a_view(self):
+        self.stack.reset(self.frame(0))
+        state = self.stack.push(self.frame(1))
+        self.assertFalse(state.flags['OWNDATA'])
+        self.assertTrue(np.may_share_memory(state, self.stack._frames))
+
+    def test_state_hwc(self):
+        self.stack.reset(self.frame(0))
+        self.stack.push(self.frame(1))
+        state = self.stack.state_hwc
+        self.assertEqual((1, 2, 3), state.shape)
+        self.assertEqual([0, 0, 1], state[0, 1].tolist())
+
+class PixelObservationsTests(TestCase):
+    def test_reset_and_step(self):
+        maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
+                                    tile_size = 1)
+        env = PixelObservations(maze, FrameProcessor(7, 9), 2)
+        state = env.reset()
+        self.assertEqual((2, 7, 9), state.shape)
+        self.assertTrue(np.array_equal(state[0], state[1]))
+
+        state, reward, done, _ = env.step(1)
+        self.assertEqual((1, 0), env.underlying_state)
+        self.assertEqual(-1.0, reward)
+        self.assertFalse(done)
+
+        # Agent moved two tiles to the right
+        self.assertEqual(29, state[0, 5, 1])
+        self.assertEqual(255, state[1, 5, 1])
+        self.assertEqual(29, state[1, 5, 3])
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,78 @@
+"""Unit tests for pegushi_rl.hogwild"""
+from pegushi_rl.hogwild import *
+from pegushi_rl.q_functions import SharedTabularQFunction
+from pegushi_rl.evaluation import EvaluationInstance, GreedyPolicy, \
+                                  evaluate_policy
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+
+class HogwildTrainerTests(TestCase):
+    def setUp(self):
+        (self.rng, _) = np_random(42)
+        self.maze = FixedMazeEnvironment(width = 5, height = 5, seed = 42,
+                                         start = (0, 0), goal = (4, 4),
+                                         max_steps = 500)
+        self.q = SharedTabularQFunction.from_maze_zeros(self.maze, self.rng)
+
+    def test_workers_update_the_shared_table(self):
+        trainer = HogwildTrainer(self.maze, self.q, 2, alpha = 1.0,
+                                 gamma = 0.99, seed = 1)
+        steps = trainer.run(num_episodes = 50)
+
+        self.assertEqual(100, trainer.episodes)
+        self.assertEqual(steps, trainer.steps)
+        self.assertTrue(steps >= 100 * self.maze.compute_solution_length())
+        self.assertNotEqual(0.0, np.abs(self.q.q_table).max())
+
+        report = evaluate_policy(
+            [ EvaluationInstance.from_environment(self.maze) ],
+            GreedyPolicy(self.q), max_steps = 100)
+        self.assertEqual(1.0, report.success_rate)
+
+    def test_snapshots(self):
+        snapshots = [ ]
+        trainer = HogwildTrainer(self.maze, self.q, 2, alpha = 1.0,
+                                 gamma = 0.99)
+        trainer.run(num_episodes = 20, snapshot_interval = 0.01,
+                    on_snapshot = lambda q, steps:
+                        snapshots.append((q, steps)))
+
+        self.assertTrue(len(snapshots) >= 1)
+        (final, steps) = snapshots[-1]
+        self.assertEqual(trainer.steps, steps)
+        self.assertTrue(np.array_equal(self.q.q_table, final.q_table))
+        self.assertFalse(np.may_share_memory(self.q.q_table, final.q_table))
+
+    def test_run_for_duration(self):
+        trainer = HogwildTrainer(self.maze, self.q, 2)
+        trainer.run(duration = 0.2)
+        self.assertFalse(trainer.running)
+        self.assertTrue(trainer.episodes > 0)
+
+    def test_run_needs_a_limit(self):
+        trainer = HogwildTrainer(self.maze, self.q, 1)
+        self.assertRaises(ValueError, trainer.run)
+
+    def test_measure_scaling(self):
+        results = measure_scaling(self.maze, (1, 2), 0.2)
+        self.assertEqual([1, 2], [ n for (n, _) in results ])
+        for (_, rate) in results:
+            self.assertTrue(rate > 0.0)
+
+class SharedTabularQFunctionTests(TestCase):
+    def test_with_rng_shares_the_table(self):
+        (rng, _) = np_random(42)
+        q = SharedTabularQFunction((2, 2, 4), rng,
+                                   np.arange(16.0).reshape((2, 2, 4)))
+        (other_rng, _) = np_random(7)
+        view = q.with_rng(other_rng)
+        view.update(1, 1, 3, -1.0)
+        self.assertEqual(-1.0, q(1, 1, 3))
+        self.assertEqual(14.0, q(1, 1, 2))
+        self.assertTrue(view.rng is other_rng)
+
+if __name__ == '__main__':
+    unit_test_main()
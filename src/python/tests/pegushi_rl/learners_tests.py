@@ -0,0 +1,154 @@
+"""Unit tests for pegushi_rl.learners"""
+from pegushi_rl.learners import *
+from pegushi_rl.q_functions import TabularQFunction
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+
+class QLearnerTests(TestCase):
+    def setUp(self):
+        (rng, _) = np_random(42)
+        self.maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
+                                         start = (0, 0), goal = (3, 2))
+        self.q = TabularQFunction.from_maze_zeros(self.maze, rng)
+
+    def test_update(self):
+        self.q.update(1, 0, 0, 2.0)
+        learner = QLearner(self.q, alpha = 0.5, gamma = 0.5)
+        learner.update((0, 0), 1, -1.0, (1, 0))
+        self.assertEqual(0.0, self.q(0, 0, 1))
+
+    def test_update_trajectory(self):
+        trajectory = [ ((2, 1), 0, -1.0), ((2, 2), 1, 100.0),
+                       ((3, 2), None, 0.0) ]
+        learner = QLearner(self.q, alpha = 1.0, gamma = 0.5)
+        learner.update_trajectory(trajectory)
+        self.assertEqual(100.0, self.q(2, 2, 1))
+        self.assertEqual(49.0, self.q(2, 1, 0))
+
+    def test_sample_trajectory(self):
+        path = iter((1, 1, 0, 0, 1))
+        t = sample_trajectory(self.maze, lambda x, y: next(path))
+        self.assertEqual(6, len(t))
+        self.assertEqual(((0, 0), 1, -1.0), t[0])
+        self.assertEqual(((3, 2), None, 0.0), t[-1])
+        self.assertEqual(96.0, trajectory_reward(t))
+
+    def test_learn(self):
+        results = learn(self.maze, self.q, 20, alpha = 1.0, gamma = 0.99)
+        self.assertEqual(20, len(results))
+        for (t, reward) in results:
+            self.assertEqual((3, 2), t[-1][0])
+            self.assertEqual(trajectory_reward(t), reward)
+        self.assertEqual(1, self.q.select_hard(2, 2))
+
+class DiscountedCumsumTests(TestCase):
+    def naive(self, values, discount):
+        result = [ ]
+        total = 0.0
+        for v in reversed(values):
+            total = v + discount * total
+            result.append(total)
+        return list(reversed(result))
+
+    def test_short(self):
+        values = [ 1.0, 2.0, 3.0, 4.0 ]
+        self.assertTrue(np.allclose(self.naive(values, 0.5),
+                                    discounted_cumsum(values, 0.5)))
+        self.assertEqual([10.0, 9.0, 7.0, 4.0],
+                         discounted_cumsum(values, 1.0).tolist())
+        self.assertEqual(values, discounted_cumsum(values, 0.0).tolist())
+        self.assertEqual(0, len(discounted_cumsum([ ], 0.9)))
+
+    def test_long_trajectory_does_not_underflow(self):
+        (rng, _) = np_random(42)
+        values = rng.normal(size = 10000)
+        for discount in (0.5, 0.9, 0.99):
+            self.assertTrue(np.allclose(self.naive(values, discount),
+                                        discounted_cumsum(values, discount)))
+
+class TrajectoryTests(TestCase):
+    def test_from_list(self):
+        t = Trajectory.from_list([ ((0, 0), 1, -1.0), ((1, 0), 0, -5.0),
+                                   ((1, 0), None, 0.0) ])
+        self.assertEqual(2, len(t))
+        self.assertEqual([[0, 0], [1, 0], [1, 0]], t.states.tolist())
+        self.assertEqual([1, 0], t.actions.tolist())
+        self.assertEqual(-6.0, t.total_reward)
+
+    def test_mismatched_lengths(self):
+        self.assertRaises(ValueError, Trajectory, np.zeros((2, 2)),
+                          np.zeros(2), np.zeros(2))
+
+class MultiStepBackupTests(TestCase):
+    def setUp(self):
+        (rng, _) = np_random(42)
+        self.maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
+                                         start = (0, 0), goal = (3, 2))
+        self.q = TabularQFunction.from_maze_zeros(self.maze, rng)
+        self.q.q_table[:] = rng.normal(size = self.q.q_table.shape)
+        self.trajectory = Trajectory.sample(self.maze, self.q.select_soft)
+        self.learner = QLearner(self.q, alpha = 1.0, gamma = 0.9)
+
+    def naive_n_step(self, n):
+        t = self.trajectory
+        T = len(t)
+        targets = [ ]
+        for i in xrange(0, T):
+            h = min(i + n, T)
+            g = sum(self.learner.gamma ** (k - i) * t.rewards[k]
+                    for k in xrange(i, h))
+            g += self.learner.gamma ** (h - i) * self.q.max_q(*t.states[h])
+            targets.append(g)
+        return targets
+
+    def test_n_step_targets(self):
+        for n in (1, 3, 1000):
+            self.assertTrue(np.allclose(
+                self.naive_n_step(n),
+                self.learner.n_step_targets(self.trajectory, n)))
+
+    def test_lambda_targets_at_extremes(self):
+        T = len(self.trajectory)
+        self.assertTrue(np.allclose(
+            self.learner.n_step_targets(self.trajectory, 1),
+            self.learner.lambda_targets(self.trajectory, 0.0)))
+        self.assertTrue(np.allclose(
+            self.learner.n_step_targets(self.trajectory, T),
+            self.learner.lambda_targets(self.trajectory, 1.0)))
+
+    def test_lambda_targets_recursion(self):
+        t = self.trajectory
+        (gamma, lambda_) = (self.learner.gamma, 0.7)
+        targets = self.learner.lambda_targets(t, lambda_)
+        for i in xrange(0, len(t) - 1):
+            v = self.q.max_q(*t.states[i + 1])
+            g = t.rewards[i] + gamma * ((1.0 - lambda_) * v + \
+                                        lambda_ * targets[i + 1])
+            self.assertAlmostEqual(g, targets[i])
+
+    def test_update_trajectory_n_step(self):
+        t = self.trajectory
+        targets = self.learner.n_step_targets(t, 2)
+        self.learner.update_trajectory_n_step(t, 2)
+
+        # Earliest visit to each (state, action) pair wins
+        seen = set()
+        for i in xrange(0, len(t)):
+            key = (t.states[i, 0], t.states[i, 1], t.actions[i])
+            if key not in seen:
+                self.assertAlmostEqual(targets[i], self.q(*key))
+                seen.add(key)
+
+    def test_update_with_list_trajectory(self):
+        trajectory = [ ((2, 1), 0, -1.0), ((2, 2), 1, 100.0),
+                       ((3, 2), None, 0.0) ]
+        self.q.q_table[:] = 0.0
+        self.learner.update_trajectory_lambda(trajectory, 1.0)
+        self.assertAlmostEqual(100.0, self.q(2, 2, 1))
+        self.assertAlmostEqual(89.0, self.q(2, 1, 0))
+
+if __name__ == '__main__':
+    unit_test_main()
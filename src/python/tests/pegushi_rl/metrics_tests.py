@@ -0,0 +1,98 @@
+"""Unit tests for pegushi_rl.metrics"""
+from pegushi_rl.metrics import *
+from pegushi_rl.learners import Trajectory
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+import os
+import shutil
+import tempfile
+
+class MetricsLogTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'metrics.dat')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_batched_flushes(self):
+        log = MetricsLog(self.path, buffer_size = 4, flush_interval = None)
+        for i in xrange(0, 10):
+            self.assertEqual(i, log.record(-i, i + 1, i % 3, 0.5))
+
+        # Only full buffers have been written
+        records = read_metrics(self.path)
+        self.assertEqual(8, len(records))
+        self.assertEqual(2, log.num_flushes)
+        self.assertEqual(range(0, 8), records['episode'].tolist())
+        self.assertEqual([ -float(i) for i in xrange(0, 8) ],
+                         records['reward'].tolist())
+        self.assertEqual([ i % 3 for i in xrange(0, 8) ],
+                         records['wall_hits'].tolist())
+        log.close()
+        self.assertEqual(10, len(read_metrics(self.path)))
+
+        # A new log continues the numbering
+        log = MetricsLog(self.path)
+        self.assertEqual(10, log.record(0.0, 1))
+        log.close()
+
+    def test_flush_interval(self):
+        log = MetricsLog(self.path, buffer_size = 100, flush_interval = 0.0)
+        log.record(1.0, 2)
+        self.assertEqual(1, len(read_metrics(self.path)))
+        log.close()
+
+    def test_partial_record_is_ignored(self):
+        log = MetricsLog(self.path, buffer_size = 1)
+        log.record(1.0, 2)
+        log._file.write('\0' * 7)
+        log.close()
+        self.assertEqual(1, len(read_metrics(self.path)))
+        self.assertEqual(0, len(read_metrics(self.path + '.missing')))
+
+    def test_append_after_partial_record(self):
+        log = MetricsLog(self.path, buffer_size = 1)
+        log.record(1.0, 2, 3, 0.5)
+        log._file.write('\0' * 7)
+        log._file.close()
+
+        log = MetricsLog(self.path, buffer_size = 1)
+        self.assertEqual(1, log.record(4.0, 5, 6, 1.5))
+        log.close()
+        records = read_metrics(self.path)
+        self.assertEqual(2 * METRICS_RECORD.itemsize,
+                         os.path.getsize(self.path))
+        self.assertEqual([ 0, 1 ], records['episode'].tolist())
+        self.assertEqual([ 1.0, 4.0 ], records['reward'].tolist())
+        self.assertEqual([ 2, 5 ], records['length'].tolist())
+        self.assertEqual([ 3, 6 ], records['wall_hits'].tolist())
+
+    def test_record_trajectory(self):
+        log = MetricsLog(self.path, buffer_size = 1)
+        trajectory = [ ((0, 0), 3, -5.0), ((0, 0), 0, -1.0),
+                       ((0, 1), 1, 100.0), ((1, 1), None, 0.0) ]
+        log.record_trajectory(trajectory, 2.0)
+        log.record_trajectory(Trajectory.from_list(trajectory))
+        log.close()
+        records = read_metrics(self.path)
+        self.assertEqual([ 94.0, 94.0 ], records['reward'].tolist())
+        self.assertEqual([ 3, 3 ], records['length'].tolist())
+        self.assertEqual([ 1, 1 ], records['wall_hits'].tolist())
+        self.assertEqual([ 2.0, 0.0 ], records['duration'].tolist())
+
+    def test_downsample(self):
+        log = MetricsLog(self.path)
+        for i in xrange(0, 10):
+            log.record(float(i), i)
+        log.close()
+        records = read_metrics(self.path)
+        points = downsample_metrics(records, 3)
+        self.assertEqual([ 2, 5, 9 ], points['episode'].tolist())
+        self.assertTrue(np.allclose([ 1.0, 4.0, 7.5 ], points['reward']))
+        self.assertTrue(np.allclose([ 1.0, 4.0, 7.5 ], points['length']))
+        self.assertEqual(10, len(downsample_metrics(records, 20)))
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,104 @@
+"""Unit tests for pegushi_rl.planning"""
+from pegushi_rl.planning import *
+from pegushi_rl.q_functions import TabularQFunction
+from pegushi_gym.envs.maze import FixedMazeEnvironment, compute_distance_field
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+
+class MazeModelTests(TestCase):
+    def setUp(self):
+        self.maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42,
+                                         start = (0, 0), goal = (3, 2))
+        self.model = MazeModel.from_environment(self.maze)
+
+    def test_matches_environment(self):
+        for x in xrange(0, 4):
+            for y in xrange(0, 3):
+                for a in xrange(0, 4):
+                    self.maze.reset()
+                    self.maze.teleport(x, y)
+                    (state, reward, done, _) = self.maze.step(a)
+                    self.assertEqual(state, (self.model.next_x[x, y, a],
+                                             self.model.next_y[x, y, a]))
+                    self.assertEqual(reward, self.model.rewards[x, y, a])
+                    self.assertEqual(done, self.model.terminal[x, y, a])
+
+    def test_predecessors(self):
+        for x in xrange(0, 4):
+            for y in xrange(0, 3):
+                truth = sorted((px, py, a) for px in xrange(0, 4)
+                                   for py in xrange(0, 3)
+                                   for a in xrange(0, 4)
+                                   if ((px, py) != (3, 2)) and \
+                                      (self.model.next_x[px, py, a] == x) and \
+                                      (self.model.next_y[px, py, a] == y))
+                (xs, ys, actions) = self.model.predecessors(x, y)
+                self.assertEqual(truth, sorted(zip(xs.tolist(), ys.tolist(),
+                                                   actions.tolist())))
+
+class PrioritizedSweepingLearnerTests(TestCase):
+    def setUp(self):
+        (rng, _) = np_random(7)
+        self.maze = FixedMazeEnvironment(width = 24, height = 24, seed = 7,
+                                         start = (0, 0), goal = (23, 23))
+        self.model = MazeModel.from_environment(self.maze)
+        self.q = TabularQFunction.from_maze_zeros(self.maze, rng)
+
+    def assert_greedy_is_optimal(self):
+        field = compute_distance_field(self.maze._layout, self.maze.goal)
+        actions = self.q.q_table.argmax(axis = -1)
+        (xs, ys) = np.meshgrid(np.arange(0, 24), np.arange(0, 24),
+                               indexing = 'ij')
+        nx = self.model.next_x[xs, ys, actions]
+        ny = self.model.next_y[xs, ys, actions]
+        not_goal = (xs != 23) | (ys != 23)
+        self.assertTrue((field[ny, nx] == field[ys, xs] - 1)[not_goal].all())
+
+    def test_sweep_solves_maze(self):
+        learner = PrioritizedSweepingLearner(self.q, self.model, gamma = 0.9)
+        learner.queue_all()
+        self.assertTrue(learner.sweep() > 0)
+        self.assertEqual(0, learner.sweep())
+        self.assert_greedy_is_optimal()
+
+    def test_learns_from_few_episodes(self):
+        learner = PrioritizedSweepingLearner(self.q, self.model, gamma = 0.9,
+                                             planning_steps = 1000)
+        results = learn_with_planning(self.maze, learner, 5)
+        self.assertEqual(5, len(results))
+
+        # Cells far from anywhere the agent went keep their initial
+        # values, but the greedy path from the start is already optimal
+        state = self.maze.reset()
+        done = False
+        while not done:
+            (state, _, done, _) = self.maze.step(self.q.select_hard(*state))
+        self.assertEqual(self.maze.goal, state)
+        self.assertEqual(self.maze.compute_solution_length(), self.maze.tick)
+
+class DynaQLearnerTests(TestCase):
+    def test_learns_small_maze(self):
+        (rng, _) = np_random(42)
+        maze = FixedMazeEnvironment(width = 5, height = 5, seed = 42,
+                                    start = (0, 0), goal = (4, 4))
+        q = TabularQFunction.from_maze_zeros(maze, rng)
+        learner = DynaQLearner(q, MazeModel.from_environment(maze),
+                               alpha = 0.5, gamma = 0.9, planning_steps = 50)
+        results = learn_with_planning(maze, learner, 30)
+        trajectory = results[0][0]
+        self.assertEqual(len(trajectory) - 1,
+                         sum(1 for (_, a, _) in trajectory if a is not None))
+        self.assertTrue(learner.num_experienced > 0)
+
+        state = maze.reset()
+        for i in xrange(0, 100):
+            (state, _, done, _) = maze.step(q.select_hard(*state))
+            if done:
+                break
+        self.assertEqual(maze.goal, state)
+        self.assertEqual(maze.compute_solution_length(), i + 1)
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,131 @@
+"""Unit tests for pegushi_rl.playback"""
+from pegushi_rl.playback import *
+from pegushi_rl.learners import sample_trajectory
+from pegushi_gym.envs.maze import FixedMazeEnvironment, generate_random_maze
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+
+class PlaybackTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'episodes.dat')
+        layout = generate_random_maze(6, 5, 'kruskal', seed = 5)
+        self.maze = FixedMazeEnvironment(layout = layout, start = (0, 0),
+                                         goal = (5, 4), seed = 5,
+                                         tile_size = 4, max_steps = 20)
+        (rng, _) = np_random(5)
+        self.trajectories = [
+            sample_trajectory(self.maze, lambda x, y: rng.randint(0, 4))
+            for i in xrange(0, 3) ]
+        writer = EpisodeFileWriter(self.path)
+        for t in self.trajectories:
+            writer.append(t)
+        writer.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_episode_file(self):
+        episodes = EpisodeFile(self.path)
+        self.assertEqual(3, episodes.num_episodes)
+        for (i, t) in enumerate(self.trajectories):
+            self.assertEqual(len(t) - 1, episodes.episode_length(i))
+            trajectory = episodes.trajectory(i)
+            self.assertEqual([ s for (s, _, _) in t ],
+                             [ tuple(s) for s in trajectory.states ])
+            self.assertEqual([ a for (_, a, _) in t[0:-1] ],
+                             trajectory.actions.tolist())
+            self.assertEqual([ r for (_, _, r) in t[0:-1] ],
+                             trajectory.rewards.tolist())
+
+    def test_episodes_written_after_opening(self):
+        episodes = EpisodeFile(self.path)
+        writer = EpisodeFileWriter(self.path)
+        writer.append(self.trajectories[0])
+
+        # A partly written record is ignored
+        writer._steps.write('\0' * 5)
+        writer._steps.flush()
+        self.assertEqual(3, episodes.num_episodes)
+        episodes.refresh()
+        self.assertEqual(4, episodes.num_episodes)
+        self.assertEqual(len(self.trajectories[0]) - 1,
+                         episodes.episode_length(3))
+        writer.close()
+
+    def test_append_after_interrupted_episode(self):
+        # An episode whose steps were written but not indexed, followed by
+        # part of an index record
+        writer = EpisodeFileWriter(self.path)
+        np.zeros(3, dtype = STEP_RECORD).tofile(writer._steps)
+        writer._steps.write('\0' * 5)
+        writer._index.write('\0' * 6)
+        writer.close()
+
+        writer = EpisodeFileWriter(self.path)
+        writer.append(self.trajectories[1])
+        writer.close()
+        episodes = EpisodeFile(self.path)
+        self.assertEqual(4, episodes.num_episodes)
+        self.assertEqual(4 * EPISODE_INDEX_RECORD.itemsize,
+                         os.path.getsize(self.path + '.index'))
+        self.assertEqual(sum(len(t) for t in self.trajectories) +
+                             len(self.trajectories[1]),
+                         len(episodes._records))
+        self.assertEqual([ s for (s, _, _) in self.trajectories[1] ],
+                         [ tuple(s) for s in episodes.trajectory(3).states ])
+
+    def test_empty_file(self):
+        path = os.path.join(self.directory, 'empty.dat')
+        EpisodeFileWriter(path).close()
+        self.assertEqual(0, EpisodeFile(path).num_episodes)
+
+    def test_player(self):
+        episodes = EpisodeFile(self.path)
+        state = self.maze.current_state
+        player = TrajectoryPlayer.for_environment(episodes, self.maze,
+                                                  steps_per_second = 1000,
+                                                  mode = 'rgb_array')
+        frame = player.seek(1, 2)
+        self.maze.teleport(*self.trajectories[1][2][0])
+        self.assertTrue(np.array_equal(self.maze.render('rgb_array'), frame))
+        self.maze.teleport(*state)
+
+        # Play to the end of episode 1, then into episode 2
+        self.assertEqual(len(self.trajectories[1]) - 3,
+                         player.play(to_end_of_episode = True))
+        self.assertEqual((1, len(self.trajectories[1]) - 1),
+                         (player.episode, player.step))
+        self.assertEqual(2, player.play(2))
+        self.assertEqual((2, 1), (player.episode, player.step))
+        self.assertEqual(self.trajectories[2][1][0], player.state)
+
+        player.skip_to_episode(0)
+        player.fast_forward(len(self.trajectories[0]) + 1)
+        self.assertEqual((1, 1), (player.episode, player.step))
+        player.fast_forward(1000)
+        self.assertTrue(player.at_end)
+        self.assertFalse(player.advance())
+        self.assertEqual(0, player.play())
+        self.assertRaises(ValueError, player.seek, 3)
+        player.close()
+
+        # The training environment is untouched
+        self.assertEqual(state, self.maze.current_state)
+
+    def test_play_speed(self):
+        player = TrajectoryPlayer(EpisodeFile(self.path), self.maze._layout,
+                                  self.maze.goal, steps_per_second = 100,
+                                  mode = 'rgb_array')
+        start = time.time()
+        self.assertEqual(10, player.play(10))
+        self.assertTrue(time.time() - start >= 0.09)
+
+if __name__ == '__main__':
+    unit_test_main()
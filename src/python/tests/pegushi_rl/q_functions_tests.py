@@ -0,0 +1,218 @@
+"""Unit tests for pegushi_rl.q_functions"""
+from pegushi_rl.q_functions import *
+from pegushi_gym.envs.maze import FixedMazeEnvironment
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+import os
+import resource
+import shutil
+import tempfile
+
+class TabularQFunctionTests(TestCase):
+    def setUp(self):
+        (self.rng, _) = np_random(42)
+        q_table = np.zeros((2, 3, 4))
+        q_table[1, 2, :] = [ 1.0, 3.0, 2.0, 3.0 ]
+        self.q = TabularQFunction(q_table, self.rng)
+
+    def test_from_maze_zeros(self):
+        maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42)
+        q = TabularQFunction.from_maze_zeros(maze, self.rng)
+        self.assertEqual((4, 3, 4), q.q_table.shape)
+        self.assertEqual(0.0, q.q_table.max())
+        self.assertEqual(4, q.num_actions)
+
+    def test_max_q_and_select_hard(self):
+        self.assertEqual(3.0, self.q.max_q(1, 2))
+        self.assertEqual(1, self.q.select_hard(1, 2))
+        self.assertEqual(2.0, self.q(1, 2, 2))
+
+    def test_soft_q_distribution(self):
+        p = self.q.soft_q_distribution(0, 0)
+        self.assertTrue(np.allclose([0.25, 0.25, 0.25, 0.25], p))
+
+    def test_select_soft(self):
+        self.q.q_table[0, 0, :] = [ 0.0, 100.0, 0.0, 0.0 ]
+        for _ in xrange(0, 10):
+            self.assertEqual(1, self.q.select_soft(0, 0))
+
+    def test_action_masks(self):
+        mask = np.asarray([ True, False, True, False ])
+        self.assertEqual(2, self.q.select_hard(1, 2, mask))
+        self.assertTrue(np.allclose([0.5, 0.0, 0.5, 0.0],
+                                    self.q.soft_q_distribution(0, 0, mask)))
+        for _ in xrange(0, 10):
+            self.assertTrue(self.q.select_soft(0, 0, mask) in (0, 2))
+        masks = np.asarray([ [ True, False, True, False ],
+                             [ False, False, False, True ] ])
+        self.assertEqual([2, 3], self.q.select_hard_batch([ 1, 1 ], [ 2, 2 ],
+                                                          masks).tolist())
+
+    def test_update(self):
+        self.q.update(1, 2, 0, 5.0, 0.5)
+        self.assertEqual(3.0, self.q(1, 2, 0))
+
+    def test_batch_methods(self):
+        xs = np.asarray([ 1, 0 ])
+        ys = np.asarray([ 2, 0 ])
+        self.assertEqual([3.0, 0.0], self.q.max_q_batch(xs, ys).tolist())
+        self.assertEqual([1, 0], self.q.select_hard_batch(xs, ys).tolist())
+
+        self.q.update_batch(xs, ys, np.asarray([ 0, 3 ]),
+                            np.asarray([ 5.0, -2.0 ]), 0.5)
+        self.assertEqual(3.0, self.q(1, 2, 0))
+        self.assertEqual(-1.0, self.q(0, 0, 3))
+
+    def test_with_rng(self):
+        (rng, _) = np_random(7)
+        view = self.q.with_rng(rng)
+        view.update(0, 1, 2, 4.0)
+        self.assertEqual(4.0, self.q(0, 1, 2))
+        self.assertTrue(view.rng is rng)
+
+    def test_copy(self):
+        c = self.q.copy()
+        c.update(1, 2, 0, 5.0)
+        self.assertEqual(1.0, self.q(1, 2, 0))
+        self.assertEqual(5.0, c(1, 2, 0))
+
+class ChunkedTabularQFunctionTests(TestCase):
+    def setUp(self):
+        (self.rng, _) = np_random(42)
+        self.q = ChunkedTabularQFunction((10, 7, 4), self.rng,
+                                         chunk_shape = (4, 3))
+
+    def test_reads_do_not_allocate(self):
+        self.assertEqual(0.0, self.q(9, 6, 3))
+        self.assertEqual(0.0, self.q.max_q(5, 5))
+        self.assertEqual(0, self.q.select_hard(5, 5))
+        self.assertEqual([0.0, 0.0],
+                         self.q.max_q_batch([0, 9], [0, 6]).tolist())
+        self.assertEqual(0, self.q.num_chunks)
+        self.assertEqual(0, self.q.allocated_bytes)
+
+    def test_update_allocates_one_chunk(self):
+        self.q.update(9, 6, 2, 4.0, 0.5)
+        self.assertEqual(2.0, self.q(9, 6, 2))
+        self.assertEqual(np.float32, self.q(9, 6, 2).dtype)
+        self.assertEqual(2, self.q.select_hard(9, 6))
+        self.assertEqual(1, self.q.num_chunks)
+        self.assertEqual(4 * 3 * 4 * 4, self.q.allocated_bytes)
+
+    def test_batch_methods_match_dense_table(self):
+        dense = TabularQFunction(np.zeros((10, 7, 4), dtype = np.float32),
+                                 self.rng)
+        xs = self.rng.randint(0, 10, size = 200)
+        ys = self.rng.randint(0, 7, size = 200)
+        actions = self.rng.randint(0, 4, size = 200)
+        targets = self.rng.normal(size = 200)
+        for q in (dense, self.q):
+            q.update_batch(xs[:100], ys[:100], actions[:100],
+                           targets[:100], 1.0)
+            q.update_batch(xs[100:], ys[100:], actions[100:],
+                           targets[100:], 0.5)
+
+        self.assertTrue(np.allclose(dense.q_table, self.q.to_dense()))
+        self.assertTrue(np.allclose(dense.max_q_batch(xs, ys),
+                                    self.q.max_q_batch(xs, ys)))
+        self.assertTrue(np.array_equal(dense.select_hard_batch(xs, ys),
+                                       self.q.select_hard_batch(xs, ys)))
+        self.assertTrue(np.allclose(dense(xs, ys, actions),
+                                    self.q(xs, ys, actions)))
+        self.assertTrue(np.allclose(dense.soft_q_distribution(3, 4),
+                                    self.q.soft_q_distribution(3, 4)))
+
+    def test_dirty_chunks(self):
+        self.q(9, 6, 3)
+        self.assertEqual([ ], self.q.dirty_chunks)
+        self.q.update(9, 6, 2, 4.0)
+        self.q.update_batch([ 0, 5 ], [ 0, 0 ], [ 1, 1 ], [ 1.0, 1.0 ])
+        keys = self.q.chunk_keys
+        self.assertEqual(3, len(keys))
+        self.assertEqual(keys, self.q.dirty_chunks)
+        self.q.mark_clean(keys[0:1])
+        self.assertEqual(keys[1:], self.q.dirty_chunks)
+        self.q.mark_clean()
+        self.assertEqual([ ], self.q.dirty_chunks)
+
+        # Replacing a chunk does not make it dirty
+        chunk = np.ones((4, 3, 4), dtype = np.float32)
+        self.q.set_chunk(keys[0], chunk)
+        self.assertTrue(self.q.get_chunk(keys[0]) is chunk)
+        self.assertEqual([ ], self.q.dirty_chunks)
+        self.assertRaises(ValueError, self.q.set_chunk, 0,
+                          np.ones((3, 3, 4)))
+
+    def test_copy_and_with_rng(self):
+        self.q.update(1, 1, 1, 1.0)
+        c = self.q.copy()
+        c.update(1, 1, 1, 2.0)
+        (rng, _) = np_random(7)
+        view = self.q.with_rng(rng)
+        view.update(1, 1, 0, 3.0)
+        self.assertEqual(1.0, self.q(1, 1, 1))
+        self.assertEqual(3.0, self.q(1, 1, 0))
+        self.assertEqual(2.0, c(1, 1, 1))
+        self.assertTrue(view.rng is rng)
+
+    def test_from_maze_zeros(self):
+        maze = FixedMazeEnvironment(width = 4, height = 3, seed = 42)
+        q = ChunkedTabularQFunction.from_maze_zeros(maze, self.rng,
+                                                    chunk_shape = (2, 2))
+        self.assertEqual((4, 3, 4), q.shape)
+        self.assertEqual(0, q.num_chunks)
+
+    def test_spill_to_disk(self):
+        directory = tempfile.mkdtemp()
+        try:
+            q = ChunkedTabularQFunction((10, 7, 4), self.rng,
+                                        chunk_shape = (4, 3),
+                                        spill_directory = directory,
+                                        max_resident_chunks = 2)
+            q.update(0, 0, 0, 1.0)
+            q.update(4, 0, 0, 2.0)
+            q(0, 0, 0)      # Chunk (1, 0) is now least recently used
+            q.update(8, 0, 0, 3.0)
+
+            self.assertEqual(3, q.num_chunks)
+            self.assertEqual(2, q.num_resident_chunks)
+            self.assertEqual([ 'chunks.dat' ], os.listdir(directory))
+            self.assertEqual([1.0, 2.0, 3.0],
+                             q([0, 4, 8], [0, 0, 0], [0, 0, 0]).tolist())
+
+            q.update(4, 0, 0, 4.0)
+            self.assertEqual(4.0, q(4, 0, 0))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_spilled_chunks_share_one_file(self):
+        # Spill more chunks than the process may have open files
+        (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = min(64, soft)
+        directory = tempfile.mkdtemp()
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        try:
+            q = ChunkedTabularQFunction((4 * limit, 8, 4), self.rng,
+                                        chunk_shape = (2, 2),
+                                        spill_directory = directory,
+                                        max_resident_chunks = 1)
+            xs = np.arange(0, 4 * limit)
+            ys = xs % 8
+            q.update_batch(xs, ys, xs % 4, xs)
+            self.assertTrue(q.num_chunks - 1 > limit)
+            self.assertEqual(xs.tolist(), q(xs, ys, xs % 4).tolist())
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+            shutil.rmtree(directory)
+
+    def test_empty_batch(self):
+        q = ChunkedTabularQFunction((10, 7, 4), self.rng,
+                                    chunk_shape = (4, 3))
+        q.update_batch([ ], [ ], [ ], [ ])
+        self.assertEqual((0, ), q.max_q_batch([ ], [ ]).shape)
+        self.assertEqual(0, q.num_chunks)
+
+if __name__ == '__main__':
+    unit_test_main()
@@ -0,0 +1,123 @@
+"""Unit tests for pegushi_rl.replay"""
+from pegushi_rl.replay import *
+from gym.utils.seeding import np_random
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+
+class ReplayMemoryTests(TestCase):
+    def setUp(self):
+        (rng, _) = np_random(42)
+        self.memory = ReplayMemory(size = 4, batch_size = 8, rng = rng)
+
+    def test_add_experience(self):
+        self.memory.add_experience((0, 0), 1, -1.0, (1, 0), False)
+        self.memory.add_experience((1, 0), 0, 100.0, (1, 1), True)
+
+        self.assertEqual(2, len(self.memory))
+        self.assertEqual([[0, 0], [1, 0]], self.memory.states[:2].tolist())
+        self.assertEqual([1, 0], self.memory.actions[:2].tolist())
+        self.assertEqual([-1.0, 100.0], self.memory.rewards[:2].tolist())
+        self.assertEqual([[1, 0], [1, 1]],
+                         self.memory.next_states[:2].tolist())
+        self.assertEqual([False, True],
+                         self.memory.terminal_flags[:2].tolist())
+
+    def test_oldest_transitions_are_overwritten(self):
+        for i in xrange(0, 6):
+            self.memory.add_experience((i, 0), 0, float(i), (i, 1), False)
+        self.assertEqual(4, len(self.memory))
+        self.assertEqual([4.0, 5.0, 2.0, 3.0], self.memory.rewards.tolist())
+
+    def test_add_trajectory(self):
+        trajectory = [ ((0, 0), 1, -1.0), ((1, 0), 0, -1.0),
+                       ((1, 1), None, 0.0) ]
+        self.memory.add_trajectory(trajectory)
+        self.assertEqual(2, len(self.memory))
+        self.assertEqual([[1, 0], [1, 1]],
+                         self.memory.next_states[:2].tolist())
+        self.assertEqual([False, True],
+                         self.memory.terminal_flags[:2].tolist())
+
+    def test_get_minibatch(self):
+        for i in xrange(0, 3):
+            self.memory.add_experience((i, 0), i, float(i), (i, 1), i == 2)
+        states, actions, rewards, next_states, terminal_flags = \
+            self.memory.get_minibatch()
+
+        self.assertEqual((8, 2), states.shape)
+        self.assertTrue(np.all(self.memory.indices < 3))
+        self.assertEqual(self.memory.indices.tolist(), actions.tolist())
+        self.assertEqual(self.memory.indices.tolist(), states[:, 0].tolist())
+        self.assertEqual((self.memory.indices == 2).tolist(),
+                         terminal_flags.tolist())
+
+    def test_get_minibatch_from_empty_memory(self):
+        self.assertRaises(ValueError, self.memory.get_minibatch)
+
+class SumTreeTests(TestCase):
+    def test_update_and_total(self):
+        tree = SumTree(5)
+        tree.update(np.arange(5), [ 1.0, 2.0, 3.0, 4.0, 5.0 ])
+        self.assertEqual(15.0, tree.total)
+        tree.update(2, 0.5)
+        self.assertEqual(12.5, tree.total)
+        self.assertEqual([2.0, 0.5], tree[[1, 2]].tolist())
+
+    def test_find(self):
+        tree = SumTree(5)
+        tree.update(np.arange(5), [ 1.0, 2.0, 3.0, 4.0, 5.0 ])
+        values = [ 0.0, 0.99, 1.0, 2.99, 3.0, 5.99, 6.0, 9.99, 10.0, 14.99 ]
+        self.assertEqual([0, 0, 1, 1, 2, 2, 3, 3, 4, 4],
+                         tree.find(values).tolist())
+
+    def test_find_skips_zero_priorities(self):
+        tree = SumTree(4)
+        tree.update([0, 3], [ 1.0, 1.0 ])
+        self.assertEqual([0, 3, 3], tree.find([0.5, 1.0, 1.9999]).tolist())
+
+    def test_single_leaf(self):
+        tree = SumTree(1)
+        tree.update(0, 2.0)
+        self.assertEqual(2.0, tree.total)
+        self.assertEqual([0], tree.find([1.0]).tolist())
+
+class PrioritizedReplayMemoryTests(TestCase):
+    def setUp(self):
+        (rng, _) = np_random(42)
+        self.memory = PrioritizedReplayMemory(size = 8, batch_size = 4,
+                                              rng = rng, alpha = 1.0,
+                                              beta = 1.0, epsilon = 0.0)
+        for i in xrange(0, 4):
+            self.memory.add_experience((i, 0), i, float(i), (i, 1), False)
+
+    def test_new_transitions_get_max_priority(self):
+        self.memory.update_priorities(np.arange(4), [ 1.0, 1.0, 1.0, 3.0 ])
+        self.assertEqual(3.0, self.memory.max_priority)
+        index = self.memory.add_experience((4, 0), 0, 0.0, (4, 1), False)
+        self.assertEqual(3.0, self.memory._priorities[index])
+
+    def test_sampling_is_proportional_to_priority(self):
+        self.memory.update_priorities(np.arange(4), [ 0.0, 0.0, 0.0, 1.0 ])
+        for _ in xrange(0, 10):
+            self.memory.get_minibatch()
+            self.assertEqual([3, 3, 3, 3], self.memory.indices.tolist())
+
+    def test_importance_sampling_weights(self):
+        self.memory.update_priorities(np.arange(4), [ 1.0, 1.0, 1.0, 3.0 ])
+        batch = self.memory.get_minibatch()
+        self.assertEqual(5, len(batch))
+
+        # P(i) = 1/6 for i < 3 and 1/2 for i = 3, so w(i) = (4 * P(i))^-1,
+        # normalized so the largest weight is 1
+        truth = np.where(self.memory.indices == 3, 1.0 / 3.0, 1.0)
+        if not np.any(self.memory.indices == 3):
+            truth = np.ones(4)
+        self.assertTrue(np.allclose(truth, self.memory.weights))
+
+    def test_uniform_priorities_give_unit_weights(self):
+        self.memory.get_minibatch()
+        self.assertTrue(np.allclose(np.ones(4), self.memory.weights))
+
+if __name__ == '__main__':
+    unit_test_main()
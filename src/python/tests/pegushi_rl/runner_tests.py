@@ -0,0 +1,111 @@
+"""Unit tests for pegushi_rl.runner"""
+from pegushi_rl.runner import *
+from pegushi_gym.envs.maze import generate_random_maze
+from unittest import TestCase
+from unittest import main as unit_test_main
+import numpy as np
+import os.path
+import shutil
+import tempfile
+
+MAZE = { 'width' : 4, 'height' : 3, 'seed' : 42, 'start' : (0, 0),
+         'goal' : (3, 2), 'max_steps' : 200 }
+
+class DeriveSeedTests(TestCase):
+    def test_derive_seed_is_deterministic(self):
+        self.assertEqual(derive_seed(7, 'trial', 1, 2),
+                         derive_seed(7, 'trial', 1, 2))
+
+    def test_different_keys_give_different_seeds(self):
+        seeds = set(derive_seed(7, 'trial', 0, r) for r in xrange(0, 100))
+        self.assertEqual(100, len(seeds))
+        self.assertNotEqual(derive_seed(7, 1), derive_seed(8, 1))
+
+class MakeTrialsTests(TestCase):
+    def test_make_trials(self):
+        layout = generate_random_maze(4, 3, 'kruskal', seed = 1)
+        configs = [ MAZE, { 'width' : 5, 'height' : 5 },
+                    { 'layout' : layout } ]
+        trials = make_trials(configs, 2, (0.5, 1.0), (0.9, ), 10,
+                             base_seed = 3)
+        self.assertEqual(12, len(trials))
+        self.assertEqual(range(0, 12), [ t.index for t in trials ])
+
+        # Trials that differ only in alpha share seeds
+        self.assertEqual(trials[0].seed, trials[1].seed)
+        self.assertNotEqual(trials[0].seed, trials[2].seed)
+        self.assertEqual([0.5, 1.0, 0.5, 1.0],
+                         [ t.alpha for t in trials[0:4] ])
+
+        # Maze seeds are only added when missing
+        self.assertEqual(42, trials[0].maze['seed'])
+        self.assertEqual(derive_seed(3, 'maze', 1), trials[4].maze['seed'])
+        self.assertEqual(derive_seed(3, 'maze', 2), trials[8].maze['seed'])
+        self.assertFalse('seed' in configs[1])
+
+class RunTrialsTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'sweep')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_run_trials(self):
+        trials = make_trials([ MAZE ], 2, (1.0, ), (0.5, 0.99), 15)
+        store = run_trials(trials, self.path, num_processes = 2)
+
+        self.assertEqual(4, len(store.trials()))
+        curves = store.learning_curves()
+        for t in trials:
+            self.assertTrue(store.is_done(t.index))
+            records = curves[t.index]
+            self.assertEqual(range(0, 15), records['episode'].tolist())
+            self.assertTrue(np.all(records['length'] >= 5))
+            self.assertTrue(np.all(records['reward'] <= 96.0))
+
+    def test_results_are_reproducible(self):
+        trials = make_trials([ MAZE ], 1, (1.0, ), (0.5, ), 10)
+        first = run_trials(trials, self.path, 1).read(0)
+        shutil.rmtree(self.path)
+        second = run_trials(trials, self.path, 2).read(0)
+        self.assertTrue(np.array_equal(first, second))
+
+    def test_layout_only_trials_are_reproducible(self):
+        # The start and goal are placed randomly
+        layout = generate_random_maze(6, 5, 'kruskal', seed = 1)
+        trials = make_trials([ { 'layout' : layout, 'max_steps' : 50 } ],
+                             1, (1.0, ), (0.5, ), 10)
+        first = run_trials(trials, self.path, 1).read(0)
+        shutil.rmtree(self.path)
+        second = run_trials(trials, self.path, 1).read(0)
+        self.assertTrue(np.array_equal(first, second))
+
+    def test_finished_trials_are_skipped(self):
+        trials = make_trials([ MAZE ], 1, (1.0, ), (0.5, ), 10)
+        store = run_trials(trials, self.path, 1)
+        with open(os.path.join(self.path, 'trial-000000.dat'), 'ab') as f:
+            f.write('x')
+        run_trials(trials, self.path, 1)
+        self.assertEqual(10, len(store.read(0)))
+
+    def test_read_partial_record(self):
+        store = TrialResultsStore(self.path)
+        store.initialize([ ])
+        writer = store.writer(0)
+        writer.append(0, -3.0, 3)
+        writer.append(1, 95.0, 5)
+        writer.close()
+        with open(os.path.join(self.path, 'trial-000000.dat'), 'ab') as f:
+            f.write('abc')
+        records = store.read(0)
+        self.assertEqual([0, 1], records['episode'].tolist())
+        self.assertEqual([-3.0, 95.0], records['reward'].tolist())
+        self.assertFalse(store.is_done(0))
+
+    def test_read_missing_trial(self):
+        store = TrialResultsStore(self.path)
+        self.assertEqual(0, len(store.read(5)))
+
+if __name__ == '__main__':
+    unit_test_main()